@@ -1,7 +1,12 @@
 import streamlit as st
+import config
+from core.model_registry import warm_up_models
 from ui.sidebar import render_sidebar
 from ui.chat_interface import render_chat_interface
 
+if config.WARM_UP_MODELS:
+    warm_up_models(background=True)
+
 st.title("RAG System")
 
 selected_collection = render_sidebar()
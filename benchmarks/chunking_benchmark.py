@@ -0,0 +1,150 @@
+"""
+Compares the chunkers of core/chunking.py on a set of PDFs: chunking throughput and
+retrieval quality of the resulting chunks.
+
+Retrieval quality is measured with sentences sampled from the documents as queries:
+a query is answered when a top-k chunk contains the whole sentence. The BM25 index is
+used by default, so the benchmark runs offline; --dense adds the Ollama embedding model.
+
+Example:
+    python -m benchmarks.chunking_benchmark ./manuals/*.pdf --queries 300 --dense
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+import numpy as np
+import config
+from core.chunking import CHUNKERS, get_chunker
+from core.sentence_store import split_sentence_spans
+from core.sparse_index import SparseIndex, tokenize
+from utils.file_helper import extract_text_from_pdf
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def sample_queries(pages, count, min_words=6, seed=0):
+    """Samples sentences of at least `min_words` words from the pages, as (query, page) pairs."""
+    sentences = []
+    for page_index, page in enumerate(pages):
+        text = page.page_content
+        for start, end in split_sentence_spans(text.replace("\n", " ")):
+            sentence = text[start:end]
+            if len(tokenize(sentence)) >= min_words:
+                sentences.append((sentence, page_index))
+    random.Random(seed).shuffle(sentences)
+    return sentences[:count]
+
+
+def time_chunker(chunker, pages, repeat=3):
+    """Returns the chunks of the pages and the best time of `repeat` runs in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [chunk for page in pages for chunk in chunker.split(page)]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return chunks, best
+
+
+def _contains(chunk_tokens, query_tokens):
+    # Token sequences are compared, so separators dropped by a chunker do not matter
+    return f" {query_tokens} " in f" {chunk_tokens} "
+
+
+def evaluate_retrieval(chunks, queries, k, rank):
+    """
+    Returns recall@k, MRR@k and sentence integrity (share of queries contained whole
+    in at least one chunk) for a ranking function rank(query, k) -> chunk indexes.
+    """
+    chunk_tokens = [" ".join(tokenize(chunk.page_content)) for chunk in chunks]
+    hits, reciprocal_ranks, intact = 0, 0.0, 0
+    for query, _ in queries:
+        query_tokens = " ".join(tokenize(query))
+        if any(_contains(tokens, query_tokens) for tokens in chunk_tokens):
+            intact += 1
+        for position, index in enumerate(rank(query, k), start=1):
+            if _contains(chunk_tokens[index], query_tokens):
+                hits += 1
+                reciprocal_ranks += 1.0 / position
+                break
+    total = max(len(queries), 1)
+    return {"recall": hits / total, "mrr": reciprocal_ranks / total, "integrity": intact / total}
+
+
+def bm25_ranker(chunks, directory):
+    index = SparseIndex(os.path.join(directory, f"bm25-{time.perf_counter_ns()}.sqlite"))
+    index.add([str(i) for i in range(len(chunks))], [chunk.page_content for chunk in chunks])
+
+    def rank(query, k):
+        return [int(chunk_id) for chunk_id, _ in index.search(query, k=k)]
+    return rank
+
+
+def dense_ranker(chunks, embeddings):
+    matrix = np.asarray(embeddings.embed_documents([chunk.page_content for chunk in chunks]), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+
+    def rank(query, k):
+        vector = np.asarray(embeddings.embed_query(query.lower()), dtype=np.float32)
+        scores = matrix @ (vector / (np.linalg.norm(vector) + 1e-12))
+        return list(np.argsort(-scores)[:k])
+    return rank
+
+
+def run_benchmark(pdf_paths, chunker_names, queries=200, k=5, dense=False, repeat=3):
+    """Runs every chunker over the pages of the PDFs and returns one result dict per chunker."""
+    pages = [page for path in pdf_paths for page in extract_text_from_pdf(path)]
+    characters = sum(len(page.page_content) for page in pages)
+    query_set = sample_queries(pages, queries)
+    logging.info("Benchmarking %d pages (%d characters) with %d queries.", len(pages), characters, len(query_set))
+
+    embeddings = None
+    if dense:
+        from core.rag_engine import get_engine
+        embeddings = get_engine().embeddings
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in chunker_names:
+            chunks, seconds = time_chunker(get_chunker(name), pages, repeat)
+            result = {
+                "chunker": name,
+                "chunks": len(chunks),
+                "mean_chars": sum(len(chunk.page_content) for chunk in chunks) / max(len(chunks), 1),
+                "seconds": seconds,
+                "pages_per_second": len(pages) / seconds if seconds else float("inf"),
+                "chunks_per_second": len(chunks) / seconds if seconds else float("inf"),
+                "mb_per_second": characters / (1024 * 1024) / seconds if seconds else float("inf"),
+            }
+            result.update({f"bm25_{key}": value for key, value in evaluate_retrieval(chunks, query_set, k, bm25_ranker(chunks, directory)).items()})
+            if embeddings is not None:
+                result.update({f"dense_{key}": value for key, value in evaluate_retrieval(chunks, query_set, k, dense_ranker(chunks, embeddings)).items() if key != "integrity"})
+            results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chunkers on PDF files.")
+    parser.add_argument("paths", nargs="+", help="PDF files.")
+    parser.add_argument("--chunkers", nargs="+", default=list(CHUNKERS), choices=list(CHUNKERS))
+    parser.add_argument("--queries", type=int, default=200, help="Number of sampled sentence queries.")
+    parser.add_argument("--k", type=int, default=5, help="Retrieval depth.")
+    parser.add_argument("--repeat", type=int, default=3, help="Chunking runs per chunker; the best time is kept.")
+    parser.add_argument("--dense", action="store_true", help="Also evaluate dense retrieval with the Ollama embedding model.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.paths, args.chunkers, queries=args.queries, k=args.k, dense=args.dense, repeat=args.repeat)
+    columns = [column for column in results[0] if column != "chunker"]
+    print(f"{'chunker':<12}" + "".join(f"{column:>20}" for column in columns))
+    for result in results:
+        print(f"{result['chunker']:<12}" + "".join(f"{result[column]:>20.3f}" if isinstance(result[column], float) else f"{result[column]:>20}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic PDF corpus for the benchmarks: technical-manual-like documents with paragraphs of
+text, ruled tables and captioned images, generated deterministically from a seed.
+
+Every page states a fact such as "Part AB-001003 has a torque rating of 45 Nm.", which
+are returned as (question, answer) pairs to query the corpus.
+
+Example:
+    python -m benchmarks.corpus ./bench_corpus --documents 8 --pages 40
+"""
+import argparse
+import os
+import random
+import fitz
+
+VOCABULARY = (
+    "pump valve motor sensor housing bearing shaft seal gasket flange coupling impeller rotor stator "
+    "controller relay circuit voltage current pressure temperature flow rate torque speed calibration "
+    "maintenance inspection lubrication alignment vibration assembly installation procedure warning "
+    "operator manual system module interface signal output input firmware configuration parameter "
+    "tolerance clearance fastener bracket cable connector terminal enclosure filter cartridge reservoir"
+).split()
+PROPERTIES = [("torque rating", "Nm"), ("maximum pressure", "bar"), ("rated speed", "rpm"), ("operating voltage", "V"), ("weight", "kg")]
+
+
+def _sentence(rng, words=12):
+    text = " ".join(rng.choice(VOCABULARY) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraph(rng, sentences=5):
+    return " ".join(_sentence(rng, rng.randint(8, 16)) for _ in range(sentences))
+
+
+def _draw_table(page, rng, top, rows=4, columns=3, cell_width=150, cell_height=18):
+    left = 72
+    for row in range(rows + 1):
+        page.draw_line((left, top + row * cell_height), (left + columns * cell_width, top + row * cell_height))
+    for column in range(columns + 1):
+        page.draw_line((left + column * cell_width, top), (left + column * cell_width, top + rows * cell_height))
+    for row in range(rows):
+        for column in range(columns):
+            value = rng.choice(VOCABULARY) if row == 0 else f"{rng.randint(1, 999)}"
+            page.insert_text((left + column * cell_width + 4, top + row * cell_height + 13), value, fontsize=9)
+    return top + rows * cell_height
+
+
+def generate_pdf(path, pages=20, seed=0, document_index=0, table_every=4, image_every=5):
+    """
+    Writes a synthetic PDF and returns the facts it states as (question, answer) pairs.
+
+    Args:
+        path (str): Output path.
+        pages (int): Number of pages.
+        seed (int): Seed of the generator; the same seed gives the same document.
+        document_index (int): Index of the document in its corpus, used in part numbers.
+        table_every (int): A ruled table is drawn on every n-th page. 0 disables tables.
+        image_every (int): A captioned image is drawn on every n-th page. 0 disables images.
+    """
+    rng = random.Random(f"{seed}-{document_index}")
+    facts = []
+    document = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), 0)
+    pixmap.clear_with(160)
+    for page_number in range(pages):
+        page = document.new_page()
+        part = f"AB-{document_index:03d}{page_number:03d}"
+        prop, unit = rng.choice(PROPERTIES)
+        value = rng.randint(10, 990)
+        fact = f"Part {part} has a {prop} of {value} {unit}."
+        facts.append((f"What is the {prop} of part {part}?", fact))
+
+        text = f"Section {page_number + 1}\n\n{_paragraph(rng)} {fact} {_paragraph(rng, 3)}\n\n{_paragraph(rng)}"
+        if page.insert_textbox(fitz.Rect(72, 72, 540, 460), text, fontsize=10) < 0:
+            raise ValueError("The text of a synthetic page does not fit its text box.")
+        bottom = 470
+        if table_every and page_number % table_every == 0:
+            bottom = _draw_table(page, rng, bottom) + 20
+        if image_every and page_number % image_every == 0:
+            page.insert_image(fitz.Rect(72, bottom, 172, bottom + 100), pixmap=pixmap)
+            page.insert_text((72, bottom + 115), f"Figure {page_number + 1}: {rng.choice(VOCABULARY)} {rng.choice(VOCABULARY)} diagram of part {part}", fontsize=9)
+    document.set_metadata({"title": f"Synthetic manual {document_index}", "author": "benchmarks", "keywords": "synthetic, benchmark"})
+    document.save(path)
+    document.close()
+    return facts
+
+
+def generate_corpus(directory, documents=4, pages=20, seed=0):
+    """
+    Writes `documents` synthetic PDFs of `pages` pages into a directory.
+    Returns (pdf_paths, facts) where facts are the (question, answer) pairs of every document.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths, facts = [], []
+    for index in range(documents):
+        path = os.path.join(directory, f"manual_{seed}_{index:03d}.pdf")
+        facts.extend(generate_pdf(path, pages=pages, seed=seed, document_index=index))
+        paths.append(path)
+    return paths, facts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus.")
+    parser.add_argument("directory", help="Output directory.")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    paths, facts = generate_corpus(args.directory, args.documents, args.pages, args.seed)
+    print(f"Wrote {len(paths)} documents ({args.pages} pages each, {len(facts)} facts) to {args.directory}.")
+
+
+if __name__ == "__main__":
+    main()
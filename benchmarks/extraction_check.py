@@ -0,0 +1,94 @@
+"""
+Regression check of the single-pass PDF extraction: extract_pdf_pages must return the same
+Documents as the original per-call extraction (PyMuPDFLoader for the page text, camelot over
+every page for the tables, and a caption search with its own text page per image).
+
+The PDFs are a synthetic corpus (benchmarks/corpus.py) with text, ruled tables and captioned
+images, unless paths are given. Exits with status 1 and lists the differences on a mismatch.
+
+Example:
+    python -m benchmarks.extraction_check --documents 2 --pages 30
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import fitz
+import config
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
+from benchmarks.corpus import generate_corpus
+from utils.file_helper import _read_tables, _table_documents, extract_pdf_pages, normalize_text
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def reference_image_documents(file_path):
+    """Image captions as extracted before the single-pass extraction."""
+    image_docs = []
+    with fitz.open(file_path) as doc:
+        for page_num, page in enumerate(doc):
+            image_list = page.get_images(full=True)
+            image_list.sort(key=lambda img: page.get_image_bbox(img).y1)
+            for img_index, img in enumerate(image_list):
+                img_bbox = page.get_image_bbox(img)
+                search_area = fitz.Rect(img_bbox.x0, img_bbox.y1, img_bbox.x1, img_bbox.y1 + 50)
+                text_in_area = page.get_text("text", clip=search_area, sort=True).strip()
+                caption = text_in_area if text_in_area else "No caption found"
+                metadata = {
+                    "content_type": "image_caption",
+                    "page_number": page_num + 1,
+                    "image_index_on_page": img_index,
+                    "image_bbox": str([img_bbox.x0, img_bbox.y0, img_bbox.x1, img_bbox.y1])
+                }
+                image_docs.append(Document(page_content=normalize_text(f"[Image: An image is present on the page. Caption: '{caption}']"), metadata=metadata))
+    return image_docs
+
+
+def compare(kind, expected, actual):
+    """Returns the differences between two lists of Documents, as printable lines."""
+    differences = []
+    if len(expected) != len(actual):
+        differences.append(f"{kind}: {len(expected)} documents expected, {len(actual)} extracted")
+    for index, (expected_doc, actual_doc) in enumerate(zip(expected, actual)):
+        if expected_doc.page_content != actual_doc.page_content:
+            differences.append(f"{kind} {index}: content {expected_doc.page_content[:80]!r} != {actual_doc.page_content[:80]!r}")
+        if expected_doc.metadata != actual_doc.metadata:
+            differences.append(f"{kind} {index}: metadata {expected_doc.metadata} != {actual_doc.metadata}")
+    return differences
+
+
+def check_pdf(file_path):
+    """Returns the differences between extract_pdf_pages and the reference extraction of a PDF."""
+    text_pages, table_docs, image_docs = extract_pdf_pages(file_path)
+    differences = compare("text", PyMuPDFLoader(file_path).load(), text_pages)
+    differences += compare("table", _table_documents(_read_tables(file_path)), table_docs)
+    differences += compare("image", reference_image_documents(file_path), image_docs)
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the single-pass PDF extraction matches the per-call extraction.")
+    parser.add_argument("paths", nargs="*", help="PDF files. A synthetic corpus is generated by default.")
+    parser.add_argument("--documents", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.paths or generate_corpus(directory, args.documents, args.pages, args.seed)[0]
+        failed = False
+        for path in paths:
+            differences = check_pdf(path)
+            print(f"{path}: {'OK' if not differences else f'{len(differences)} differences'}")
+            for line in differences:
+                print(f"    {line}")
+            failed = failed or bool(differences)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Local stand-in for the Ollama HTTP API, used to benchmark the application offline.
+
+Embeddings are deterministic hashed bag-of-words vectors, so texts sharing words are close
+and retrieval behaves sensibly. Chat answers are canned: search query rewrites return the
+keywords of the question, and answers repeat the first sentences of the prompt context, so
+passage highlighting finds matches. Optional delays emulate the latency of a real model.
+
+Example:
+    python -m benchmarks.fake_ollama --port 11434 --token-latency-ms 20
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import numpy as np
+import config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]")
+
+
+def hashed_embedding(text, dimensions=256):
+    """Deterministic unit vector of the hashed words of a text (signed feature hashing)."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector.tolist()
+    return (vector / norm).tolist()
+
+
+def canned_answer(prompt):
+    """Returns the answer of the fake model to the last user message."""
+    if "Search Query:" in prompt:
+        # Query rewrite: the words of the question
+        question = re.findall(r'User Question: "(.*)"', prompt)
+        return " ".join(WORD_PATTERN.findall(question[-1] if question else prompt)[:12])
+    context = prompt.split("Context:", 1)[-1].split("---", 1)[0]
+    sentences = [sentence.strip() for sentence in SENTENCE_PATTERN.findall(context)]
+    if not sentences:
+        return "I couldn't find the answer in the provided document."
+    return " ".join(sentences[:3])
+
+
+class FakeOllamaServer:
+    """
+    Threaded HTTP server implementing the Ollama endpoints used by the application:
+    /api/embed, /api/embeddings, /api/chat (streaming or not), /api/tags and /api/version.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 for any free port.
+        dimensions (int): Size of the embedding vectors.
+        embed_latency_ms (float): Delay of every embedding request.
+        embed_item_latency_ms (float): Additional delay per embedded text.
+        first_token_latency_ms (float): Delay before the first token of a chat answer.
+        token_latency_ms (float): Delay between the tokens of a chat answer.
+        failed_embed_requests (int): Number of embedding requests answered with an HTTP 500
+            error before the server starts answering them, to exercise client retries.
+    """
+
+    def __init__(
+                 self,
+                 host                   = "127.0.0.1",
+                 port                   = 0,
+                 dimensions             = 256,
+                 embed_latency_ms       = 0.0,
+                 embed_item_latency_ms  = 0.0,
+                 first_token_latency_ms = 0.0,
+                 token_latency_ms       = 0.0,
+                 failed_embed_requests  = 0
+                 ):
+        self.dimensions = dimensions
+        self.embed_latency = embed_latency_ms / 1000
+        self.embed_item_latency = embed_item_latency_ms / 1000
+        self.first_token_latency = first_token_latency_ms / 1000
+        self.token_latency = token_latency_ms / 1000
+        self.failed_embed_requests = failed_embed_requests
+        self.stats = {"embed_requests": 0, "embedded_texts": 0, "chat_requests": 0, "failed_embed_requests": 0}
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves requests from a background thread and returns the server URL."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        logging.info("Fake Ollama server listening on %s", self.url)
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": []})
+                elif self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-fake"})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path in ("/api/embed", "/api/embeddings") and server._fail_embed():
+                    self._send_json({"error": "simulated embedding failure"}, status=500)
+                elif self.path == "/api/embed":
+                    texts = body.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    self._send_json({"model": body.get("model"), "embeddings": server._embed(texts)})
+                elif self.path == "/api/embeddings":
+                    self._send_json({"embedding": server._embed([body.get("prompt", "")])[0]})
+                elif self.path == "/api/chat":
+                    self._chat(body)
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def _chat(self, body):
+                server._count(chat_requests=1)
+                messages = body.get("messages") or [{"content": ""}]
+                prompt = messages[-1].get("content", "")
+                answer = canned_answer(prompt)
+                prompt_tokens = len(WORD_PATTERN.findall(" ".join(message.get("content", "") for message in messages)))
+                words = answer.split(" ")
+                final = {
+                    "model": body.get("model"),
+                    "created_at": "1970-01-01T00:00:00Z",
+                    "done": True,
+                    "done_reason": "stop",
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": len(words)
+                }
+                time.sleep(server.first_token_latency)
+                if not body.get("stream", True):
+                    time.sleep(server.token_latency * max(len(words) - 1, 0))
+                    self._send_json({**final, "message": {"role": "assistant", "content": answer}})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, word in enumerate(words):
+                    if i:
+                        time.sleep(server.token_latency)
+                    self._send_chunk({
+                        "model": body.get("model"),
+                        "created_at": "1970-01-01T00:00:00Z",
+                        "message": {"role": "assistant", "content": (" " if i else "") + word},
+                        "done": False
+                    })
+                self._send_chunk({**final, "message": {"role": "assistant", "content": ""}})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _send_chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _fail_embed(self):
+        with self._stats_lock:
+            if self.stats["failed_embed_requests"] >= self.failed_embed_requests:
+                return False
+            self.stats["failed_embed_requests"] += 1
+            return True
+
+    def _embed(self, texts):
+        time.sleep(self.embed_latency + self.embed_item_latency * len(texts))
+        self._count(embed_requests=1, embedded_texts=len(texts))
+        return [hashed_embedding(text, self.dimensions) for text in texts]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Ollama HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dimensions", type=int, default=256, help="Size of the embedding vectors.")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Delay of every embedding request.")
+    parser.add_argument("--embed-item-latency-ms", type=float, default=0.0, help="Additional delay per embedded text.")
+    parser.add_argument("--first-token-latency-ms", type=float, default=0.0, help="Delay before the first answer token.")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Delay between answer tokens.")
+    parser.add_argument("--failed-embed-requests", type=int, default=0, help="Number of embedding requests answered with an error first.")
+    args = parser.parse_args(argv)
+
+    server = FakeOllamaServer(
+        host=args.host,
+        port=args.port,
+        dimensions=args.dimensions,
+        embed_latency_ms=args.embed_latency_ms,
+        embed_item_latency_ms=args.embed_item_latency_ms,
+        first_token_latency_ms=args.first_token_latency_ms,
+        token_latency_ms=args.token_latency_ms,
+        failed_embed_requests=args.failed_embed_requests
+    )
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Reports the recall-versus-memory tradeoff of the quantized vector stores (core/quantized_store.py)
+on existing collections.
+
+Stored chunk embeddings are sampled as queries. For every query, the exact float32 nearest
+neighbours (the query chunk itself excluded) are compared with the `k` results of:
+- the ChromaDB HNSW index, the current float32 search path;
+- the quantized first pass alone, and followed by the exact rescore of a shortlist of
+  `factor * k` candidates, for every vector type and shortlist factor.
+Memory is the size of the quantized store files against the raw float32 vectors.
+
+Example:
+    python -m benchmarks.quantization_benchmark manual_collection --queries 500 --k 20
+"""
+import argparse
+import json
+import logging
+import random
+import tempfile
+import time
+import numpy as np
+import chromadb
+import config
+from core.quantized_store import QUANTIZED_DTYPES, QuantizedVectorStore, distances
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def load_embeddings(collection, page_size=5000):
+    """Returns the IDs and the float32 embeddings of a collection."""
+    ids, vectors = [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    return ids, np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+def _recall(found, truth):
+    return len(set(found) & set(truth)) / len(truth) if truth else 1.0
+
+
+def benchmark_collection(collection, queries=200, k=20, shortlist_factors=(1, 2, 4, 8), dtypes=QUANTIZED_DTYPES, seed=0):
+    """Returns one result dict per search configuration for a collection."""
+    space = ((collection.configuration or {}).get("hnsw") or {}).get("space") or "l2"
+    ids, vectors = load_embeddings(collection)
+    if len(ids) <= k:
+        logging.warning("Collection '%s' has %d chunks, not more than k=%d: skipped.", collection.name, len(ids), k)
+        return []
+    squared_norms = np.einsum("ij,ij->i", vectors, vectors)
+    query_rows = random.Random(seed).sample(range(len(ids)), min(queries, len(ids)))
+
+    # Exact float32 neighbours, the query chunk itself excluded
+    truths = []
+    for row in query_rows:
+        exact = distances(space, vectors @ vectors[row], squared_norms, vectors[row])
+        exact[row] = np.inf
+        truths.append([ids[i] for i in np.argsort(exact)[:k]])
+    float32_bytes = vectors.nbytes
+    row_by_id = {chunk_id: row for row, chunk_id in enumerate(ids)}
+
+    def result(search, recalls, seconds, nbytes):
+        return {
+            "collection": collection.name,
+            "vectors": len(ids),
+            "dimensions": vectors.shape[1],
+            "search": search,
+            f"recall@{k}": float(np.mean(recalls)),
+            "ms_per_query": seconds * 1000 / len(query_rows),
+            "mb": nbytes / (1024 * 1024),
+            "memory_ratio": nbytes / float32_bytes
+        }
+
+    results = []
+    start = time.perf_counter()
+    hnsw = collection.query(query_embeddings=vectors[query_rows], n_results=k + 1, include=[])
+    seconds = time.perf_counter() - start
+    recalls = [_recall([chunk_id for chunk_id in found if chunk_id != ids[row]][:k], truth) for found, row, truth in zip(hnsw["ids"], query_rows, truths)]
+    results.append(result("float32 hnsw", recalls, seconds, float32_bytes))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype in dtypes:
+            store = QuantizedVectorStore(directory, dtype=dtype)
+            store.build(collection)
+            for factor in shortlist_factors:
+                recalls = []
+                start = time.perf_counter()
+                for row, truth in zip(query_rows, truths):
+                    # One more candidate, as the query chunk itself is among them
+                    candidates = [chunk_id for chunk_id, _ in store.shortlist(vectors[row], factor * k + 1) if chunk_id != ids[row]]
+                    if factor > 1:
+                        rows = np.array([row_by_id[chunk_id] for chunk_id in candidates])
+                        exact = distances(space, vectors[rows] @ vectors[row], squared_norms[rows], vectors[row])
+                        candidates = [candidates[i] for i in np.argsort(exact)]
+                    recalls.append(_recall(candidates[:k], truth))
+                seconds = time.perf_counter() - start
+                search = f"{dtype} first pass" if factor == 1 else f"{dtype} rescore x{factor}"
+                results.append(result(search, recalls, seconds, store.nbytes()))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the recall-versus-memory tradeoff of quantized vector stores.")
+    parser.add_argument("collections", nargs="*", help="Collections to evaluate. All collections by default.")
+    parser.add_argument("--persist-directory", default=config.PERSIST_DIRECTORY, help="Directory of the Chroma database.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of stored chunks used as queries per collection.")
+    parser.add_argument("--k", type=int, default=config.RETRIEVAL_FETCH_K, help="Number of neighbours compared, the MMR fetch_k by default.")
+    parser.add_argument("--shortlist-factors", type=int, nargs="+", default=[1, 2, 4, 8], help="Shortlist sizes as multiples of k; 1 is the first pass alone.")
+    parser.add_argument("--dtypes", nargs="+", default=list(QUANTIZED_DTYPES), choices=list(QUANTIZED_DTYPES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    client = chromadb.PersistentClient(path=args.persist_directory)
+    names = args.collections or [collection.name for collection in client.list_collections()]
+    results = []
+    for name in names:
+        results.extend(benchmark_collection(
+            client.get_collection(name=name),
+            queries=args.queries,
+            k=args.k,
+            shortlist_factors=args.shortlist_factors,
+            dtypes=args.dtypes,
+            seed=args.seed
+        ))
+    if not results:
+        print("No collection to evaluate.")
+        return
+
+    columns = [column for column in results[0] if column not in ("collection", "search")]
+    print(f"{'collection':<24}{'search':<22}" + "".join(f"{column:>14}" for column in columns))
+    for result in results:
+        print(f"{result['collection']:<24}{result['search']:<22}" + "".join(f"{result[column]:>14.3f}" if isinstance(result[column], float) else f"{result[column]:>14}" for column in columns))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+End-to-end benchmark of ingestion, question answering and passage highlighting, run offline
+against the fake Ollama server (benchmarks/fake_ollama.py) on a synthetic corpus
+(benchmarks/corpus.py).
+
+For every corpus size and concurrency level it measures:
+    ingest     process_pdf_to_chroma_db, one document per request
+    query      generate_rag_response on questions about facts stated in the corpus
+    highlight  highlight_relevant_passages on the answers of the query scenario
+
+and reports p50/p95/p99 latencies, throughput and the p50/p95 of every pipeline stage
+(from the metrics traces of core/metrics.py). Results are written as JSON, so runs can be
+compared with --baseline. Caches are disabled, so repeated runs measure the same work.
+
+Examples:
+    python -m benchmarks.rag_benchmark --documents 2 8 --concurrency 1 4 --output before.json
+    python -m benchmarks.rag_benchmark --documents 2 8 --concurrency 1 4 --baseline before.json
+    python -m benchmarks.rag_benchmark --token-latency-ms 20 --set CHUNKER=recursive
+"""
+import argparse
+import ast
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import config
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_ollama import FakeOllamaServer
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+COLLECTION_NAME = "benchmark_collection"
+SETTINGS_ENVIRONMENT_VARIABLE = "RAG_BENCHMARK_SETTINGS"
+
+# Caches would make repeated requests measure lookups instead of work
+BENCHMARK_CONFIG = {
+    "EMBEDDING_CACHE_ENABLED": False,
+    "ANSWER_CACHE_ENABLED": False,
+    "RERANK_CACHE_SIZE": 0,
+    "METRICS_ENABLED": True,
+    "METRICS_PROMETHEUS_PORT": None,
+}
+
+
+if __name__ == "__mp_main__" and os.environ.get(SETTINGS_ENVIRONMENT_VARIABLE):
+    for key, value in json.loads(os.environ[SETTINGS_ENVIRONMENT_VARIABLE]).items():
+        setattr(config, key, value)
+
+
+class StageCollector:
+    """Metrics sink keeping the per-stage times of every finished trace, per trace kind."""
+
+    def __init__(self):
+        self._stages = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def observe(self, trace):
+        summary = trace.summary()
+        with self._lock:
+            for stage, entry in summary.items():
+                self._stages[(trace.kind, stage)].append(entry["seconds"])
+
+    def drain(self, kind):
+        """Returns {stage: {"p50_ms", "p95_ms"}} for the traces of a kind since the last drain."""
+        with self._lock:
+            keys = [key for key in self._stages if key[0] == kind]
+            stages = {stage: self._stages.pop((kind, stage)) for _, stage in keys}
+        return {
+            stage: {
+                "p50_ms": round(float(np.percentile(values, 50)) * 1000, 3),
+                "p95_ms": round(float(np.percentile(values, 95)) * 1000, 3)
+            }
+            for stage, values in stages.items()
+        }
+
+
+def latency_summary(latencies):
+    """Returns the count, p50/p95/p99, mean and max of latencies given in seconds, in milliseconds."""
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def run_concurrently(function, items, concurrency):
+    """
+    Calls function(item) for every item with `concurrency` threads.
+    Returns (results, latencies, elapsed_seconds); failed calls are logged and left out.
+    """
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            return function(item), time.perf_counter() - start
+        except Exception as e:
+            logging.error("Benchmark request failed: %s", e)
+            return None, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="benchmark") as executor:
+        outcomes = list(executor.map(timed, items))
+    elapsed = time.perf_counter() - start
+    results = [result for result, latency in outcomes if latency is not None]
+    latencies = [latency for _, latency in outcomes if latency is not None]
+    return results, latencies, elapsed
+
+
+def configure(work_directory, ollama_host_url, overrides):
+    """
+    Points the application at the fake server and at a scratch directory.
+    Must run before the application modules are imported, as they bind configuration
+    values as default arguments at import time.
+    """
+    if "core.rag_manager" in sys.modules or "core.document_processor" in sys.modules:
+        raise RuntimeError("configure() must be called before the application modules are imported.")
+    settings = {
+        **BENCHMARK_CONFIG,
+        "OLLAMA_HOST_URL": ollama_host_url,
+        "PERSIST_DIRECTORY": os.path.join(work_directory, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(work_directory, "embeddings.sqlite"),
+        "SENTENCE_STORE_PATH": os.path.join(work_directory, "sentences.sqlite"),
+        **overrides
+    }
+    for key, value in settings.items():
+        if not hasattr(config, key):
+            raise ValueError(f"Unknown configuration setting '{key}'.")
+        setattr(config, key, value)
+    # The benchmark runs offline
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # Extraction workers are spawned processes: they re-import this module and apply the same settings
+    os.environ[SETTINGS_ENVIRONMENT_VARIABLE] = json.dumps(settings)
+    return settings
+
+
+def benchmark_ingestion(pdf_paths, concurrency, persist_directory, collector):
+    from core.document_processor import process_pdf_to_chroma_db
+
+    def ingest(path):
+        return process_pdf_to_chroma_db(pdf_path=path, persist_directory=persist_directory, collection_name=COLLECTION_NAME)
+
+    results, latencies, elapsed = run_concurrently(ingest, pdf_paths, concurrency)
+    pages = sum(result["pages"] for result in results if result)
+    chunks = sum(result["chunks"] for result in results if result)
+    return {
+        **latency_summary(latencies),
+        "failed": len(pdf_paths) - len(latencies),
+        "seconds": round(elapsed, 3),
+        "documents_per_second": round(len(latencies) / elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 3),
+        "chunks_per_second": round(chunks / elapsed, 3),
+        "stages": collector.drain("ingest"),
+    }
+
+
+def benchmark_queries(facts, concurrency, persist_directory, collector):
+    from core.rag_manager import generate_rag_response
+
+    def ask(fact):
+        question, statement = fact
+        answer, docs = generate_rag_response(question=question, collection_name=COLLECTION_NAME, persist_directory=persist_directory)
+        # The fact is retrieved when its part number is in one of the context chunks
+        part = statement.split()[1].lower()
+        return answer, docs, any(part in doc.page_content.lower() for doc in docs)
+
+    results, latencies, elapsed = run_concurrently(ask, facts, concurrency)
+    report = {
+        **latency_summary(latencies),
+        "failed": len(facts) - len(latencies),
+        "seconds": round(elapsed, 3),
+        "queries_per_second": round(len(latencies) / elapsed, 3),
+        "retrieval_hit_rate": round(sum(hit for _, _, hit in results) / max(len(results), 1), 3),
+        "stages": collector.drain("query"),
+    }
+    return report, [(answer, docs) for answer, docs, _ in results]
+
+
+def benchmark_highlight(samples, concurrency, collector):
+    from core.metrics import start_trace
+    from core.rag_manager import highlight_relevant_passages
+
+    def highlight(sample):
+        trace = start_trace("highlight")
+        highlight_relevant_passages(*sample)
+        trace.finish()
+
+    _, latencies, elapsed = run_concurrently(highlight, samples, concurrency)
+    return {
+        **latency_summary(latencies),
+        "failed": len(samples) - len(latencies),
+        "seconds": round(elapsed, 3),
+        "highlights_per_second": round(len(latencies) / elapsed, 3),
+        "stages": collector.drain("highlight"),
+    }
+
+
+def run_benchmark(
+                  documents      = (2, 8),
+                  pages          = 20,
+                  concurrency    = (1, 4),
+                  queries        = 50,
+                  warmup         = 3,
+                  seed           = 0,
+                  work_directory = None,
+                  server_options = None,
+                  overrides      = None
+                  ):
+    """
+    Runs the ingest, query and highlight scenarios for every corpus size (number of documents)
+    and concurrency level, and returns the report: {"meta": {...}, "results": [...]}.
+    """
+    with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as scratch, FakeOllamaServer(**(server_options or {})) as server:
+        work_directory = work_directory or scratch
+        settings = configure(work_directory, server.url, overrides or {})
+        from core.metrics import register_sink
+        collector = StageCollector()
+        register_sink(collector)
+
+        results = []
+        rng = random.Random(seed)
+        for document_count in documents:
+            corpus_directory = os.path.join(work_directory, f"corpus-{document_count}")
+            pdf_paths, facts = generate_corpus(corpus_directory, documents=document_count, pages=pages, seed=seed)
+            logging.warning("Corpus of %d documents, %d pages each.", document_count, pages)
+
+            persist_directory = None
+            for level in concurrency:
+                # Every run ingests into an empty database
+                persist_directory = os.path.join(work_directory, f"chroma-{document_count}-{level}")
+                report = benchmark_ingestion(pdf_paths, level, persist_directory, collector)
+                results.append({"scenario": "ingest", "documents": document_count, "pages": pages, "concurrency": level, **report})
+                logging.warning("ingest    documents=%d concurrency=%d p50=%sms", document_count, level, report.get("p50_ms"))
+
+            # Model loading and first connections are not measured
+            benchmark_queries(facts[:warmup], 1, persist_directory, collector)
+
+            for level in concurrency:
+                sample = [rng.choice(facts) for _ in range(queries)]
+                report, answers = benchmark_queries(sample, level, persist_directory, collector)
+                results.append({"scenario": "query", "documents": document_count, "pages": pages, "concurrency": level, **report})
+                logging.warning("query     documents=%d concurrency=%d p50=%sms", document_count, level, report.get("p50_ms"))
+
+                report = benchmark_highlight(answers, level, collector)
+                results.append({"scenario": "highlight", "documents": document_count, "pages": pages, "concurrency": level, **report})
+                logging.warning("highlight documents=%d concurrency=%d p50=%sms", document_count, level, report.get("p50_ms"))
+
+        server_stats = dict(server.stats)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "pages": pages,
+            "queries": queries,
+            "seed": seed,
+            "server": {**(server_options or {}), **server_stats},
+            "config": {key: value for key, value in settings.items() if key in BENCHMARK_CONFIG or key in (overrides or {})},
+        },
+        "results": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _result_key(result):
+    return (result["scenario"], result["documents"], result["pages"], result["concurrency"])
+
+
+def _throughput_key(result):
+    return next(key for key in result if key.endswith("_per_second"))
+
+
+def format_report(report, baseline=None):
+    """Formats the results as a table, with the relative change to a baseline report when given."""
+    previous = {_result_key(result): result for result in (baseline or {}).get("results", [])}
+    columns = ["p50_ms", "p95_ms", "p99_ms"]
+    lines = [f"{'scenario':<10}{'docs':>6}{'conc':>6}" + "".join(f"{column:>18}" for column in columns) + f"{'throughput/s':>22}"]
+    for result in report["results"]:
+        old = previous.get(_result_key(result))
+        throughput = _throughput_key(result)
+
+        def cell(key, width):
+            value = result.get(key)
+            if value is None:
+                return f"{'-':>{width}}"
+            text = f"{value:.1f}"
+            if old is not None and old.get(key):
+                text += f" ({(value - old[key]) / old[key]:+.0%})"
+            return f"{text:>{width}}"
+
+        lines.append(f"{result['scenario']:<10}{result['documents']:>6}{result['concurrency']:>6}"
+                     + "".join(cell(column, 18) for column in columns) + cell(throughput, 22))
+    return "\n".join(lines)
+
+
+def _parse_setting(text):
+    key, _, value = text.partition("=")
+    try:
+        return key.strip(), ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return key.strip(), value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, querying and highlighting offline.")
+    parser.add_argument("--documents", type=int, nargs="+", default=[2, 8], help="Corpus sizes, in documents.")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per document.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrency levels.")
+    parser.add_argument("--queries", type=int, default=50, help="Questions per query run.")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured questions before the query runs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-directory", help="Keep the corpus and databases in this directory instead of a temporary one.")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated delay of every embedding request.")
+    parser.add_argument("--embed-item-latency-ms", type=float, default=0.0, help="Simulated delay per embedded text.")
+    parser.add_argument("--first-token-latency-ms", type=float, default=0.0, help="Simulated delay before the first answer token.")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Simulated delay between answer tokens.")
+    parser.add_argument("--set", dest="settings", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config.py setting, e.g. --set RETRIEVAL_K=4 (values are Python literals).")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with.")
+    parser.add_argument("--verbose", action="store_true", help="Show the application logs.")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    report = run_benchmark(
+        documents=args.documents,
+        pages=args.pages,
+        concurrency=args.concurrency,
+        queries=args.queries,
+        warmup=args.warmup,
+        seed=args.seed,
+        work_directory=args.work_directory,
+        server_options={
+            "embed_latency_ms": args.embed_latency_ms,
+            "embed_item_latency_ms": args.embed_item_latency_ms,
+            "first_token_latency_ms": args.first_token_latency_ms,
+            "token_latency_ms": args.token_latency_ms,
+        },
+        overrides=dict(_parse_setting(setting) for setting in args.settings)
+    )
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
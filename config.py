@@ -1,4 +1,5 @@
 import logging
+import os
 
 OLLAMA_HOST_URL = "http://localhost:11434"
 LOCAL_MODEL = "llama3"
@@ -7,3 +8,79 @@ PERSIST_DIRECTORY = "./chroma_db"
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 150
 LOGGING_LEVEL = logging.INFO
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L6-v2"
+SENTENCE_TRANSFORMER_MODEL = "all-MiniLM-L6-v2"
+RERANK_BACKEND = "torch"
+RERANK_MODEL_FILE = None
+WARM_UP_MODELS = True
+INGEST_MAX_WORKERS = min(4, os.cpu_count() or 1)
+INGEST_PAGES_PER_SHARD = 25
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_MAX_IN_FLIGHT = 4
+EMBEDDING_QUEUE_SIZE = 512
+EMBEDDING_MAX_RETRIES = 3
+EMBEDDING_RETRY_BACKOFF = 1.0
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "./cache/embeddings.sqlite"
+EMBEDDING_CACHE_MAX_MB = 512
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIMILARITY = 0.95
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 1000
+QUERY_PLANNER_MODE = "fast"
+QUERY_REWRITE_HISTORY_TURNS = 6
+QUERY_REWRITE_CACHE_SIZE = 1024
+QUERY_SPECULATION_MIN_OVERLAP = 0.5
+HYBRID_SEARCH_ENABLED = True
+RETRIEVAL_K = 8
+RETRIEVAL_FETCH_K = 20
+SPARSE_TOP_K = 8
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+SPARSE_INDEX_MMAP_BYTES = 256 * 1024 * 1024
+SENTENCE_INDEX_AT_INGESTION = True
+SENTENCE_STORE_PATH = "./cache/sentences.sqlite"
+SENTENCE_STORE_MEMORY_ENTRIES = 4096
+RERANK_FETCH_K = 8
+RERANK_TOP_N = 5
+RERANK_SCORE_THRESHOLD = None
+RERANK_MAX_BATCH_PAIRS = 64
+RERANK_MAX_WAIT_MS = 5
+RERANK_CACHE_SIZE = 10000
+ASYNC_POOL_WORKERS = 8
+ASYNC_STAGE_CONCURRENCY = {"retrieve": 8, "rerank": 4, "cache": 8, "generate": 4, "highlight": 2}
+INGESTION_QUEUE_PATH = "./cache/ingestion_jobs.sqlite"
+INGESTION_UPLOAD_DIRECTORY = "./cache/uploads"
+INGESTION_QUEUE_WORKERS = 2
+INGESTION_POLL_SECONDS = 1.0
+INGESTION_PROGRESS_INTERVAL = 0.5
+BULK_INGEST_CONCURRENCY = 2
+BULK_INGEST_CHECKPOINT_PATH = "./cache/bulk_ingest_checkpoint.jsonl"
+INGEST_MEMORY_BUDGET_MB = 1024
+TABLE_PREDETECTION_ENABLED = True
+TABLE_MIN_RULING_LINES = 2
+TABLE_LINE_TOLERANCE = 1.0
+TABLE_IMAGE_AREA_RATIO = 0.25
+CHUNKER = "sentence"
+CHUNK_MIN_FILL = 0.5
+CHUNK_CODE_LINE_RATIO = 0.3
+CHUNK_TABLE_LINE_RATIO = 0.5
+METRICS_ENABLED = False
+METRICS_TIMING_PANEL = False
+METRICS_PROMETHEUS_PORT = None
+METRICS_PROMETHEUS_HOST = "127.0.0.1"
+METRICS_HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+FEDERATED_MAX_WORKERS = 8
+FEDERATED_TIMEOUT_SECONDS = 5.0
+FEDERATED_CANDIDATES = 16
+CONTEXT_BUDGET_ENABLED = True
+CONTEXT_TOKEN_BUDGET = 2048
+CONTEXT_HISTORY_TOKEN_BUDGET = 1024
+CONTEXT_SUMMARY_TOKEN_BUDGET = 256
+CONTEXT_CHARS_PER_TOKEN = 4.0
+CONTEXT_MIN_OVERLAP_CHARS = 40
+CONTEXT_SUMMARY_CACHE_SIZE = 1024
+QUANTIZED_VECTORS = None
+QUANTIZED_SHORTLIST_FACTOR = 4
+QUANTIZED_BLOCK_ROWS = 65536
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import threading
+import time
+import numpy as np
+import config
+from collections import OrderedDict
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class AnswerCache:
+    """
+    In-memory semantic cache of generated answers.
+
+    An answer is reused when a new question targets the same collection, retrieves
+    the same context (same chunk IDs, chat history and model, summarized by a context
+    fingerprint) and its search query embedding has a cosine similarity with the
+    cached one of at least `similarity_threshold`. Entries expire after `ttl_seconds`
+    and the least recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(
+                 self,
+                 similarity_threshold = config.ANSWER_CACHE_SIMILARITY,
+                 ttl_seconds          = config.ANSWER_CACHE_TTL_SECONDS,
+                 max_entries          = config.ANSWER_CACHE_MAX_ENTRIES
+                 ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # entry id -> (collection, fingerprint, unit query vector, answer, created_at)
+        self._entries = OrderedDict()
+        # (collection, fingerprint) -> entry ids sharing that context
+        self._by_context = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def context_fingerprint(chunk_ids, chat_history=None, model=""):
+        """Returns a hash identifying the retrieved chunks, the chat history and the answering model."""
+        digest = hashlib.sha256(model.encode("utf-8"))
+        for chunk_id in chunk_ids:
+            digest.update(b"\x1f" + str(chunk_id).encode("utf-8"))
+        for message in chat_history or []:
+            digest.update(f"\x1e{message['role']}\x1f{message['content']}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, collection_name, query_vector, fingerprint):
+        """Returns the cached answer for a matching question, or None."""
+        query = _unit(query_vector)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._by_context.get((collection_name, fingerprint), ())):
+                _, _, vector, _, created_at = self._entries[entry_id]
+                if now - created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(query, vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            logging.info("Answer cache hit for collection '%s' (similarity %.3f).", collection_name, best_score)
+            return self._entries[best_id][3]
+
+    def store(self, collection_name, query_vector, fingerprint, answer):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (collection_name, fingerprint, _unit(query_vector), answer, time.time())
+            self._by_context.setdefault((collection_name, fingerprint), []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, collection_name):
+        """
+        Drops every cached answer of a collection, e.g. after it was re-indexed or deleted,
+        including the answers of federated searches (keyed by a tuple of names) over it.
+        """
+        with self._lock:
+            for entry_id in [i for i, entry in self._entries.items() if entry[0] == collection_name or (isinstance(entry[0], tuple) and collection_name in entry[0])]:
+                self._remove(entry_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _remove(self, entry_id):
+        collection_name, fingerprint, _, _, _ = self._entries.pop(entry_id)
+        ids = self._by_context[(collection_name, fingerprint)]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_context[(collection_name, fingerprint)]
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_answer_cache = AnswerCache()
+
+
+def get_answer_cache():
+    return _answer_cache
+
+
+def invalidate_collection(collection_name):
+    """Drops the cached answers of a collection that was changed or deleted."""
+    _answer_cache.invalidate(collection_name)
@@ -0,0 +1,93 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import config
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from ollama import AsyncClient
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+_executor = ThreadPoolExecutor(max_workers=config.ASYNC_POOL_WORKERS, thread_name_prefix="rag-pipeline")
+_semaphores = {}
+_async_clients = {}
+_state_lock = threading.Lock()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _stage_semaphore(stage):
+    # Semaphores and clients are bound to the event loop that uses them
+    loop = asyncio.get_running_loop()
+    with _state_lock:
+        semaphore = _semaphores.get((loop, stage))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(config.ASYNC_STAGE_CONCURRENCY.get(stage, config.ASYNC_POOL_WORKERS))
+            _semaphores[(loop, stage)] = semaphore
+        return semaphore
+
+
+@asynccontextmanager
+async def stage_slot(stage):
+    """Limits how many coroutines run the given pipeline stage at the same time."""
+    async with _stage_semaphore(stage):
+        yield
+
+
+async def run_stage(stage, function, *args, **kwargs):
+    """
+    Runs a blocking function of a pipeline stage in the bounded worker pool,
+    within the concurrency limit of the stage. The function runs in a copy of the
+    caller's context, so it sees the current metrics trace.
+    """
+    async with stage_slot(stage):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, functools.partial(context.run, function, *args, **kwargs))
+
+
+def get_async_client(host=config.OLLAMA_HOST_URL):
+    """Returns the Ollama AsyncClient of the running event loop for the given host."""
+    loop = asyncio.get_running_loop()
+    with _state_lock:
+        client = _async_clients.get((loop, host))
+        if client is None:
+            client = AsyncClient(host=host)
+            _async_clients[(loop, host)] = client
+        return client
+
+
+def _get_loop():
+    """Returns the background event loop that runs the pipeline for synchronous callers."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="rag-pipeline-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coroutine):
+    """Runs a coroutine on the background event loop and waits for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+
+def iterate_sync(async_iterator):
+    """Synchronous generator over an async iterator driven by the background event loop."""
+    loop = _get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # Release the iterator (and its stage slot) if the consumer stops early
+        if hasattr(async_iterator, "aclose"):
+            asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
@@ -0,0 +1,253 @@
+import bisect
+import logging
+import re
+import config
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.file_helper import normalize_text
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+RECURSIVE_SEPARATORS = [
+    # --- For Code and Markdown ---
+    "\n```\n",  # Code blocks
+    "\n## ",     # Markdown H2 headers
+    "\n### ",    # Markdown H3 headers
+    "\n#### ",   # Markdown H4 headers
+    # --- For Code ---
+    "\nclass ",
+    "\ndef ",
+    "\n\tdef ",
+    "\npublic ",        # Java/C#/Kotlin class or method
+    "\nprivate ",       # Java/C#/Kotlin method
+    "\nprotected ",     # Java/C#/Kotlin method
+    "\nfunction ",      # JavaScript/TypeScript function
+    "\nfunc ",          # Go/Swift function
+    "\npackage ",       # Java/Go package
+    "\nimport ",        # General import statement
+    "\nmodule ",        # Ruby/Elixir module
+    "\nBEGIN ",         # Perl block
+    "\nsub ",           # Perl subroutine
+    "\nvar ",           # JavaScript/Go variable
+    "\nlet ",           # JavaScript/TypeScript variable
+    "\nconst ",         # JavaScript/TypeScript constant
+    "\nSELECT ",        # SQL select statement
+    "\nCREATE ",        # SQL create statement
+    "\nINSERT ",        # SQL insert statement
+    "\nUPDATE ",        # SQL update statement
+    "\nDELETE ",        # SQL delete statement
+    # --- For Structured Text and Paragraphs ---
+    "\n\n",      # Double newline (paragraphs)
+    "\n",        # Newline
+    # --- For Sentences and Words ---
+    ". ",        # Periods followed by a space
+    " ",         # Spaces
+    ""           # Characters (fallback)
+]
+
+# Break points of each content type, from the most to the least preferred level.
+# Each pattern is a single alternation, so the break points of a page are found in one scan.
+# Spaces between words are the last resort of every content type and are looked up directly.
+BREAK_PATTERNS = {
+    "prose": re.compile(r"(?P<paragraph>\n[ \t\r]*\n\s*)|(?P<sentence>(?<=[.!?])\s+)|(?P<line>\n\s*)"),
+    "code": re.compile(
+        r"(?P<block>\n[ \t\r]*\n\s*)"
+        r"|(?P<definition>\n(?=[ \t]*(?:class|def|function|func|public|private|protected|package|import|module|SELECT|CREATE|INSERT|UPDATE|DELETE)\b))"
+        r"|(?P<line>\n)"
+    ),
+    "table": re.compile(r"(?P<rows>\n[ \t\r]*\n\s*)|(?P<row>\n\s*)"),
+}
+
+# Line classifiers, anchored at line starts so each line of a page matches at most once
+CODE_LINE_PATTERN = re.compile(
+    r"^(?:[ \t]*(?:def |class |import |from \S+ import|public |private |protected |function |func |var |let |const |#include"
+    r"|SELECT |CREATE |INSERT |UPDATE |DELETE |return\b|if[ \t]*\(|for[ \t]*\()|.*[{};][ \t]*$)",
+    re.MULTILINE
+)
+TABLE_LINE_PATTERN = re.compile(r"^(?:.*\|.*\||.*\t.*\t|(?:[ \t]*[-+]?[\d.,%$€]+[ \t]*){3,}$)", re.MULTILINE)
+NON_BLANK_LINE_PATTERN = re.compile(r"^[ \t\r]*\S", re.MULTILINE)
+NORMALIZATION_TABLE = str.maketrans({"\n": " ", "\r": " "})
+
+
+def detect_content_type(text):
+    """
+    Classifies the text of a page as "code", "table" or "prose" from the share of its
+    lines that look like source code or like rows of a table.
+    """
+    lines = len(NON_BLANK_LINE_PATTERN.findall(text))
+    if not lines:
+        return "prose"
+    if len(CODE_LINE_PATTERN.findall(text)) >= config.CHUNK_CODE_LINE_RATIO * lines:
+        return "code"
+    if len(TABLE_LINE_PATTERN.findall(text)) >= config.CHUNK_TABLE_LINE_RATIO * lines:
+        return "table"
+    return "prose"
+
+
+class RecursiveChunker:
+    """
+    The LangChain recursive splitter over the full separator list (code, SQL, markdown,
+    paragraphs, sentences), followed by normalization of every chunk.
+    """
+
+    name = "recursive"
+
+    def __init__(self, chunk_size=config.CHUNK_SIZE, chunk_overlap=config.CHUNK_OVERLAP):
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=RECURSIVE_SEPARATORS,
+            keep_separator=False
+        )
+
+    def split(self, page):
+        """Yields the normalized chunks of a page Document."""
+        for doc in self.text_splitter.split_documents([page]):
+            # Normalize the content of text chunks
+            doc.page_content = normalize_text(doc.page_content)
+            yield doc
+
+
+class SentenceChunker:
+    """
+    Single-pass chunker choosing its break points by the content type of each page.
+
+    The break points of a page (paragraphs, sentence ends and lines for prose; blank lines,
+    definitions and lines for code; rows for tables) are found with one regex scan, with
+    spaces between words as the last resort. Chunks are then cut greedily at the most
+    preferred break that keeps the chunk at least `min_fill` full, found by binary search.
+    The page is normalized once and chunks are slices of it; each chunk records its
+    [char_start, char_end) offsets into the page text and its detected text_type.
+    """
+
+    name = "sentence"
+
+    def __init__(
+                 self,
+                 chunk_size    = config.CHUNK_SIZE,
+                 chunk_overlap = config.CHUNK_OVERLAP,
+                 min_fill      = config.CHUNK_MIN_FILL
+                 ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_fill = min_fill
+
+    def split(self, page):
+        """Yields the normalized chunks of a page Document."""
+        text = page.page_content
+        text_type = detect_content_type(text)
+        for start, end, content in self.chunk_spans(text, text_type):
+            metadata = {**page.metadata, "text_type": text_type, "char_start": start, "char_end": end}
+            yield Document(page_content=content, metadata=metadata)
+
+    def chunk_spans(self, text, text_type="prose"):
+        """Returns (start, end, normalized_content) for the chunks of a text."""
+        if not text:
+            return []
+
+        # Normalizing the whole page keeps offsets valid when lowercasing does not change lengths
+        normalized = text.translate(NORMALIZATION_TABLE).lower()
+        if len(normalized) != len(text):
+            normalized = None
+
+        # Break points per level: separator start (end of the previous chunk) and end (start of the next)
+        pattern = BREAK_PATTERNS[text_type]
+        levels = list(pattern.groupindex)
+        break_starts = {level: [] for level in levels}
+        break_ends = {level: [] for level in levels}
+        for match in pattern.finditer(text):
+            break_starts[match.lastgroup].append(match.start())
+            break_ends[match.lastgroup].append(match.end())
+
+        spans = []
+        start = 0
+        while start < len(text):
+            limit = start + self.chunk_size
+            if limit >= len(text):
+                end, next_start = len(text), len(text)
+            else:
+                end = next_start = None
+                fallback = None
+                for level in levels:
+                    starts = break_starts[level]
+                    # Last break of the level within the chunk: a binary search, as the breaks are sorted
+                    index = bisect.bisect_right(starts, limit) - 1
+                    if index < 0 or starts[index] <= start:
+                        continue
+                    if starts[index] - start >= self.min_fill * self.chunk_size:
+                        end, next_start = starts[index], break_ends[level][index]
+                        break
+                    if fallback is None or starts[index] > fallback[0]:
+                        fallback = (starts[index], break_ends[level][index])
+                if end is None:
+                    space = text.rfind(" ", start + 1, limit + 1)
+                    if space > start and (fallback is None or space - start >= self.min_fill * self.chunk_size):
+                        end, next_start = space, _skip_spaces(text, space)
+                    else:
+                        # No break fills the chunk enough: use the latest one, or cut
+                        end, next_start = fallback if fallback is not None else (limit, limit)
+
+            spans.append(self._span(text, normalized, start, end))
+            if end >= len(text):
+                break
+
+            # The next chunk starts up to `chunk_overlap` characters back, at the most preferred
+            # break point found there (e.g. the start of a sentence rather than of a word)
+            if self.chunk_overlap > 0:
+                overlap_start = None
+                for level in levels:
+                    ends = break_ends[level]
+                    position = bisect.bisect_left(ends, end - self.chunk_overlap)
+                    if position < len(ends) and start < ends[position] < next_start:
+                        overlap_start = ends[position]
+                        break
+                if overlap_start is None:
+                    space = text.find(" ", max(end - self.chunk_overlap - 1, start + 1), next_start)
+                    if space != -1 and _skip_spaces(text, space) < next_start:
+                        overlap_start = _skip_spaces(text, space)
+                if overlap_start is not None:
+                    next_start = overlap_start
+            start = max(next_start, start + 1)
+
+        return [span for span in spans if span[2]]
+
+    @staticmethod
+    def _span(text, normalized, start, end):
+        # Leading and trailing whitespace is trimmed from the chunk and from its offsets
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        content = normalized[start:end] if normalized is not None else normalize_text(text[start:end])
+        return start, end, content
+
+
+def _skip_spaces(text, position):
+    while position < len(text) and text[position] == " ":
+        position += 1
+    return position
+
+
+CHUNKERS = {
+    RecursiveChunker.name: RecursiveChunker,
+    SentenceChunker.name: SentenceChunker,
+}
+
+
+def get_chunker(
+                name          = config.CHUNKER,
+                chunk_size    = config.CHUNK_SIZE,
+                chunk_overlap = config.CHUNK_OVERLAP
+                ):
+    """
+    Returns a chunker by name. Chunkers expose `split(page)`, yielding the normalized
+    chunk Documents of a page Document.
+    """
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{name}'. Available chunkers: {', '.join(CHUNKERS)}.")
+    return CHUNKERS[name](chunk_size=chunk_size, chunk_overlap=chunk_overlap)
@@ -0,0 +1,189 @@
+import logging
+import os
+import sqlite3
+import threading
+import config
+from datetime import datetime, timezone
+from core.rag_engine import get_engine
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class CollectionCatalog:
+    """
+    Persistent catalog of the ChromaDB collections and of the documents ingested into them:
+    source file hash, chunk count, embedding model and ingestion time.
+
+    The catalog is updated by the ingestion pipeline when a document has been written and
+    when a collection is deleted, instead of asking ChromaDB, so reading it does not scan
+    the database. Readers keep an in-memory
+    snapshot that is reloaded only when the SQLite file was changed, by this process or by
+    another one such as the bulk ingestion CLI (detected with PRAGMA data_version).
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_names = ()
+        self._snapshot_version = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS collections (name TEXT PRIMARY KEY, created_at TEXT NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "collection_name TEXT NOT NULL, document_id TEXT NOT NULL, sha256 TEXT, chunks INTEGER, "
+            "embedding_model TEXT, ingested_at TEXT, PRIMARY KEY (collection_name, document_id)"
+            ") WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0] == 0
+
+    def collection_names(self):
+        """Returns the sorted names of the collections, as a tuple shared until the catalog changes."""
+        self._current()
+        return self._snapshot_names
+
+    def get(self, collection_name):
+        """
+        Returns the catalog entry of a collection, or None if it is unknown: its documents
+        (document_id -> sha256, chunks, embedding_model, ingested_at) and their totals.
+        """
+        return self._current().get(collection_name)
+
+    def add_document(self, collection_name, document_id, sha256=None, chunks=None, embedding_model=None, ingested_at=None):
+        """Records a document ingested into a collection, replacing its previous version."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO collections (name, created_at) VALUES (?, ?)",
+                (collection_name, _now())
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (collection_name, document_id, sha256, chunks, embedding_model, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (collection_name, document_id, sha256, chunks, embedding_model, ingested_at or _now())
+            )
+            self._conn.commit()
+
+    def remove_collection(self, collection_name):
+        """Forgets a deleted collection and its documents."""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE collection_name = ?", (collection_name,))
+            self._conn.execute("DELETE FROM collections WHERE name = ?", (collection_name,))
+            self._conn.commit()
+
+    def rebuild(self, chroma_client):
+        """
+        Replaces the catalog with the collections found in ChromaDB and the ingestion
+        manifests stored in their metadata, leaving out collections without a complete
+        document. Scans every collection: used to build the catalog of an existing database
+        and on an explicit refresh only.
+        """
+        rows = []
+        for collection in chroma_client.list_collections():
+            metadata = collection.metadata or {}
+            documents = {}
+            for key, value in metadata.items():
+                document_id, _, field = key.rpartition(":")
+                if document_id and field in ("sha256", "chunks", "embedding_model", "updated_at", "status"):
+                    documents.setdefault(document_id, {})[field] = value
+            if not documents and collection.count() > 0:
+                # Collections built before ingestion manifests existed hold a single unnamed document
+                documents[""] = {"status": "complete", "chunks": collection.count()}
+            complete = [
+                (collection.name, document_id, fields.get("sha256"), fields.get("chunks"), fields.get("embedding_model"), fields.get("updated_at"))
+                for document_id, fields in documents.items() if fields.get("status") == "complete"
+            ]
+            # A collection left by a failed or cancelled first ingestion holds no complete document
+            if complete:
+                rows.append((collection.name, complete))
+
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM collections")
+            for collection_name, documents in rows:
+                self._conn.execute("INSERT INTO collections (name, created_at) VALUES (?, ?)", (collection_name, _now()))
+                self._conn.executemany(
+                    "INSERT INTO documents (collection_name, document_id, sha256, chunks, embedding_model, ingested_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    documents
+                )
+            self._conn.commit()
+        logging.info("Rebuilt the collection catalog: %d collections.", len(rows))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _current(self):
+        # data_version changes whenever another connection commits to the file; the
+        # writes of this connection reset the snapshot through the total_changes count
+        with self._lock:
+            version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._conn.total_changes)
+            if self._snapshot is None or version != self._snapshot_version:
+                self._snapshot = self._load()
+                self._snapshot_names = tuple(self._snapshot)
+                self._snapshot_version = version
+            return self._snapshot
+
+    def _load(self):
+        catalog = {
+            name: {"created_at": created_at, "documents": {}, "chunks": 0, "embedding_model": None, "ingested_at": None}
+            for name, created_at in self._conn.execute("SELECT name, created_at FROM collections ORDER BY name")
+        }
+        for collection_name, document_id, sha256, chunks, embedding_model, ingested_at in self._conn.execute(
+            "SELECT collection_name, document_id, sha256, chunks, embedding_model, ingested_at FROM documents ORDER BY ingested_at"
+        ):
+            entry = catalog.get(collection_name)
+            if entry is None:
+                continue
+            entry["documents"][document_id] = {
+                "sha256": sha256,
+                "chunks": chunks,
+                "embedding_model": embedding_model,
+                "ingested_at": ingested_at
+            }
+            entry["chunks"] += chunks or 0
+            # Documents are read in ingestion order: the last one sets the collection's model and time
+            entry["embedding_model"] = embedding_model or entry["embedding_model"]
+            entry["ingested_at"] = ingested_at
+        return catalog
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def collection_catalog_path(persist_directory=config.PERSIST_DIRECTORY):
+    return os.path.join(persist_directory, "collection_catalog.sqlite")
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_collection_catalog(persist_directory=config.PERSIST_DIRECTORY):
+    """
+    Returns the process-wide CollectionCatalog of a Chroma database, opening it on first use.
+    The catalog of a database that has none yet is built from its collections.
+    """
+    path = collection_catalog_path(persist_directory)
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None:
+            catalog = CollectionCatalog(path)
+            if catalog.is_empty():
+                catalog.rebuild(get_engine(persist_directory=persist_directory).chroma_client)
+            _catalogs[path] = catalog
+        return catalog
@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+import config
+from collections import OrderedDict
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+FIRST_SENTENCE_PATTERN = re.compile(r"(.+?[.!?])(?:\s|$)", re.DOTALL)
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+class ContextBudget:
+    """
+    Keeps the prompt of an answer within a token budget.
+
+    The chat history is cut to its most recent messages fitting `history_tokens`; older
+    messages are replaced by a short extractive summary (the first sentence of every message)
+    of at most `summary_tokens`, extended incrementally as the conversation grows. Retrieved
+    chunks are packed in rank order into `context_tokens`, after dropping chunks contained in
+    an already packed one and stripping the text they share with a neighbouring chunk of the
+    same document (the chunk overlap). Tokens are estimated from the text length with
+    `chars_per_token`, as the Ollama models expose no tokenizer.
+    """
+
+    def __init__(
+                 self,
+                 context_tokens     = config.CONTEXT_TOKEN_BUDGET,
+                 history_tokens     = config.CONTEXT_HISTORY_TOKEN_BUDGET,
+                 summary_tokens     = config.CONTEXT_SUMMARY_TOKEN_BUDGET,
+                 chars_per_token    = config.CONTEXT_CHARS_PER_TOKEN,
+                 min_overlap_chars  = config.CONTEXT_MIN_OVERLAP_CHARS,
+                 summary_cache_size = config.CONTEXT_SUMMARY_CACHE_SIZE
+                 ):
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.chars_per_token = chars_per_token
+        self.min_overlap_chars = min_overlap_chars
+        self.summary_cache_size = summary_cache_size
+
+        # hash of a history prefix -> summary lines of that prefix
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count_tokens(self, text):
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text, tokens):
+        """Cuts a text to about `tokens` tokens, at a word boundary."""
+        max_chars = int(tokens * self.chars_per_token)
+        if len(text) <= max_chars:
+            return text
+        cut = text.rfind(" ", 0, max_chars)
+        return text[:cut if cut > 0 else max_chars].rstrip() + " …"
+
+    def trim_history(self, chat_history):
+        """
+        Returns the messages of the chat history sent with the question: the most recent
+        user and assistant messages fitting the history budget, preceded by a system message
+        summarizing the older ones when some were left out.
+        """
+        messages = [msg for msg in chat_history or [] if msg['role'] in ['user', 'assistant']]
+        budget = self.history_tokens
+        start = len(messages)
+        while start > 0:
+            tokens = self.count_tokens(messages[start - 1]['content'])
+            if tokens > budget:
+                break
+            budget -= tokens
+            start -= 1
+        if start == 0:
+            return messages
+
+        kept = messages[start:]
+        if not kept:
+            # The last message alone is over the budget: it is kept, cut to the budget
+            start -= 1
+            kept = [{**messages[start], 'content': self.truncate(messages[start]['content'], self.history_tokens)}]
+        if start == 0:
+            return kept
+
+        summary = self._summarize(messages[:start])
+        logging.info("Chat history trimmed: %d messages kept, %d summarized.", len(kept), start)
+        return [{'role': 'system', 'content': f"{SUMMARY_HEADER}\n{summary}"}] + kept
+
+    def pack_documents(self, docs):
+        """
+        Packs the text of the documents, in rank order, into the context budget.
+        Returns a tuple (texts, packed_docs) of the context pieces and the documents they come from.
+        A document that does not fit is cut to the remaining budget when it is the first one,
+        and skipped otherwise, so a smaller document further down may still fit.
+        """
+        texts, packed_docs = [], []
+        packed = []  # (document key, text) of the packed pieces, for deduplication
+        budget = self.context_tokens
+        for doc in docs:
+            text = doc.page_content.strip()
+            key = _document_key(doc)
+            text = self._strip_overlap(text, [piece for piece_key, piece in packed if piece_key == key])
+            if not text:
+                continue
+            tokens = self.count_tokens(text)
+            if tokens > budget:
+                if packed_docs:
+                    continue
+                text = self.truncate(text, budget)
+                tokens = self.count_tokens(text)
+            budget -= tokens
+            packed.append((key, text))
+            texts.append(text)
+            packed_docs.append(doc)
+        return texts, packed_docs
+
+    def _strip_overlap(self, text, neighbours):
+        # Chunks of one document overlap by CHUNK_OVERLAP characters: a chunk contained in
+        # a packed one adds nothing, and the text it shares with one is only sent once
+        for neighbour in neighbours:
+            if text in neighbour:
+                return ""
+            overlap = _overlap_length(neighbour, text, self.min_overlap_chars)
+            if overlap:
+                text = text[overlap:].lstrip()
+            overlap = _overlap_length(text, neighbour, self.min_overlap_chars)
+            if overlap:
+                text = text[:-overlap].rstrip()
+            if not text:
+                return ""
+        return text
+
+    def _summarize(self, messages):
+        # Rolling hashes of the prefixes: the summary of the longest prefix summarized
+        # before is extended with the messages dropped since
+        hashes = []
+        digest = b""
+        for msg in messages:
+            digest = hashlib.blake2b(digest + msg['role'].encode() + b"\0" + msg['content'].encode(), digest_size=16).digest()
+            hashes.append(digest)
+
+        with self._lock:
+            start, lines = 0, []
+            for i in range(len(hashes) - 1, -1, -1):
+                if hashes[i] in self._summaries:
+                    start, lines = i + 1, list(self._summaries[hashes[i]])
+                    self._summaries.move_to_end(hashes[i])
+                    break
+
+        line_tokens = max(self.summary_tokens // 4, 16)
+        for msg in messages[start:]:
+            match = FIRST_SENTENCE_PATTERN.match(msg['content'].strip())
+            sentence = " ".join((match.group(1) if match else msg['content']).split())
+            lines.append(f"{'User' if msg['role'] == 'user' else 'Assistant'}: {self.truncate(sentence, line_tokens)}")
+        # The oldest lines go first when the summary is over its budget
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+
+        with self._lock:
+            self._summaries[hashes[-1]] = tuple(lines)
+            while len(self._summaries) > self.summary_cache_size:
+                self._summaries.popitem(last=False)
+        return "\n".join(lines)
+
+
+def _document_key(doc):
+    metadata = doc.metadata or {}
+    return metadata.get("collection_name"), metadata.get("document_id") or metadata.get("source")
+
+
+def _overlap_length(first, second, min_chars):
+    """Length of the longest suffix of `first` that is a prefix of `second`, if at least min_chars."""
+    probe = second[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    position = first.find(probe)
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+_context_budget = None
+_context_budget_lock = threading.Lock()
+
+
+def get_context_budget():
+    """Returns the process-wide ContextBudget, creating it on first use."""
+    global _context_budget
+    with _context_budget_lock:
+        if _context_budget is None:
+            _context_budget = ContextBudget()
+        return _context_budget
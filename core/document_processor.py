@@ -1,17 +1,34 @@
 import chromadb
 import logging
+import multiprocessing
+import os
+import threading
+from datetime import datetime, timezone
 import config
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from utils.file_helper import extract_tables_from_pdf, extract_images_from_pdf, normalize_text  
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from core.chunking import get_chunker
+from core.embedding_writer import EmbeddingWriter
+from core.metrics import start_trace, timed_iter
+from core.rag_engine import get_engine, forget_collection
+from core.answer_cache import invalidate_collection
+from core.collection_catalog import get_collection_catalog
+from core.sparse_index import get_sparse_index, delete_sparse_index
+from core.quantized_store import get_quantized_store, delete_quantized_stores
+from core.sentence_store import get_sentence_store
+from utils.file_helper import extract_pdf_shard, file_sha256, get_pdf_metadata, get_pdf_page_count
+from utils.memory_helper import current_rss_mb
 
 logging.basicConfig(
     level=config.LOGGING_LEVEL,
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
+_manifest_lock = threading.Lock()
+
+class IngestionCancelled(Exception):
+    """Raised when an ingestion is cancelled before it completes."""
+
 def delete_chroma_collection(
                               collection_name: str, 
                               persist_directory: str = config.PERSIST_DIRECTORY
@@ -26,26 +43,154 @@ def delete_chroma_collection(
     if collection_name is None or collection_name.strip() == "":
         raise ValueError("A valid collection name must be provided.")
 
-    chroma_client = chromadb.PersistentClient(path=persist_directory)
+    chroma_client = get_engine(persist_directory=persist_directory).chroma_client
 
     try:
         chroma_client.delete_collection(name=collection_name)
+        forget_collection(collection_name)
+        invalidate_collection(collection_name)
+        delete_sparse_index(collection_name, persist_directory)
+        get_sentence_store().delete_collection(collection_name)
+        delete_quantized_stores(collection_name, persist_directory)
+        get_collection_catalog(persist_directory).remove_collection(collection_name)
         logging.info("Collection '%s' has been deleted from ChromaDB.", collection_name)
     except chromadb.errors.NotFoundError:
+        get_sentence_store().delete_collection(collection_name)
+        get_collection_catalog(persist_directory).remove_collection(collection_name)
         logging.warning("Collection '%s' does not exist in ChromaDB.", collection_name)
 
+def iter_pdf_windows(
+                     pdf_path,
+                     max_workers      = config.INGEST_MAX_WORKERS,
+                     pages_per_shard  = config.INGEST_PAGES_PER_SHARD,
+                     memory_budget_mb = config.INGEST_MEMORY_BUDGET_MB
+                     ):
+    """
+    Extracts a PDF window by window, yielding (text_pages, table_docs, image_docs) for each
+    page-range shard in page order. Shards are extracted in parallel, but at most `max_workers`
+    of them are in flight ahead of the consumer, and none ahead while the resident memory of
+    the process is above `memory_budget_mb`, so memory does not grow with the page count.
+    Table indexes are left per shard; consumers number them over the whole document.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+        max_workers (int): Number of worker processes. 1 disables the process pool.
+        pages_per_shard (int): Number of pages handled by each unit of work.
+        memory_budget_mb (int): Resident memory above which prefetching stops. None disables it.
+    """
+    page_count = get_pdf_page_count(pdf_path)
+    shards = [(start, min(start + pages_per_shard, page_count)) for start in range(0, page_count, pages_per_shard)]
+    logging.info("Extracting %d pages in %d shards of up to %d pages.", page_count, len(shards), pages_per_shard)
+    # The document-level metadata is read once and shared by every shard
+    doc_metadata = get_pdf_metadata(pdf_path)
+
+    if max_workers <= 1 or len(shards) <= 1:
+        for shard in shards:
+            yield extract_pdf_shard(pdf_path, shard, doc_metadata)
+        return
+
+    def prefetch_depth():
+        rss_mb = current_rss_mb() if memory_budget_mb else None
+        if rss_mb is not None and rss_mb > memory_budget_mb:
+            logging.warning("Resident memory %.0f MB is above the %d MB budget: extracting one window at a time.", rss_mb, memory_budget_mb)
+            return 1
+        return max_workers
+
+    # Spawned workers do not inherit the threads of the parent (Streamlit, ChromaDB),
+    # which makes the pool safe to start from inside the web application.
+    with ProcessPoolExecutor(
+                             max_workers=min(max_workers, len(shards)),
+                             mp_context=multiprocessing.get_context("spawn")
+                             ) as pool:
+        # Results are yielded in submission order, so the output is deterministic
+        pending = deque()
+        next_shard = 0
+        while next_shard < len(shards) or pending:
+            while next_shard < len(shards) and len(pending) < prefetch_depth():
+                pending.append(pool.submit(extract_pdf_shard, pdf_path, shards[next_shard], doc_metadata))
+                next_shard += 1
+            yield pending.popleft().result()
+
+def extract_pdf_documents(
+                          pdf_path,
+                          max_workers     = config.INGEST_MAX_WORKERS,
+                          pages_per_shard = config.INGEST_PAGES_PER_SHARD
+                          ):
+    """
+    Extracts text pages, tables and image captions from a PDF by splitting it into page-range
+    shards that are processed in parallel, then merging the results in page order.
+    The merged output is the same as extracting the whole document sequentially.
+    Holds the whole document in memory: ingestion consumes iter_pdf_windows instead.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+        max_workers (int): Number of worker processes. 1 disables the process pool.
+        pages_per_shard (int): Number of pages handled by each unit of work.
+
+    Returns:
+        tuple: (text_pages, table_docs, image_docs)
+    """
+    text_pages, table_docs, image_docs = [], [], []
+    for shard_text, shard_tables, shard_images in iter_pdf_windows(pdf_path, max_workers, pages_per_shard, memory_budget_mb=None):
+        text_pages.extend(shard_text)
+        table_docs.extend(shard_tables)
+        image_docs.extend(shard_images)
+
+    # Table indexes are counted over the whole document, as in a single camelot pass
+    for i, table_doc in enumerate(table_docs):
+        table_doc.metadata["table_index_on_page"] = i
+
+    logging.info("Extracted %d pages of text, %d tables and %d image captions.", len(text_pages), len(table_docs), len(image_docs))
+    return text_pages, table_docs, image_docs
+
+def get_document_manifest(collection, document_id):
+    """
+    Returns the ingestion record of a document stored in the collection metadata:
+    status, version, sha256, chunks, embedding_model and updated_at. Missing fields are omitted.
+    """
+    prefix = f"{document_id}:"
+    metadata = collection.metadata or {}
+    return {key[len(prefix):]: value for key, value in metadata.items() if key.startswith(prefix)}
+
+def _update_document_manifest(chroma_client, collection, document_id, **fields):
+    # modify() replaces the whole metadata, so merge with the current one. Documents may be
+    # ingested into the same collection concurrently, so it is read fresh under a lock.
+    # HNSW settings cannot be changed after creation and are left out.
+    with _manifest_lock:
+        current = chroma_client.get_collection(name=collection.name).metadata or {}
+        metadata = {key: value for key, value in current.items() if not key.startswith("hnsw:")}
+        metadata.update({f"{document_id}:{key}": value for key, value in fields.items()})
+        collection.modify(metadata=metadata)
+
+def _is_legacy_collection(collection):
+    # Collections built before ingestion manifests existed have no metadata but hold chunks
+    return not collection.metadata and collection.count() > 0
+
 def process_pdf_to_chroma_db(
     pdf_path            = None,
     chunk_size          = config.CHUNK_SIZE,
     chunk_overlap       = config.CHUNK_OVERLAP,
     model               = config.EMBEDDING_MODEL,
     persist_directory   = config.PERSIST_DIRECTORY,
-    collection_name     = None
+    collection_name     = None,
+    update              = False,
+    progress            = None,
+    cancelled           = None
 ):
     
     """
     Processes a PDF file, extracts text, tables, and image captions,
     splits the content into chunks, and creates a Chroma database.
+
+    With `update=True`, a document that is already in the collection is re-indexed
+    incrementally: chunks are identified by page and content hash, so only new chunks
+    are embedded and only chunks that disappeared from the new version are deleted.
+
+    An optional `progress(stage, done, total)` callback receives the progress of the
+    "extract", "split", "embed" and "write" stages. An optional `cancelled()` callable
+    is polled between pages; when it returns True the run stops with IngestionCancelled
+    and the document is left in progress, so it is resumed by the next run.
+    The stages are timed in an "ingest" metrics trace when METRICS_ENABLED is on.
     """ 
 
     if pdf_path is None or pdf_path.strip() == "":
@@ -54,88 +199,138 @@ def process_pdf_to_chroma_db(
     if collection_name is None:
         collection_name = pdf_path.split("/")[-1].replace(".pdf", "_collection")
 
-    chroma_client = chromadb.PersistentClient(path=persist_directory)
+    trace = start_trace("ingest", document=os.path.basename(pdf_path), collection=collection_name)
     try:
-        if chroma_client.get_collection(name=collection_name):
-            logging.info(f"Collection '%s' already exists in ChromaDB. Skipping processing.", collection_name)
-            return
-    except Exception:
-        pass  # Collection does not exist, proceed with processing
-
-    # Extract non-text elements (tables and images)
-
-    table_docs = extract_tables_from_pdf(pdf_path)
-    image_docs = extract_images_from_pdf(pdf_path)
-
-    # Extract text using LangChain's PyMuPDFLoader
-    logging.info("Extracting text with PyMuPDFLoader...")
-    loader = PyMuPDFLoader(pdf_path)
-    text_pages = loader.load()
-    logging.info(f"Extracted {len(text_pages)} pages of text.")
-
-    # Split the text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        
-        separators=[
-            # --- For Code and Markdown ---
-            "\n```\n",  # Code blocks
-            "\n## ",     # Markdown H2 headers
-            "\n### ",    # Markdown H3 headers
-            "\n#### ",   # Markdown H4 headers
-            # --- For Code ---
-            "\nclass ",
-            "\ndef ",
-            "\n\tdef ",
-            "\npublic ",        # Java/C#/Kotlin class or method
-            "\nprivate ",       # Java/C#/Kotlin method
-            "\nprotected ",     # Java/C#/Kotlin method
-            "\nfunction ",      # JavaScript/TypeScript function
-            "\nfunc ",          # Go/Swift function
-            "\npackage ",       # Java/Go package
-            "\nimport ",        # General import statement
-            "\nmodule ",        # Ruby/Elixir module
-            "\nBEGIN ",         # Perl block
-            "\nsub ",           # Perl subroutine
-            "\nvar ",           # JavaScript/Go variable
-            "\nlet ",           # JavaScript/TypeScript variable
-            "\nconst ",         # JavaScript/TypeScript constant
-            "\nSELECT ",        # SQL select statement
-            "\nCREATE ",        # SQL create statement
-            "\nINSERT ",        # SQL insert statement
-            "\nUPDATE ",        # SQL update statement
-            "\nDELETE ",        # SQL delete statement
-            # --- For Structured Text and Paragraphs ---
-            "\n\n",      # Double newline (paragraphs)
-            "\n",        # Newline
-            # --- For Sentences and Words ---
-            ". ",        # Periods followed by a space
-            " ",         # Spaces
-            ""           # Characters (fallback)
-        ],
-        keep_separator=False
+        result = _process_pdf(pdf_path, chunk_size, chunk_overlap, model, persist_directory, collection_name, update, progress, cancelled, trace)
+    except BaseException as e:
+        trace.finish(status="cancelled" if isinstance(e, IngestionCancelled) else "failed", error=type(e).__name__)
+        raise
+    trace.finish(status="skipped" if result is None else "complete", **(result or {}))
+    return result
+
+def _process_pdf(pdf_path, chunk_size, chunk_overlap, model, persist_directory, collection_name, update, progress, cancelled, trace):
+
+    engine = get_engine(embedding_model=model, persist_directory=persist_directory)
+    chroma_client = engine.chroma_client
+    document_id = os.path.basename(pdf_path)
+    file_hash = file_sha256(pdf_path)
+
+    collection = chroma_client.get_or_create_collection(name=collection_name, embedding_function=None)
+    manifest = get_document_manifest(collection, document_id)
+    complete = manifest.get("status") == "complete" or _is_legacy_collection(collection)
+
+    if complete and not update:
+        logging.info("Collection '%s' already exists in ChromaDB. Skipping processing.", collection_name)
+        return
+    if complete and manifest.get("sha256") == file_hash:
+        logging.info("Document '%s' in collection '%s' is up to date. Skipping processing.", document_id, collection_name)
+        return
+    if manifest.get("status") == "in_progress":
+        logging.info("Document '%s' was not fully ingested. Resuming processing.", document_id)
+
+    # Chunks of the previous version of the document, used to find the ones to delete.
+    # Legacy collections hold a single document whose chunks carry no document_id.
+    if _is_legacy_collection(collection):
+        previous_ids = set(collection.get(include=[])["ids"])
+    else:
+        previous_ids = set(collection.get(where={"document_id": document_id}, include=[])["ids"])
+    version = manifest.get("version", 0) + (1 if manifest.get("status") == "complete" else 0)
+    _update_document_manifest(chroma_client, collection, document_id, status="in_progress", version=max(version, 1))
+
+    def report(stage, done, total):
+        if progress is not None:
+            progress(stage, done, total)
+
+    def check_cancelled():
+        if cancelled is not None and cancelled():
+            logging.info("Ingestion of '%s' into '%s' was cancelled.", document_id, collection_name)
+            raise IngestionCancelled(f"Ingestion of '{document_id}' was cancelled.")
+
+    # Split the text into chunks with the configured chunker
+    chunker = get_chunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    # Extract, split and embed the document window by window: only the windows being
+    # extracted and the chunks queued in the writer are held in memory at any time.
+    page_count = get_pdf_page_count(pdf_path)
+    pages_done = 0
+    text_chunk_count = 0
+    table_count = 0
+    image_count = 0
+    sparse_index = get_sparse_index(collection_name, persist_directory)
+    indexes = [sparse_index]
+    if config.SENTENCE_INDEX_AT_INGESTION:
+        # Precompute the sentences used to highlight passages, off the query path
+        indexes.append(get_sentence_store().for_collection(collection_name))
+    with EmbeddingWriter(collection, engine.embeddings, document_id=document_id, indexes=indexes, progress=progress, trace=trace) as writer:
+        report("extract", 0, page_count)
+        for text_pages, table_docs, image_docs in timed_iter(trace, "extract", iter_pdf_windows(pdf_path)):
+            report("extract", pages_done + len(text_pages), page_count)
+            for page in text_pages:
+                check_cancelled()
+                # Stream chunks to the embedding writer as soon as the splitter produces them
+                # Chunks come out normalized
+                for doc in timed_iter(trace, "split", chunker.split(page)):
+                    doc.metadata["document_id"] = document_id
+                    # Time spent blocked on a full writer queue: embedding is the bottleneck
+                    with trace.span("queue_wait"):
+                        writer.put(doc)
+                    text_chunk_count += 1
+                pages_done += 1
+                report("split", pages_done, page_count)
+
+            # Table indexes are counted over the whole document, as in a single camelot pass
+            for table_doc in table_docs:
+                table_doc.metadata["table_index_on_page"] = table_count
+                table_count += 1
+            for doc in table_docs + image_docs:
+                doc.metadata["document_id"] = document_id
+                writer.put(doc)
+            image_count += len(image_docs)
+
+    logging.info(f"Splitted text into {text_chunk_count} chunks.")
+    logging.info(f"Text documents: {text_chunk_count}, Table documents: {table_count}, Image documents: {image_count}")
+
+    # Remove the chunks of the previous version that are not part of the new one
+    removed_ids = sorted(previous_ids - writer.chunk_ids)
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+        sparse_index.delete(removed_ids)
+        get_sentence_store().delete_chunks(collection_name, removed_ids)
+    logging.info("Added %d chunks and removed %d chunks of '%s'.", writer.stats["embedded"], len(removed_ids), document_id)
+
+    # Mark the document as complete, so a later run does not resume it
+    ingested_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    _update_document_manifest(
+        chroma_client,
+        collection,
+        document_id,
+        status="complete",
+        version=max(version, 1),
+        sha256=file_hash,
+        chunks=len(writer.chunk_ids),
+        embedding_model=model,
+        updated_at=ingested_at
     )
-    text_docs = text_splitter.split_documents(text_pages)
-
-    # Normalize the content of text chunks
-    for doc in text_docs:
-        doc.page_content = normalize_text(doc.page_content)
-
-    logging.info(f"Splitted text into {len(text_docs)} chunks.")
-
-    # Combine all documents
-    docs = text_docs + table_docs + image_docs
-    logging.info(f"Total documents to be indexed: {len(docs)}")
-    logging.info(f"Text documents: {len(text_docs)}, Table documents: {len(table_docs)}, Image documents: {len(image_docs)}")
-
-    # Initialize embeddings and create the Chroma database
-    embeddings = OllamaEmbeddings(model=model)
-    Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=persist_directory,
-        collection_name=collection_name,
+    # The catalog records the collection with its first complete document, so a failed or
+    # cancelled ingestion into a new collection does not list it
+    get_collection_catalog(persist_directory).add_document(
+        collection_name,
+        document_id,
+        sha256=file_hash,
+        chunks=len(writer.chunk_ids),
+        embedding_model=model,
+        ingested_at=ingested_at
     )
+    forget_collection(collection_name)
+    invalidate_collection(collection_name)
+    if config.QUANTIZED_VECTORS:
+        # Rebuilt here rather than on the next query, which would otherwise pay for it
+        with trace.span("quantize"):
+            get_quantized_store(collection_name, persist_directory, config.QUANTIZED_VECTORS).build(collection)
 
     logging.info("Chroma database created at %s with collection name '%s'.", persist_directory, collection_name)
+    return {
+        "pages": pages_done,
+        "chunks": text_chunk_count + table_count + image_count,
+        "removed": len(removed_ids),
+        **writer.stats
+    }
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import config
+from langchain_core.embeddings import Embeddings
+from utils.file_helper import normalize_text
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of embedding vectors stored in SQLite.
+
+    Entries are keyed by a hash of the embedding model name and the normalized text,
+    and stored as raw float32 arrays. When the stored vectors exceed `max_size_mb`,
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=config.EMBEDDING_CACHE_PATH, max_size_mb=config.EMBEDDING_CACHE_MAX_MB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\x1f{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """Returns a list with the cached vector of each text, or None where it is not cached."""
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None for key in keys]
+
+    def put_many(self, model, texts, vectors):
+        """Stores the vectors of the given texts, evicting old entries if the cache is full."""
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            for key, blob, _ in rows:
+                previous = self._conn.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._size_bytes += len(blob) - (previous[0] if previous else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows)
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Evict down to 90% of the cap so that eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            keys = []
+            for key, size in rows:
+                keys.append((key,))
+                self._size_bytes -= size
+                if self._size_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+            evicted += len(keys)
+        logging.info("Embedding cache evicted %d entries.", evicted)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_mb": self._size_bytes / (1024 * 1024),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings wrapper that serves vectors from an EmbeddingCache and only sends
+    the texts that are not cached to the underlying embeddings model.
+    """
+
+    def __init__(self, embeddings, model, cache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model, texts)
+
+        # Texts that normalize to the same key are embedded only once
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(self.cache.make_key(self.model, texts[i]), []).append(i)
+
+        if missing:
+            missing_texts = [texts[indexes[0]] for indexes in missing.values()]
+            new_vectors = self.embeddings.embed_documents(missing_texts)
+            self.cache.put_many(self.model, missing_texts, new_vectors)
+            for indexes, vector in zip(missing.values(), new_vectors):
+                for i in indexes:
+                    vectors[i] = list(vector)
+        return vectors
+
+    def embed_query(self, text):
+        vector = self.cache.get_many(self.model, [text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path=config.EMBEDDING_CACHE_PATH):
+    """Returns the process-wide EmbeddingCache stored at `path`."""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = EmbeddingCache(path=path)
+            _caches[path] = cache
+        return cache
@@ -0,0 +1,242 @@
+import logging
+import queue
+import threading
+import time
+import config
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from core.metrics import current_trace
+from utils.file_helper import chunk_fingerprint
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+_END_OF_STREAM = object()
+
+
+class EmbeddingWriter:
+    """
+    Streams chunks into a ChromaDB collection, embedding them in batches.
+
+    Chunks are pushed with `put()` into a bounded queue as soon as they are produced;
+    a dispatcher thread groups them into batches and embeds up to `max_in_flight` batches
+    concurrently. Failed batches are retried with exponential backoff, and every batch
+    is upserted as soon as it is embedded under a stable chunk ID, so an interrupted run
+    resumes by skipping the chunks that are already stored. Secondary indexes passed in
+    `indexes` (objects with `add(chunk_ids, texts, replace)`, such as the sparse index)
+    receive the same chunks as they are written. An optional `progress(stage, done, total)`
+    callback is told how many of the received chunks are embedded ("embed") and written ("write").
+    Every batch is timed in `trace` (by default the current metrics trace of the caller).
+
+    Usage:
+        with EmbeddingWriter(collection, embeddings, document_id="manual.pdf") as writer:
+            for doc in docs:
+                writer.put(doc)
+    """
+
+    def __init__(
+                 self,
+                 collection,
+                 embeddings,
+                 document_id   = "",
+                 indexes       = (),
+                 batch_size    = config.EMBEDDING_BATCH_SIZE,
+                 max_in_flight = config.EMBEDDING_MAX_IN_FLIGHT,
+                 queue_size    = config.EMBEDDING_QUEUE_SIZE,
+                 max_retries   = config.EMBEDDING_MAX_RETRIES,
+                 retry_backoff = config.EMBEDDING_RETRY_BACKOFF,
+                 progress      = None,
+                 trace         = None
+                 ):
+        if batch_size < 1 or max_in_flight < 1:
+            raise ValueError("batch_size and max_in_flight must be at least 1.")
+
+        self.collection = collection
+        self.embeddings = embeddings
+        self.document_id = document_id
+        self.indexes = list(indexes)
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.progress = progress
+        # The batches run in pool threads, outside the context of the caller
+        self.trace = trace if trace is not None else current_trace()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._in_flight = threading.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embedding-writer")
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._seen_ids = Counter()
+        self.chunk_ids = set()
+        self._futures = []
+        self._error = None
+        self._aborted = False
+        self._dispatcher = None
+        self._progress_counts = Counter()
+
+        self.stats = {"received": 0, "skipped": 0, "embedded": 0, "batches": 0, "retries": 0, "failed_batches": 0}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # On error (or cancellation) the queued chunks are dropped instead of embedded
+        self._aborted = exc_type is not None
+        self.close(raise_on_error=exc_type is None)
+        return False
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch, name="embedding-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def put(self, doc):
+        """Queues a chunk for embedding. Blocks while the queue is full."""
+        if self._dispatcher is None:
+            self.start()
+        self._queue.put(doc)
+
+    def close(self, raise_on_error=True):
+        """
+        Flushes the queued chunks, waits for the in-flight batches and returns the writer stats.
+        Raises RuntimeError if a batch could not be embedded after all retries, or written.
+        """
+        try:
+            if self._dispatcher is not None:
+                self._queue.put(_END_OF_STREAM)
+                self._dispatcher.join()
+                self._dispatcher = None
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+        logging.info("Embedding writer finished: %s", self.stats)
+        if self._error is not None and raise_on_error:
+            raise RuntimeError(f"Embedding writer failed: {self._error}") from self._error
+        return dict(self.stats)
+
+    def _next_chunk_id(self, doc):
+        # Identical chunks on the same page get an occurrence suffix to keep IDs unique
+        base_id = chunk_fingerprint(doc, self.document_id)
+        self._seen_ids[base_id] += 1
+        occurrence = self._seen_ids[base_id]
+        chunk_id = base_id if occurrence == 1 else f"{base_id}-{occurrence}"
+        self.chunk_ids.add(chunk_id)
+        return chunk_id
+
+    def _dispatch(self):
+        batch = []
+        while True:
+            doc = self._queue.get()
+            if doc is _END_OF_STREAM:
+                break
+            if self._error is not None or self._aborted:
+                # A batch failed for good or the run was aborted: drain the queue so producers are not blocked
+                continue
+            try:
+                self.stats["received"] += 1
+                batch.append((self._next_chunk_id(doc), doc))
+                if len(batch) >= self.batch_size:
+                    self._submit(batch)
+                    batch = []
+            except Exception as e:
+                # The dispatcher keeps draining the queue, or put() and close() would block forever
+                logging.exception("Dispatching a batch of %d chunks failed.", len(batch))
+                self._fail(e)
+                batch = []
+        if batch and self._error is None and not self._aborted:
+            try:
+                self._submit(batch)
+            except Exception as e:
+                logging.exception("Dispatching a batch of %d chunks failed.", len(batch))
+                self._fail(e)
+
+    def _submit(self, batch):
+        # Chunks stored by a previous, interrupted run are not embedded again
+        ids = [chunk_id for chunk_id, _ in batch]
+        with self._write_lock:
+            existing = set(self.collection.get(ids=ids, include=[])["ids"])
+        if existing and self.indexes:
+            # A run interrupted between the writes may have left them out of the secondary indexes
+            stored = [(chunk_id, doc.page_content) for chunk_id, doc in batch if chunk_id in existing]
+            for index in self.indexes:
+                index.add([chunk_id for chunk_id, _ in stored], [text for _, text in stored], replace=False)
+        batch = [(chunk_id, doc) for chunk_id, doc in batch if chunk_id not in existing]
+        with self._stats_lock:
+            self.stats["skipped"] += len(existing)
+        self._report("embed", len(existing))
+        self._report("write", len(existing))
+        if not batch:
+            return
+
+        self._in_flight.acquire()
+        try:
+            future = self._executor.submit(self._write_batch, batch)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._futures.append(future)
+
+    def _write_batch(self, batch):
+        try:
+            self._embed_and_write(batch)
+        except Exception as e:
+            logging.exception("Writing a batch of %d chunks failed.", len(batch))
+            self._fail(e)
+
+    def _fail(self, error):
+        with self._stats_lock:
+            self.stats["failed_batches"] += 1
+            if self._error is None:
+                self._error = error
+
+    def _embed_and_write(self, batch):
+        texts = [doc.page_content for _, doc in batch]
+        with self.trace.span("embed", chunks=len(batch)) as stage:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    vectors = self.embeddings.embed_documents(texts)
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        logging.error("Embedding batch of %d chunks failed after %d retries: %s", len(batch), self.max_retries, e)
+                        self._fail(e)
+                        stage.set(errors=1)
+                        return
+                    delay = self.retry_backoff * (2 ** attempt)
+                    logging.warning("Embedding batch failed (%s), retrying in %.1fs.", e, delay)
+                    with self._stats_lock:
+                        self.stats["retries"] += 1
+                    stage.set(retries=attempt + 1)
+                    time.sleep(delay)
+        self._report("embed", len(batch))
+
+        with self.trace.span("write", chunks=len(batch)):
+            with self._write_lock:
+                self.collection.upsert(
+                    ids=[chunk_id for chunk_id, _ in batch],
+                    embeddings=vectors,
+                    metadatas=[doc.metadata or None for _, doc in batch],
+                    documents=texts
+                )
+            for index in self.indexes:
+                index.add([chunk_id for chunk_id, _ in batch], texts)
+        with self._stats_lock:
+            self.stats["embedded"] += len(batch)
+            self.stats["batches"] += 1
+        self._report("write", len(batch))
+
+    def _report(self, stage, count):
+        if self.progress is None or count == 0:
+            return
+        with self._stats_lock:
+            self._progress_counts[stage] += count
+            done = self._progress_counts[stage]
+        self.progress(stage, done, self.stats["received"])
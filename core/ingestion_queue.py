@@ -0,0 +1,327 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import config
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+INGESTION_STAGES = ("extract", "split", "embed", "write")
+ACTIVE_STATUSES = ("queued", "running")
+
+_JOB_COLUMNS = (
+    "id", "file_name", "file_hash", "file_path", "collection_name", "status", "stage", "progress",
+    "cancel_requested", "error", "result", "worker_pid", "created_at", "started_at", "finished_at"
+)
+
+
+class IngestionQueue:
+    """
+    Persistent queue of PDF ingestion jobs run in the background of the web application.
+
+    Jobs are rows of an SQLite database, so they survive restarts: jobs left running by a process
+    that died are queued again and resume from the chunks already stored. Uploads are kept under
+    a directory of their own per (file hash, collection), and a file that is already queued or
+    being ingested into the same collection is not queued twice.
+
+    The workers are threads of the application process. ChromaDB's PersistentClient is not
+    process-safe: a client that has loaded a collection does not see vectors written to it by
+    another process, so every write goes through the application's own client, and the caches
+    of the application (vector stores, answers, catalog) are invalidated by the jobs themselves.
+    The CPU-bound PDF extraction still runs in worker processes (see iter_pdf_windows), which
+    only return the extracted documents.
+    """
+
+    def __init__(
+                 self,
+                 path             = config.INGESTION_QUEUE_PATH,
+                 upload_directory = config.INGESTION_UPLOAD_DIRECTORY
+                 ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.upload_directory = upload_directory
+        self._lock = threading.Lock()
+        self._workers = []
+        self._stop_event = None
+
+        # Autocommit mode: transactions are opened explicitly where jobs are claimed
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT NOT NULL, file_hash TEXT NOT NULL, "
+            "file_path TEXT NOT NULL, collection_name TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, "
+            "progress TEXT NOT NULL DEFAULT '{}', cancel_requested INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            "result TEXT, worker_pid INTEGER, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_file ON jobs(file_hash, collection_name)")
+
+    def submit(self, file_name, data, collection_name):
+        """
+        Stores an uploaded PDF and queues its ingestion into a collection.
+        Returns the job, or the already active job of the same file and collection.
+
+        Args:
+            file_name (str): Original name of the file, used as the document ID.
+            data (bytes): Content of the PDF file.
+            collection_name (str): Name of the target collection.
+        """
+        file_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE file_hash = ? AND collection_name = ? "
+                f"AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))}) ORDER BY id LIMIT 1",
+                (file_hash, collection_name, *ACTIVE_STATUSES)
+            ).fetchone()
+            if row is not None:
+                logging.info("'%s' is already queued for collection '%s' (job %d).", file_name, collection_name, row[0])
+                return _job_from_row(row)
+
+            job_directory = os.path.join(self.upload_directory, hashlib.sha256(f"{file_hash}\x1f{collection_name}".encode("utf-8")).hexdigest()[:32])
+            os.makedirs(job_directory, exist_ok=True)
+            file_path = os.path.join(job_directory, os.path.basename(file_name))
+            with open(file_path, "wb") as upload:
+                upload.write(data)
+
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (file_name, file_hash, file_path, collection_name, status, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?)",
+                (file_name, file_hash, file_path, collection_name, time.time())
+            )
+            job_id = cursor.lastrowid
+        logging.info("Queued ingestion of '%s' into collection '%s' (job %d).", file_name, collection_name, job_id)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row is not None else None
+
+    def list_jobs(self, limit=20):
+        """Returns the most recent jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. A queued job is cancelled at once; a running job stops at the
+        next page boundary and its document is resumed if the file is queued again.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id)
+            )
+            if cursor.rowcount == 0:
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        if cursor.rowcount:
+            self._remove_upload(self.get(job_id))
+        logging.info("Cancellation of job %d requested.", job_id)
+
+    def is_cancel_requested(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def start_workers(self, worker_count=config.INGESTION_QUEUE_WORKERS):
+        """Starts the worker threads that run the queued jobs, if they are not running yet."""
+        with self._lock:
+            if self._workers:
+                return
+            self._requeue_orphaned_jobs()
+
+            # Daemon threads: a job interrupted by the exit of the application is queued again at the next start
+            self._stop_event = threading.Event()
+            for _ in range(max(1, worker_count)):
+                worker = threading.Thread(target=self._work, args=(self._stop_event,), name="ingestion-worker", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        atexit.register(self.stop_workers)
+        logging.info("Started %d ingestion workers.", len(self._workers))
+
+    def stop_workers(self, timeout=5):
+        """
+        Stops the worker threads once their current job reaches a page boundary.
+        Jobs still running after `timeout` seconds are queued again at the next start.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+            if self._stop_event is not None:
+                self._stop_event.set()
+        for worker in workers:
+            worker.join(timeout)
+
+    def _work(self, stop_event):
+        """Runs queued jobs until stopped."""
+        while not stop_event.is_set():
+            job = self._claim(os.getpid())
+            if job is None:
+                stop_event.wait(config.INGESTION_POLL_SECONDS)
+                continue
+            self._run(job, stop_event)
+
+    def _requeue_orphaned_jobs(self):
+        # Jobs are run by threads of one process: those of a process that is gone were interrupted
+        rows = self._conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+        for job_id, worker_pid in rows:
+            if worker_pid is None or worker_pid == os.getpid() or not _process_alive(worker_pid):
+                self._conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL WHERE id = ?", (job_id,))
+                logging.info("Job %d was interrupted and has been queued again.", job_id)
+
+    def _claim(self, worker_pid):
+        # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same job
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ? WHERE id = ?",
+                        (worker_pid, time.time(), row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def _update_progress(self, job_id, stage, progress):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (stage, json.dumps(progress), job_id))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def _requeue(self, job_id):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL WHERE id = ?", (job_id,))
+
+    def _remove_upload(self, job):
+        if job is not None:
+            shutil.rmtree(os.path.dirname(job["file_path"]), ignore_errors=True)
+
+    def _run(self, job, stop_event=None):
+        # Imported here: the ingestion stack is only loaded once a job runs
+        from core.document_processor import IngestionCancelled, process_pdf_to_chroma_db
+
+        job_id = job["id"]
+        reporter = _ProgressReporter(self, job_id, stop_event)
+        logging.info("Worker %s started job %d: '%s' into '%s'.", threading.current_thread().name, job_id, job["file_name"], job["collection_name"])
+        try:
+            result = process_pdf_to_chroma_db(
+                pdf_path=job["file_path"],
+                persist_directory=config.PERSIST_DIRECTORY,
+                model=config.EMBEDDING_MODEL,
+                collection_name=job["collection_name"],
+                update=True,
+                progress=reporter.progress,
+                cancelled=reporter.cancelled
+            )
+            reporter.flush()
+            self._finish(job_id, "completed", result=result)
+            self._remove_upload(job)
+            logging.info("Job %d completed: %s", job_id, result)
+        except IngestionCancelled:
+            reporter.flush()
+            if stop_event is not None and stop_event.is_set() and not self.is_cancel_requested(job_id):
+                # Stopped with the application: resumed at the next start, from the chunks already
+                # stored, so the upload is kept
+                self._requeue(job_id)
+                logging.info("Job %d was interrupted and has been queued again.", job_id)
+                return
+            self._finish(job_id, "cancelled")
+            self._remove_upload(job)
+        except Exception as e:
+            logging.exception("Job %d failed.", job_id)
+            reporter.flush()
+            self._finish(job_id, "failed", error=str(e))
+            self._remove_upload(job)
+
+
+class _ProgressReporter:
+    """Records the stage progress of a running job, writing it at most every INGESTION_PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, job_queue, job_id, stop_event=None):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.stop_event = stop_event
+        self.stages = {}
+        self.stage = None
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self._last_cancel_check = 0.0
+        self._cancelled = False
+
+    def progress(self, stage, done, total):
+        # Called from the embedding writer threads as well as from the ingestion loop
+        # Stages interleave as the document is processed window by window, so writes are only throttled
+        with self._lock:
+            self.stage = stage
+            self.stages[stage] = [done, total]
+            now = time.monotonic()
+            if now - self._last_write >= config.INGESTION_PROGRESS_INTERVAL:
+                self._last_write = now
+                self.job_queue._update_progress(self.job_id, self.stage, self.stages)
+
+    def cancelled(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        now = time.monotonic()
+        if not self._cancelled and now - self._last_cancel_check >= config.INGESTION_PROGRESS_INTERVAL:
+            self._last_cancel_check = now
+            self._cancelled = self.job_queue.is_cancel_requested(self.job_id)
+        return self._cancelled
+
+    def flush(self):
+        with self._lock:
+            self.job_queue._update_progress(self.job_id, self.stage, self.stages)
+
+
+def _job_from_row(row):
+    job = dict(zip(_JOB_COLUMNS, row))
+    job["progress"] = json.loads(job["progress"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_ingestion_queue(start_workers=True):
+    """Returns the process-wide IngestionQueue, starting its worker threads on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestionQueue()
+    if start_workers:
+        _queue.start_workers()
+    return _queue
@@ -0,0 +1,319 @@
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+import config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+_sinks = []
+_sinks_lock = threading.Lock()
+_default_sinks_ready = False
+
+
+class _NullSpan:
+    """Span of a disabled trace: records nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **counts):
+        pass
+
+
+class _NullTrace:
+    """Trace returned when instrumentation is disabled, so call sites never test for it."""
+
+    enabled = False
+    kind = None
+    trace_id = None
+
+    def span(self, stage, **counts):
+        return _NULL_SPAN
+
+    def record(self, stage, seconds, **counts):
+        pass
+
+    def summary(self):
+        return {}
+
+    def finish(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_TRACE = _NullTrace()
+
+
+class _Span:
+    def __init__(self, trace, stage, counts):
+        self.trace = trace
+        self.stage = stage
+        self.counts = counts
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.counts["errors"] = self.counts.get("errors", 0) + 1
+        self.trace.record(self.stage, time.perf_counter() - self.start, **self.counts)
+        return False
+
+    def set(self, **counts):
+        """Sets counts (tokens, documents, chunks...) known only once the stage has run."""
+        self.counts.update(counts)
+
+
+class Trace:
+    """
+    Per-request record of the stages of a query or of an ingestion run.
+
+    Every stage records its wall time and optional counts (documents, tokens, chunks...).
+    Stages may run in several threads and the same stage may run several times, e.g. one
+    embedding batch per span; `summary()` aggregates them per stage. `finish()` writes the
+    trace as one structured log line and hands it to the registered metrics sinks.
+
+    Usage:
+        trace = start_trace("query", collection="manual_collection")
+        with trace.span("rerank", documents=len(docs)) as span:
+            docs = rerank(docs)
+            span.set(selected=len(docs))
+        trace.finish()
+    """
+
+    enabled = True
+
+    def __init__(self, kind, **attributes):
+        self.kind = kind
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.spans = []
+        self._finished = False
+        self._context_token = None
+
+    def span(self, stage, **counts):
+        """Context manager timing a stage of the trace."""
+        return _Span(self, stage, counts)
+
+    def record(self, stage, seconds, **counts):
+        """Records a stage timed by the caller."""
+        # list.append is atomic, so spans of concurrent threads need no lock
+        self.spans.append((stage, seconds, counts))
+
+    def summary(self):
+        """Returns {stage: {"seconds": total, "calls": n, **summed counts}} in order of first occurrence."""
+        stages = {}
+        for stage, seconds, counts in list(self.spans):
+            entry = stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            for key, value in counts.items():
+                if isinstance(value, (int, float)):
+                    entry[key] = entry.get(key, 0) + value
+        return stages
+
+    def finish(self, **attributes):
+        """Ends the trace: logs it and sends it to the metrics sinks. Later calls do nothing."""
+        if self._finished:
+            return
+        self._finished = True
+        self.attributes.update(attributes)
+        self.seconds = time.perf_counter() - self.started
+        self._leave_context()
+
+        logging.info("trace %s", json.dumps({
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "seconds": round(self.seconds, 4),
+            **self.attributes,
+            "stages": {
+                stage: {key: round(value, 4) if isinstance(value, float) else value for key, value in entry.items()}
+                for stage, entry in self.summary().items()
+            }
+        }, default=str))
+        for sink in get_sinks():
+            try:
+                sink.observe(self)
+            except Exception as e:
+                logging.warning("Metrics sink %s failed: %s", type(sink).__name__, e)
+
+    def _leave_context(self):
+        # Restores the trace that was current before start_trace. A trace finished from another
+        # context (e.g. an async generator resumed by another task) cannot reset the token there
+        token, self._context_token = self._context_token, None
+        if token is None:
+            return
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            if _current_trace.get() is self:
+                _current_trace.set(None)
+
+
+def start_trace(kind, **attributes):
+    """
+    Starts a trace of the given kind ("query", "ingest") and makes it the current trace
+    of the calling context. Returns NULL_TRACE, which records nothing, when METRICS_ENABLED is off.
+    """
+    if not config.METRICS_ENABLED:
+        return NULL_TRACE
+    trace = Trace(kind, **attributes)
+    trace._context_token = _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    """Returns the trace of the calling context, or NULL_TRACE."""
+    return _current_trace.get() or NULL_TRACE
+
+
+def use_trace(trace):
+    """Makes `trace` the current trace of the calling context (e.g. a worker thread)."""
+    _current_trace.set(trace if trace is not NULL_TRACE else None)
+
+
+def span(stage, **counts):
+    """Times a stage of the current trace. A shared no-op when there is no current trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return trace.span(stage, **counts)
+
+
+class PrometheusSink:
+    """
+    Aggregates finished traces into Prometheus metrics, rendered in the text exposition format:
+
+        rag_stage_seconds{kind,stage}         histogram of stage wall times
+        rag_stage_count_total{kind,stage,count} sum of the stage counts (tokens, documents...)
+        rag_trace_seconds{kind}               histogram of whole request times
+    """
+
+    def __init__(self, buckets=config.METRICS_HISTOGRAM_BUCKETS):
+        self.buckets = sorted(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, trace):
+        with self._lock:
+            self._observe("rag_trace_seconds", (("kind", trace.kind),), trace.seconds)
+            for stage, seconds, counts in list(trace.spans):
+                labels = (("kind", trace.kind), ("stage", stage))
+                self._observe("rag_stage_seconds", labels, seconds)
+                for key, value in counts.items():
+                    if isinstance(value, (int, float)):
+                        counter_key = ("rag_stage_count_total", labels + (("count", key),))
+                        self._counters[counter_key] = self._counters.get(counter_key, 0) + value
+
+    def _observe(self, name, labels, value):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = [[0] * (len(self.buckets) + 1), 0.0]
+        histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+
+    def render(self):
+        """Returns the metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for name in ("rag_trace_seconds", "rag_stage_seconds"):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), (counts, total) in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + [float("inf")], counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            lines.append("# TYPE rag_stage_count_total counter")
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+def start_metrics_server(sink, port=config.METRICS_PROMETHEUS_PORT, host=config.METRICS_PROMETHEUS_HOST):
+    """Serves the metrics of a PrometheusSink on http://host:port/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = sink.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Metrics server: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info("Serving Prometheus metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def register_sink(sink):
+    """Adds a metrics sink: any object with an `observe(trace)` method, called for every finished trace."""
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def get_sinks():
+    """Returns the registered sinks, setting up the Prometheus sink on first use when it is configured."""
+    global _default_sinks_ready
+    if not _default_sinks_ready:
+        with _sinks_lock:
+            if not _default_sinks_ready:
+                _default_sinks_ready = True
+                if config.METRICS_PROMETHEUS_PORT:
+                    sink = PrometheusSink()
+                    try:
+                        start_metrics_server(sink)
+                        _sinks.append(sink)
+                    except OSError as e:
+                        # e.g. another process (an ingestion worker) already serves the port
+                        logging.warning("Could not serve Prometheus metrics on port %s: %s", config.METRICS_PROMETHEUS_PORT, e)
+    return list(_sinks)
+
+
+def timed_iter(trace, stage, iterable):
+    """Yields the items of an iterable, timing the production of each item as a stage of the trace."""
+    if not trace.enabled:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        trace.record(stage, time.perf_counter() - start)
+        yield item
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+import config
+from utils.memory_helper import current_rss_mb
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of the local transformer models used by the RAG cycle.
+
+    Each model is loaded lazily the first time it is requested and then shared by
+    every caller in the process (Streamlit sessions run as threads of the same process).
+    Loading is guarded by a per-model lock, so concurrent first requests load the
+    weights only once while requests for other models are not blocked.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        """
+        Returns the model registered under `key`, calling `loader()` to build it on first use.
+
+        Args:
+            key (tuple): Hashable identifier of the model (kind, name and load options).
+            loader (callable): Zero-argument function returning the loaded model.
+        """
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                model = loader()
+                load_seconds = time.perf_counter() - start
+                rss_after = current_rss_mb()
+
+                self._stats[key] = {
+                    "load_seconds": load_seconds,
+                    "parameter_mb": _parameter_size_mb(model),
+                    "rss_delta_mb": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+                    "loaded_at": time.time(),
+                }
+                self._models[key] = model
+                logging.info("Loaded model %s in %.2fs.", key, load_seconds)
+        return model
+
+    def is_loaded(self, key):
+        return key in self._models
+
+    def stats(self):
+        """Returns load time and memory statistics for every loaded model."""
+        return {" / ".join(str(part) for part in key): dict(stats) for key, stats in self._stats.items()}
+
+    def clear(self):
+        """Drops every loaded model so the next request reloads it."""
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+            self._key_locks.clear()
+
+
+def _parameter_size_mb(model):
+    """Returns the size of the model weights in megabytes, if they can be inspected."""
+    module = model if hasattr(model, "parameters") else getattr(model, "model", None)
+    if module is None or not hasattr(module, "parameters"):
+        return None
+    try:
+        return sum(p.numel() * p.element_size() for p in module.parameters()) / (1024 * 1024)
+    except Exception:
+        return None
+
+
+_registry = ModelRegistry()
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def get_registry():
+    return _registry
+
+
+def get_cross_encoder(
+                      model_name = config.CROSS_ENCODER_MODEL,
+                      backend    = config.RERANK_BACKEND,
+                      model_file = config.RERANK_MODEL_FILE
+                      ):
+    """
+    Returns the shared CrossEncoder used to re-rank retrieved documents.
+
+    Args:
+        model_name (str): Name or path of the cross-encoder model.
+        backend (str): Inference backend: "torch", "onnx" or "openvino".
+        model_file (str): Optional model file of the backend, e.g. a quantized
+            "onnx/model_qint8_avx512_vnni.onnx" for int8 CPU inference.
+    """
+    def load():
+        from sentence_transformers import CrossEncoder
+        if backend == "torch":
+            return CrossEncoder(model_name)
+        model_kwargs = {"file_name": model_file} if model_file else None
+        return CrossEncoder(model_name, backend=backend, model_kwargs=model_kwargs)
+
+    return _registry.get(("cross_encoder", model_name, backend, model_file), load)
+
+
+def get_sentence_transformer(model_name=config.SENTENCE_TRANSFORMER_MODEL):
+    """Returns the shared SentenceTransformer used to highlight relevant passages."""
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    return _registry.get(("sentence_transformer", model_name), load)
+
+
+def warm_up_models(background=True):
+    """
+    Loads every model used by the RAG cycle ahead of the first question.
+
+    Args:
+        background (bool): Load in a daemon thread instead of blocking the caller.
+            Repeated calls while (or after) warming up are no-ops.
+    """
+    global _warm_up_thread
+
+    def load_all():
+        try:
+            get_cross_encoder()
+            get_sentence_transformer()
+            logging.info("Model warm-up completed: %s", _registry.stats())
+        except Exception as e:
+            logging.error("Model warm-up failed: %s", e)
+
+    if not background:
+        load_all()
+        return
+
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+            _warm_up_thread.start()
+
+
+def get_model_stats():
+    """Returns load time and memory statistics for the loaded models."""
+    return _registry.stats()
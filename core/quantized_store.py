@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+import config
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+from langchain_core.documents import Document
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+QUANTIZED_DTYPES = ("float16", "int8")
+
+
+def quantize(vectors, dtype):
+    """
+    Quantizes float32 vectors to float16, or to int8 with one symmetric scale per vector.
+    Returns a tuple (quantized, scales) where scales is None for float16.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantized vector type '{dtype}'. Expected one of {QUANTIZED_DTYPES}.")
+
+
+def distances(space, dots, squared_norms, query):
+    """
+    Distances of the vectors to the query in a ChromaDB space ("l2", "ip" or "cosine"),
+    from their dot products with the query and their squared norms.
+    """
+    query_squared_norm = float(np.dot(query, query))
+    if space == "l2":
+        return squared_norms - 2 * dots + query_squared_norm
+    if space == "ip":
+        return 1.0 - dots
+    if space == "cosine":
+        return 1.0 - dots / np.maximum(np.sqrt(squared_norms * query_squared_norm), 1e-12)
+    raise ValueError(f"Unsupported distance space '{space}'.")
+
+
+class QuantizedVectorStore:
+    """
+    Compact copy of the embeddings of one collection, searched in two passes.
+
+    The vectors are stored as float16, or int8 with a scale per vector, in a NumPy file that is
+    memory-mapped, so only the pages being scanned are resident. A query scans them in blocks
+    for a shortlist of `shortlist_factor * fetch_k` candidates, whose float32 embeddings are
+    then read from ChromaDB to rank them exactly and select the results by maximal marginal
+    relevance, like Chroma.max_marginal_relevance_search_by_vector. The float32 embeddings
+    remain in ChromaDB as the source of truth. The files are rebuilt from the collection after
+    every ingestion, and reopened when another process has rebuilt them.
+    """
+
+    def __init__(
+                 self,
+                 directory,
+                 dtype            = config.QUANTIZED_VECTORS,
+                 shortlist_factor = config.QUANTIZED_SHORTLIST_FACTOR,
+                 block_rows       = config.QUANTIZED_BLOCK_ROWS
+                 ):
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unknown quantized vector type '{dtype}'. Expected one of {QUANTIZED_DTYPES}.")
+
+        self.directory = directory
+        self.dtype = dtype
+        self.shortlist_factor = shortlist_factor
+        self.block_rows = block_rows
+        self.vectors_path = os.path.join(directory, f"vectors.{dtype}.npy")
+        self.meta_path = os.path.join(directory, f"meta.{dtype}.npz")
+        self._lock = threading.Lock()
+        self._loaded_stamp = None
+        self._vectors = None
+        self._ids = None
+        self._scales = None
+        self._squared_norms = None
+        self._space = None
+
+    def __len__(self):
+        with self._lock:
+            return 0 if self._ids is None else len(self._ids)
+
+    def nbytes(self):
+        """Size of the files of the store, in bytes."""
+        return sum(os.path.getsize(path) for path in (self.vectors_path, self.meta_path) if os.path.exists(path))
+
+    def build(self, collection, page_size=5000):
+        """Writes the quantized copy of the embeddings of a ChromaDB collection."""
+        space = ((collection.configuration or {}).get("hnsw") or {}).get("space") or "l2"
+        ids, quantized, scales, squared_norms = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            page_quantized, page_scales = quantize(vectors, self.dtype)
+            ids.extend(page["ids"])
+            quantized.append(page_quantized)
+            squared_norms.append(np.einsum("ij,ij->i", vectors, vectors))
+            if page_scales is not None:
+                scales.append(page_scales)
+            offset += len(page["ids"])
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Written to temporary files and renamed, so readers never open a partial store.
+        # The metadata goes last: its stamp tells readers the store changed.
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            np.save(f, np.concatenate(quantized) if quantized else np.zeros((0, 0), dtype=self.dtype))
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        with open(self.meta_path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                ids=np.frombuffer(json.dumps(ids).encode("utf-8"), dtype=np.uint8),
+                space=np.array(space),
+                scales=np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32),
+                squared_norms=np.concatenate(squared_norms) if squared_norms else np.zeros(0, dtype=np.float32)
+            )
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        logging.info("Built %s vector store of collection '%s': %d vectors, %d bytes.", self.dtype, collection.name, len(ids), self.nbytes())
+
+    def delete(self):
+        with self._lock:
+            self._loaded_stamp = None
+            self._vectors = self._ids = self._scales = self._squared_norms = None
+        for path in (self.vectors_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def shortlist(self, query_vector, count):
+        """
+        Returns the (chunk ID, approximate distance) pairs of the `count` nearest quantized vectors,
+        nearest first, or None when the store was not built.
+        """
+        if not self._load():
+            return None
+        with self._lock:
+            ids, vectors, scales, squared_norms, space = self._ids, self._vectors, self._scales, self._squared_norms, self._space
+        query = np.asarray(query_vector, dtype=np.float32)
+        if len(vectors) == 0:
+            return []
+
+        # Blocks bound the float32 copy of the vectors made for the dot products
+        dots = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), self.block_rows):
+            block = np.asarray(vectors[start:start + self.block_rows], dtype=np.float32)
+            dots[start:start + len(block)] = block @ query
+        if scales is not None:
+            dots *= scales
+        approximate = distances(space, dots, squared_norms, query)
+
+        count = min(count, len(approximate))
+        nearest = np.argpartition(approximate, count - 1)[:count]
+        nearest = nearest[np.argsort(approximate[nearest])]
+        return [(ids[i], float(approximate[i])) for i in nearest]
+
+    def max_marginal_relevance_search_by_vector(self, collection, query_vector, k=4, fetch_k=20, lambda_mult=0.5):
+        """
+        Same results as Chroma.max_marginal_relevance_search_by_vector over the collection,
+        with the `fetch_k` candidates found by the quantized first pass and an exact rescore.
+        A store that was not built yet is built first; the ChromaDB index is searched if that fails.
+        """
+        candidates = self.shortlist(query_vector, fetch_k * self.shortlist_factor)
+        if candidates is None:
+            # Collections indexed before the quantized store was enabled get it on first use
+            logging.info("Building %s vector store of collection '%s'.", self.dtype, collection.name)
+            self.build(collection)
+            candidates = self.shortlist(query_vector, fetch_k * self.shortlist_factor)
+        if candidates is None:
+            logging.warning("No %s vector store for collection '%s': searching ChromaDB.", self.dtype, collection.name)
+            results = collection.query(query_embeddings=[query_vector], n_results=fetch_k, include=["metadatas", "documents", "embeddings"])
+            ids, documents, metadatas, embeddings = (results[key][0] for key in ("ids", "documents", "metadatas", "embeddings"))
+        else:
+            with self._lock:
+                space = self._space
+            stored = collection.get(ids=[chunk_id for chunk_id, _ in candidates], include=["metadatas", "documents", "embeddings"])
+            if len(stored["ids"]) == 0:
+                return []
+            # Exact float32 rescore of the shortlist
+            query = np.asarray(query_vector, dtype=np.float32)
+            vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+            exact = distances(space, vectors @ query, np.einsum("ij,ij->i", vectors, vectors), query)
+            order = np.argsort(exact)[:fetch_k]
+            ids = [stored["ids"][i] for i in order]
+            documents = [stored["documents"][i] for i in order]
+            metadatas = [stored["metadatas"][i] for i in order]
+            embeddings = vectors[order]
+
+        selected = maximal_marginal_relevance(np.asarray(query_vector, dtype=np.float32), list(embeddings), k=k, lambda_mult=lambda_mult)
+        return [
+            Document(page_content=documents[i], metadata=metadatas[i] or {}, id=ids[i])
+            for i in range(len(ids)) if i in selected
+        ]
+
+    def _load(self):
+        # Reopens the files when they were rebuilt, possibly by another process
+        try:
+            meta_stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return False
+        stamp = (meta_stat.st_ino, meta_stat.st_mtime_ns, meta_stat.st_size)
+        with self._lock:
+            if stamp == self._loaded_stamp:
+                return True
+            with np.load(self.meta_path) as meta:
+                ids = json.loads(meta["ids"].tobytes().decode("utf-8"))
+                space = str(meta["space"])
+                scales = meta["scales"] if self.dtype == "int8" else None
+                squared_norms = meta["squared_norms"]
+            vectors = np.load(self.vectors_path, mmap_mode="r")
+            if len(vectors) != len(ids):
+                # Caught between the two renames of a rebuild: keep the current files for now
+                logging.warning("Vector store at %s is being rebuilt.", self.directory)
+                return self._vectors is not None
+            self._ids, self._space, self._scales, self._squared_norms, self._vectors = ids, space, scales, squared_norms, vectors
+            self._loaded_stamp = stamp
+            return True
+
+
+def quantized_store_directory(collection_name, persist_directory=config.PERSIST_DIRECTORY):
+    return os.path.join(persist_directory, "quantized", collection_name)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_quantized_store(collection_name, persist_directory=config.PERSIST_DIRECTORY, dtype=config.QUANTIZED_VECTORS):
+    """Returns the process-wide QuantizedVectorStore of a collection."""
+    directory = quantized_store_directory(collection_name, persist_directory)
+    with _stores_lock:
+        store = _stores.get((directory, dtype))
+        if store is None:
+            store = QuantizedVectorStore(directory, dtype=dtype)
+            _stores[(directory, dtype)] = store
+        return store
+
+
+def delete_quantized_stores(collection_name, persist_directory=config.PERSIST_DIRECTORY):
+    """Removes the quantized vector stores of a collection, of every vector type."""
+    for dtype in QUANTIZED_DTYPES:
+        get_quantized_store(collection_name, persist_directory, dtype).delete()
+    directory = quantized_store_directory(collection_name, persist_directory)
+    if os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
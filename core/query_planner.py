@@ -0,0 +1,223 @@
+import contextvars
+import logging
+import threading
+import time
+import config
+from core.metrics import span
+from utils.file_helper import TOKEN_PATTERN
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+PLANNER_MODES = ("rewrite", "fast", "keyword", "speculative")
+
+QUERY_GENERATION_PROMPT = """You are an expert at rephrasing a user's question into a concise, keyword-based search query for a vector database.
+    Extract only the most critical entities and technical terms from the user's question, using the chat history for context.
+    If the user's question is a follow-up, combine it with keywords from the history to create a specific query.
+    Do not add any explanation or introductory text. Your output must be only the search query.
+
+    ---
+
+    **Multi-turn Example:**
+
+    Chat History:
+    User: explain what a for loop is in Python
+    Assistant: A for loop is used for iterating over a sequence (that is either a list, a tuple, a dictionary, a set, or a string).
+
+    User Question: "provide an example"
+    Search Query: "Python for loop code example"
+
+    ---
+
+    **Single-turn Example:**
+
+    Chat History:
+
+    User Question: "Can you tell me all about how to use AWS S3 for storing large video files?"
+    Search Query: "AWS S3 large video file storage"
+
+    ---
+
+    **Current Conversation:**
+
+    Chat History:
+    {history_str}
+
+    User Question: "{question}"
+    Search Query:"""
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+how i if in into is it its itself just me more most my no nor not now of off on once only or other our out over
+own please same she should so some such tell than that the their them then there these they this those through
+to too under until up very was we were what when where which while who whom why will with would you your
+explain describe show give know want need find
+""".split())
+
+
+def extract_keywords(question):
+    """Cheap local query extraction: the question terms without stopwords, in order and deduplicated."""
+    keywords = []
+    for token in TOKEN_PATTERN.findall(question.lower()):
+        if token not in STOPWORDS and token not in keywords:
+            keywords.append(token)
+    return " ".join(keywords) if keywords else question.strip()
+
+
+def keyword_overlap(first, second):
+    """Jaccard similarity of the keyword sets of two queries, between 0 and 1."""
+    first_terms, second_terms = set(extract_keywords(first).split()), set(extract_keywords(second).split())
+    if not first_terms and not second_terms:
+        return 1.0
+    return len(first_terms & second_terms) / len(first_terms | second_terms)
+
+
+class QueryPlanner:
+    """
+    Turns a user question into the search query used for retrieval.
+
+    Modes:
+        rewrite: always ask the LLM to rewrite the question (memoized).
+        fast: use the raw question on the first turn, the memoized LLM rewrite afterwards.
+        keyword: use the local keyword extractor on the first turn, the memoized LLM rewrite afterwards.
+        speculative: like fast, but on follow-up turns the rewrite runs concurrently with a
+            retrieval on the raw question, whose results are kept when the keywords of both
+            queries overlap by at least `speculation_overlap` (Jaccard similarity).
+
+    Rewrites are memoized on (history tail, question) and the latency of every plan is
+    recorded per mode, so the modes can be compared with `stats()`.
+    """
+
+    def __init__(
+                 self,
+                 mode                = config.QUERY_PLANNER_MODE,
+                 history_turns       = config.QUERY_REWRITE_HISTORY_TURNS,
+                 cache_size          = config.QUERY_REWRITE_CACHE_SIZE,
+                 speculation_overlap = config.QUERY_SPECULATION_MIN_OVERLAP
+                 ):
+        if mode not in PLANNER_MODES:
+            raise ValueError(f"Unknown query planner mode '{mode}'. Expected one of {PLANNER_MODES}.")
+        self.mode = mode
+        self.history_turns = history_turns
+        self.cache_size = cache_size
+        self.speculation_overlap = speculation_overlap
+
+        self._rewrites = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-planner")
+        self._latency = {}
+        self.rewrite_cache_hits = 0
+        self.speculative_hits = 0
+
+    def plan(self, client, local_model, question, chat_history=None, retrieve=None):
+        """
+        Returns a tuple (search_query, docs). `docs` holds the results of a speculative
+        retrieval when they can be reused, otherwise None and the caller retrieves.
+
+        Args:
+            client: Ollama client used for the LLM rewrite.
+            local_model (str): Name of the LLM model.
+            question (str): The user's question.
+            chat_history (list): Previous messages of the conversation.
+            retrieve (callable): Function mapping a search query to documents, used in speculative mode.
+        """
+        start = time.perf_counter()
+        history = self._history_tail(chat_history)
+        docs = None
+
+        if self.mode == "rewrite" or (history and self.mode != "speculative"):
+            label = "rewrite"
+            search_query = self._rewrite(client, local_model, question, history)
+        elif not history and self.mode == "keyword":
+            label = "keyword"
+            search_query = extract_keywords(question)
+        elif not history:
+            label = "raw"
+            search_query = question.strip()
+        else:
+            label = "speculative"
+            search_query, docs = self._speculate(client, local_model, question, history, retrieve)
+
+        self._record(label, time.perf_counter() - start)
+        logging.info("Generated Search Query (%s): '%s'", label, search_query)
+        return search_query, docs
+
+    def stats(self):
+        """Returns the number of plans and their mean latency per strategy, plus cache counters."""
+        with self._lock:
+            stats = {
+                label: {"count": count, "mean_seconds": total / count if count else 0.0}
+                for label, (count, total) in self._latency.items()
+            }
+            stats["mode"] = self.mode
+            stats["rewrite_cache_hits"] = self.rewrite_cache_hits
+            stats["speculative_hits"] = self.speculative_hits
+            return stats
+
+    def _history_tail(self, chat_history):
+        messages = [msg for msg in chat_history or [] if msg['role'] in ['user', 'assistant']]
+        return tuple((msg['role'], msg['content']) for msg in messages[-self.history_turns:]) if self.history_turns else ()
+
+    def _rewrite(self, client, local_model, question, history):
+        key = (local_model, history, question.strip())
+        with self._lock:
+            if key in self._rewrites:
+                self._rewrites.move_to_end(key)
+                self.rewrite_cache_hits += 1
+                return self._rewrites[key]
+
+        history_str = "\n".join([f"User: {content}" if role == 'user' else f"Assistant: {content}" for role, content in history])
+        with span("rewrite") as stage:
+            response = client.chat(
+                model=local_model,
+                messages=[{'role': 'user', 'content': QUERY_GENERATION_PROMPT.format(history_str=history_str, question=question)}],
+                options={'temperature': 0}
+            )
+            stage.set(prompt_tokens=response.get('prompt_eval_count') or 0, tokens=response.get('eval_count') or 0)
+        search_query = response['message']['content'].strip().strip('"')
+
+        with self._lock:
+            self._rewrites[key] = search_query
+            while len(self._rewrites) > self.cache_size:
+                self._rewrites.popitem(last=False)
+        return search_query
+
+    def _speculate(self, client, local_model, question, history, retrieve):
+        if retrieve is None:
+            return self._rewrite(client, local_model, question, history), None
+
+        # The rewrite runs in a copy of the caller's context, so it is timed in the caller's trace
+        rewrite_future = self._executor.submit(contextvars.copy_context().run, self._rewrite, client, local_model, question, history)
+        speculative_docs = retrieve(question.strip())
+        search_query = rewrite_future.result()
+
+        # The speculative results are kept when the rewrite asks for mostly the same terms;
+        # an exact match almost never happens on follow-up turns, where the rewrite adds context
+        if keyword_overlap(search_query, question) >= self.speculation_overlap:
+            with self._lock:
+                self.speculative_hits += 1
+            return search_query, speculative_docs
+        return search_query, None
+
+    def _record(self, label, seconds):
+        with self._lock:
+            count, total = self._latency.get(label, (0, 0.0))
+            self._latency[label] = (count + 1, total + seconds)
+
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+def get_query_planner():
+    """Returns the process-wide QueryPlanner configured by QUERY_PLANNER_MODE."""
+    global _planner
+    with _planner_lock:
+        if _planner is None:
+            _planner = QueryPlanner()
+        return _planner
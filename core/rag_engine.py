@@ -0,0 +1,118 @@
+import threading
+import logging
+import chromadb
+import config
+from ollama import Client
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings
+from core.embedding_cache import CachedEmbeddings, get_embedding_cache
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class RagEngine:
+    """
+    Long-lived holder of the expensive handles used by the RAG cycle and the ingestion pipeline.
+
+    One engine owns a single Ollama client (whose HTTP connection pool is reused across
+    requests), a single embeddings instance, a single ChromaDB client and one cached
+    LangChain vector store per collection, so per-question calls only do query work.
+    When the embedding cache is enabled, the embeddings instance serves repeated texts
+    from the persistent cache for both ingestion and queries.
+    """
+
+    def __init__(
+                 self,
+                 ollama_host_url   = config.OLLAMA_HOST_URL,
+                 embedding_model   = config.EMBEDDING_MODEL,
+                 persist_directory = config.PERSIST_DIRECTORY
+                 ):
+        self.ollama_host_url = ollama_host_url
+        self.embedding_model = embedding_model
+        self.persist_directory = persist_directory
+
+        self.client = Client(host=ollama_host_url)
+        self.embeddings = OllamaEmbeddings(model=embedding_model, base_url=ollama_host_url)
+        if config.EMBEDDING_CACHE_ENABLED:
+            self.embeddings = CachedEmbeddings(self.embeddings, embedding_model, get_embedding_cache())
+        self.chroma_client = chromadb.PersistentClient(path=persist_directory)
+
+        self._vector_stores = {}
+        self._lock = threading.Lock()
+
+    def get_vector_store(self, collection_name):
+        """Returns the cached LangChain Chroma wrapper for a collection, creating it on first use."""
+        if collection_name is None or collection_name.strip() == "":
+            raise ValueError("A valid collection name must be provided.")
+
+        vector_store = self._vector_stores.get(collection_name)
+        if vector_store is not None:
+            return vector_store
+
+        with self._lock:
+            vector_store = self._vector_stores.get(collection_name)
+            if vector_store is None:
+                vector_store = Chroma(
+                    client=self.chroma_client,
+                    embedding_function=self.embeddings,
+                    collection_name=collection_name
+                )
+                self._vector_stores[collection_name] = vector_store
+        return vector_store
+
+    def forget_collection(self, collection_name):
+        """Drops the cached handle of a collection that was deleted or rebuilt."""
+        with self._lock:
+            self._vector_stores.pop(collection_name, None)
+
+    def list_collections(self):
+        return self.chroma_client.list_collections()
+
+    def delete_collection(self, collection_name):
+        """Deletes a collection and its cached handle. Raises chromadb.errors.NotFoundError if missing."""
+        self.forget_collection(collection_name)
+        self.chroma_client.delete_collection(name=collection_name)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(
+               ollama_host_url   = config.OLLAMA_HOST_URL,
+               embedding_model   = config.EMBEDDING_MODEL,
+               persist_directory = config.PERSIST_DIRECTORY
+               ):
+    """
+    Returns the process-wide RagEngine for the given configuration, creating it on first use.
+
+    Args:
+        ollama_host_url (str): URL of the Ollama server used for chat and embeddings.
+        embedding_model (str): Name of the Ollama embedding model.
+        persist_directory (str): Directory where the Chroma database is stored.
+    """
+    key = (ollama_host_url, embedding_model, persist_directory)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = RagEngine(
+                ollama_host_url=ollama_host_url,
+                embedding_model=embedding_model,
+                persist_directory=persist_directory
+            )
+            _engines[key] = engine
+            logging.info("Initialized RAG engine for %s (%s, %s).", ollama_host_url, embedding_model, persist_directory)
+    return engine
+
+
+def forget_collection(collection_name):
+    """Drops the cached handle of a collection from every engine of the process."""
+    for engine in list(_engines.values()):
+        engine.forget_collection(collection_name)
@@ -1,105 +1,181 @@
-from ollama import Client
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from sentence_transformers import CrossEncoder
-from sentence_transformers import SentenceTransformer, util
+import numpy as np
+from core.rag_engine import get_engine
+from core.answer_cache import get_answer_cache
+from core.context_budget import get_context_budget
+from core.query_planner import get_query_planner
+from core.quantized_store import get_quantized_store
+from core.sparse_index import get_sparse_index, reciprocal_rank_fusion
+from utils.file_helper import chunk_fingerprint
+from core.model_registry import get_sentence_transformer
+from core.reranker import get_reranker
+from core.sentence_store import get_sentence_store, split_sentence_spans
+from core.async_pipeline import get_async_client, iterate_sync, run_stage, run_sync, stage_slot
+from core.metrics import span, start_trace, use_trace
+import contextvars
 import logging
+import time
 import config as config
-import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 logging.basicConfig(
     level=config.LOGGING_LEVEL,
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
-def generate_rag_response(
-                          ollama_host_url   = config.OLLAMA_HOST_URL, 
-                          local_model       = config.LOCAL_MODEL, 
-                          embedding_model   = config.EMBEDDING_MODEL, 
-                          question          = None,
-                          collection_name   = None, 
-                          persist_directory = config.PERSIST_DIRECTORY,
-                          chat_history      = None
-                          ):
-    
+# Bounded pool fanning federated searches out to the collections
+_federation_executor = ThreadPoolExecutor(max_workers=config.FEDERATED_MAX_WORKERS, thread_name_prefix="federated-search")
+
+def _retrieve_documents(engine, collection_name, search_query):
     """
-    Function that implements a Retrieval-Augmented Generation (RAG) system.
-    Given a local LLM model and a Chroma vector database, it retrieves the most relevant documents for a question,
-    builds a prompt with their content as context, and sends the prompt to the LLM model to generate an answer.
-    Returns the answer generated by the model.
+    Retrieves the documents of a collection relevant to a search query.
+    Dense MMR results are fused with the BM25 results of the collection's sparse index
+    by reciprocal rank fusion, so exact technical terms are found even when embeddings miss them.
     """
+    return [doc for doc, _ in _retrieve_scored_documents(engine, collection_name, search_query)]
 
-    if question is None or question.strip() == "":
-        raise ValueError("A question must be provided to generate a RAG response.")
+def _retrieve_scored_documents(engine, collection_name, search_query, query_vector=None):
+    """
+    Variant of _retrieve_documents returning (document, score) pairs, where the score is the
+    reciprocal rank fusion score of the document (its dense rank only without hybrid search).
+    """
+    vector_db = engine.get_vector_store(collection_name)
+    # Same as max_marginal_relevance_search, with the query embedding timed on its own
+    if query_vector is None:
+        with span("embed_query"):
+            query_vector = engine.embeddings.embed_query(search_query)
+    with span("mmr_search") as stage:
+        if config.QUANTIZED_VECTORS:
+            # Quantized first pass over the memory-mapped copy, exact float32 rescore of the shortlist
+            dense_docs = get_quantized_store(collection_name, engine.persist_directory, config.QUANTIZED_VECTORS).max_marginal_relevance_search_by_vector(
+                engine.chroma_client.get_collection(name=collection_name),
+                query_vector,
+                k=config.RETRIEVAL_K,
+                fetch_k=config.RETRIEVAL_FETCH_K
+            )
+        else:
+            dense_docs = vector_db.max_marginal_relevance_search_by_vector(query_vector, k=config.RETRIEVAL_K, fetch_k=config.RETRIEVAL_FETCH_K)
+        stage.set(documents=len(dense_docs))
+    if not config.HYBRID_SEARCH_ENABLED:
+        return [(doc, 1.0 / (config.RRF_K + rank)) for rank, doc in enumerate(dense_docs, start=1)]
+
+    with span("sparse_search") as stage:
+        sparse_index = get_sparse_index(collection_name, engine.persist_directory)
+        if len(sparse_index) == 0:
+            # Collections indexed before hybrid search existed get their sparse index on first use
+            def load_chunks():
+                stored = vector_db.get(include=["documents"])
+                logging.info("Building sparse index of collection '%s' (%d chunks).", collection_name, len(stored["ids"]))
+                return stored["ids"], stored["documents"]
+
+            sparse_index.build_if_empty(load_chunks)
+
+        sparse_hits = sparse_index.search(search_query, k=config.SPARSE_TOP_K)
+        stage.set(documents=len(sparse_hits))
+    fused = reciprocal_rank_fusion([
+        [doc.id for doc in dense_docs],
+        [chunk_id for chunk_id, _ in sparse_hits]
+    ], with_scores=True)[:config.RETRIEVAL_K]
+
+    docs_by_id = {doc.id: doc for doc in dense_docs}
+    missing_ids = [chunk_id for chunk_id, _ in fused if chunk_id not in docs_by_id]
+    if missing_ids:
+        with span("fetch_documents", documents=len(missing_ids)):
+            docs_by_id.update({doc.id: doc for doc in vector_db.get_by_ids(missing_ids)})
+    logging.info("Hybrid retrieval: %d dense, %d sparse, %d fused documents.", len(dense_docs), len(sparse_hits), len(fused))
+    return [(docs_by_id[chunk_id], score) for chunk_id, score in fused if chunk_id in docs_by_id]
+
+def _federated_retrieve(engine, collection_names, search_query):
+    """
+    Retrieves the documents relevant to a search query from several collections at once.
 
-    # Initialize the Ollama client to interact with the LLM model
-    client = Client(host=ollama_host_url)
+    The query is embedded once, then every collection is searched in the bounded federation
+    pool. A collection that fails, or is still running FEDERATED_TIMEOUT_SECONDS after its
+    search started, is left out of the answer. The candidates of all collections are merged
+    by their fusion score and the best FEDERATED_CANDIDATES go to a single rerank; each
+    document records the collection it came from in its "collection_name" metadata.
+    """
+    with span("embed_query"):
+        query_vector = engine.embeddings.embed_query(search_query)
+
+    started = {}
+
+    def search(collection_name):
+        started[collection_name] = time.perf_counter()
+        with span("collection_search", collections=1) as stage:
+            results = _retrieve_scored_documents(engine, collection_name, search_query, query_vector)
+            stage.set(documents=len(results))
+        return results
+
+    # Searches run in copies of the caller's context, so they are timed in its trace
+    futures = {
+        _federation_executor.submit(contextvars.copy_context().run, search, collection_name): collection_name
+        for collection_name in collection_names
+    }
+    candidates = {}
+    pending = set(futures)
+    timed_out = []
+    with span("federated_search", collections=len(collection_names)) as stage:
+        while pending:
+            # Wake up for the next completion or the next deadline of a running search
+            now = time.perf_counter()
+            deadlines = [started[futures[future]] + config.FEDERATED_TIMEOUT_SECONDS for future in pending if futures[future] in started]
+            timeout = max(min(deadlines) - now, 0) if deadlines else config.FEDERATED_TIMEOUT_SECONDS
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                collection_name = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logging.warning("Search of collection '%s' failed: %s", collection_name, e)
+                    continue
+                for doc, score in results:
+                    doc.metadata["collection_name"] = collection_name
+                    key = (collection_name, doc.id)
+                    if key not in candidates or candidates[key][1] < score:
+                        candidates[key] = (doc, score)
+
+            now = time.perf_counter()
+            for future in list(pending):
+                collection_name = futures[future]
+                if collection_name in started and now - started[collection_name] >= config.FEDERATED_TIMEOUT_SECONDS:
+                    # The search keeps running in its pool thread, but the answer no longer waits for it
+                    logging.warning("Search of collection '%s' timed out after %.1fs; skipping it.", collection_name, config.FEDERATED_TIMEOUT_SECONDS)
+                    future.cancel()
+                    pending.discard(future)
+                    timed_out.append(collection_name)
+
+        merged = sorted(candidates.values(), key=lambda pair: pair[1], reverse=True)[:config.FEDERATED_CANDIDATES]
+        stage.set(documents=len(merged), timeouts=len(timed_out))
+    logging.info("Federated retrieval over %d collections: %d candidates kept (%d timed out).", len(collection_names), len(merged), len(timed_out))
+    return [doc for doc, _ in merged]
+
+def _plan_and_retrieve(engine, local_model, question, collection_name, chat_history):
+    """
+    Plans the search query and retrieves the documents for it, from one collection
+    or, when `collection_name` is a list of names, from all of them (federated search).
+    """
 
-    history_str = ""
-    if chat_history:
-        history_str = "\n".join([f"User: {msg['content']}" if msg['role']=='user' else f"Assistant: {msg['content']}" for msg in chat_history if msg['role'] in ['user', 'assistant']])
+    # Retrieval function over the collection: MMR vector search, fused with BM25 when hybrid search is enabled
+    def retrieve(query):
+        if isinstance(collection_name, (list, tuple)):
+            return _federated_retrieve(engine, collection_name, query)
+        return _retrieve_documents(engine, collection_name, query)
 
     logging.info("Generating search query for the question.")
     logging.debug("Chat History: '%s'", chat_history)
-    # Generate a search query from the user's question
-    query_generation_prompt = f"""You are an expert at rephrasing a user's question into a concise, keyword-based search query for a vector database. 
-    Extract only the most critical entities and technical terms from the user's question, using the chat history for context.
-    If the user's question is a follow-up, combine it with keywords from the history to create a specific query.
-    Do not add any explanation or introductory text. Your output must be only the search query.
-
-    ---
-    
-    **Multi-turn Example:**
-
-    Chat History:
-    User: explain what a for loop is in Python
-    Assistant: A for loop is used for iterating over a sequence (that is either a list, a tuple, a dictionary, a set, or a string).
-
-    User Question: "provide an example"
-    Search Query: "Python for loop code example"
-
-    ---
-
-    **Single-turn Example:**
-
-    Chat History:
-    
-    User Question: "Can you tell me all about how to use AWS S3 for storing large video files?"
-    Search Query: "AWS S3 large video file storage"
-
-    ---
-
-    **Current Conversation:**
-
-    Chat History:
-    {history_str}
-
-    User Question: "{question}"
-    Search Query:"""
-
-    response = client.chat(
-        model=local_model, 
-        messages=[{'role': 'user', 'content': query_generation_prompt}],
-        options={'temperature': 0}
-    )
-    search_query = response['message']['content'].strip().strip('"')
-    logging.info("Generated Search Query: '%s'", search_query)
-
-    # Create or connect to a Chroma vector database for RAG
-    vector_db = Chroma(
-                    persist_directory = persist_directory,
-                    embedding_function=OllamaEmbeddings(model=embedding_model, base_url=ollama_host_url), 
-                    collection_name = collection_name
-                    )
-    
-    # Get a retriever to fetch relevant documents from the database
-    retriever = vector_db.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 8, "fetch_k": 20}
-    )
-
-    # Retrieve the most relevant documents for the question
-    docs = retriever.invoke(search_query)
+    # Plan the search query: raw question, keywords or (memoized) LLM rewrite depending on the mode
+    with span("plan"):
+        search_query, docs = get_query_planner().plan(
+            engine.client,
+            local_model,
+            question,
+            chat_history=chat_history,
+            retrieve=retrieve
+        )
+
+    # Retrieve the most relevant documents for the question, unless the planner already did
+    if docs is None:
+        docs = retrieve(search_query)
     logging.info("Documents fetched from database: %d", len(docs))
 
     # Log the retrieved documents for debugging purposes 
@@ -107,22 +183,25 @@ def generate_rag_response(
     for i, doc in enumerate(docs):
         logging.debug("--- Document %d ---\n%s\n--------------------", i+1, doc.page_content)
     logging.debug("--- END CONTEXT ---")
+    return search_query, docs
 
-    # Sentence transformer layer to re-rank the retrieved documents based on their relevance to the search query
-    model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L6-v2')
-    
-    # Create pairs of (query, document) for the cross-encoder and get scores
-    doc_scores = model.predict([[search_query, doc.page_content] for doc in docs])
-    
-    # Combine docs with their scores and sort
-    scored_docs = sorted(zip(docs, doc_scores), key=lambda x: x[1], reverse=True)
-    
-    # Select top 5 documents
-    docs = [doc for doc, score in scored_docs[:5]]
-    logging.info("Documents re-ranked. Top documents selected: %d", len(docs))
+def _build_messages(question, docs, chat_history):
+    """
+    Builds the chat messages sent to the LLM model, ending with the prompt holding the retrieved context.
+    Returns a tuple (messages, docs) where docs are the documents that made it into the context:
+    with CONTEXT_BUDGET_ENABLED, overlapping chunks are deduplicated and the context is packed
+    into CONTEXT_TOKEN_BUDGET tokens.
+    """
 
     # Merge the content of the documents into a single context
-    context = "\n\n".join(doc.page_content for doc in docs)
+    if config.CONTEXT_BUDGET_ENABLED:
+        with span("pack_context", documents=len(docs)) as stage:
+            budget = get_context_budget()
+            texts, docs = budget.pack_documents(docs)
+            context = "\n\n".join(texts)
+            stage.set(packed=len(docs), context_tokens=budget.count_tokens(context))
+    else:
+        context = "\n\n".join(doc.page_content for doc in docs)
 
     messages = []
     if chat_history:
@@ -143,51 +222,287 @@ Question: {question}
 """
 
     messages.append({'role': 'user', 'content': formatted_prompt})
+    return messages, docs
+
+def _lookup_answer(engine, local_model, search_query, docs, collection_name, chat_history):
+    """
+    Looks up the answer cache for the question.
+    Returns a tuple (cached_answer, store) where store saves a freshly generated answer,
+    or is None when the answer cache is disabled.
+    """
+    if not config.ANSWER_CACHE_ENABLED:
+        return None, None
+
+    answer_cache = get_answer_cache()
+    with span("cache_lookup") as stage:
+        query_vector = engine.embeddings.embed_query(search_query)
+        fingerprint = answer_cache.context_fingerprint(
+            [doc.id or chunk_fingerprint(doc) for doc in docs],
+            chat_history=chat_history,
+            model=local_model
+        )
+        cached_answer = answer_cache.lookup(collection_name, query_vector, fingerprint)
+        stage.set(hits=int(cached_answer is not None))
+
+    def store(answer):
+        answer_cache.store(collection_name, query_vector, fingerprint, answer)
+
+    return cached_answer, store
+
+async def astream_rag_response(
+                               ollama_host_url   = config.OLLAMA_HOST_URL, 
+                               local_model       = config.LOCAL_MODEL, 
+                               embedding_model   = config.EMBEDDING_MODEL, 
+                               question          = None,
+                               collection_name   = None, 
+                               persist_directory = config.PERSIST_DIRECTORY,
+                               chat_history      = None,
+                               trace             = None
+                               ):
     
-    # Send the prompt to the LLM model and get the answer
-    response = client.chat(model = local_model, messages = messages)
-    return(response['message']['content'], docs)
+    """
+    Asynchronous streaming variant of the Retrieval-Augmented Generation (RAG) system.
+    Blocking stages (query planning, retrieval, re-ranking, answer cache lookup) run in a bounded
+    worker pool, each within its own concurrency limit, and the answer is streamed by the async
+    Ollama client, so a slow response never blocks other sessions.
+    The stages are timed in `trace` when given (the caller then finishes it), otherwise in a
+    trace of their own, finished once the answer is complete (see core/metrics.py).
+    `collection_name` may be a list of names to search several collections at once (federated search).
+    Returns a tuple (token_stream, docs) where token_stream is an async generator of answer fragments.
+    """
+
+    if question is None or question.strip() == "":
+        raise ValueError("A question must be provided to generate a RAG response.")
+    if isinstance(collection_name, (list, tuple)):
+        if not collection_name:
+            raise ValueError("At least one collection must be selected.")
+        # Sorted, so the answer cache key does not depend on the selection order
+        collection_name = collection_name[0] if len(collection_name) == 1 else tuple(sorted(set(collection_name)))
+    federated = isinstance(collection_name, tuple)
+
+    owns_trace = trace is None
+    if owns_trace:
+        trace = start_trace("query", collection=collection_name, model=local_model)
+    # Blocking stages run in copies of this context, so their spans go to the trace
+    use_trace(trace)
+
+    try:
+        # Reuse the long-lived engine holding the pooled Ollama client, embeddings and vector stores
+        engine = get_engine(
+            ollama_host_url=ollama_host_url,
+            embedding_model=embedding_model,
+            persist_directory=persist_directory
+        )
+
+        # The history is bounded once, for both the query rewrite and the answer prompt
+        if config.CONTEXT_BUDGET_ENABLED:
+            with trace.span("trim_history", messages=len(chat_history or [])):
+                chat_history = get_context_budget().trim_history(chat_history)
+
+        with trace.span("retrieve") as stage:
+            search_query, docs = await run_stage("retrieve", _plan_and_retrieve, engine, local_model, question, collection_name, chat_history)
+            stage.set(documents=len(docs))
+
+        # Cross-encoder layer to re-rank the retrieved documents based on their relevance to the search query.
+        # The shared reranker batches concurrent sessions together and caches (query, chunk) scores.
+        with trace.span("rerank", documents=len(docs)) as stage:
+            # Federated candidates are already cut down to FEDERATED_CANDIDATES by fusion score
+            docs = await run_stage("rerank", get_reranker().rerank, search_query, docs, fetch_k=len(docs) if federated else config.RERANK_FETCH_K)
+            stage.set(selected=len(docs))
+        logging.info("Documents re-ranked. Top documents selected: %d", len(docs))
+
+        messages, docs = _build_messages(question, docs, chat_history)
+
+        # Serve repeated or near-duplicate questions over the same context from the answer cache
+        cached_answer, store = await run_stage("cache", _lookup_answer, engine, local_model, search_query, docs, collection_name, chat_history)
+    except Exception as e:
+        if owns_trace:
+            trace.finish(error=type(e).__name__)
+        raise
+
+    if cached_answer is not None:
+        async def cached_stream():
+            try:
+                yield cached_answer
+            finally:
+                if owns_trace:
+                    trace.finish(cached=True)
+        return(cached_stream(), docs)
+
+    async def token_stream():
+        # Send the prompt to the LLM model and yield the answer as it is generated
+        tokens = []
+        try:
+            async with stage_slot("generate"):
+                with trace.span("generate") as stage:
+                    start = time.perf_counter()
+                    response = await get_async_client(ollama_host_url).chat(model = local_model, messages = messages, stream = True)
+                    async for chunk in response:
+                        token = chunk['message']['content']
+                        if token:
+                            if not tokens:
+                                trace.record("first_token", time.perf_counter() - start)
+                            tokens.append(token)
+                            yield token
+                        if chunk.get('done'):
+                            # Token counts reported by Ollama with the last fragment
+                            stage.set(prompt_tokens=chunk.get('prompt_eval_count') or 0, tokens=chunk.get('eval_count') or 0)
+                    stage.set(fragments=len(tokens))
+        finally:
+            if owns_trace:
+                trace.finish(cached=False)
+
+        # Only complete answers are cached
+        if store is not None:
+            store("".join(tokens))
+
+    return(token_stream(), docs)
+
+
+async def agenerate_rag_response(
+                                 ollama_host_url   = config.OLLAMA_HOST_URL, 
+                                 local_model       = config.LOCAL_MODEL, 
+                                 embedding_model   = config.EMBEDDING_MODEL, 
+                                 question          = None,
+                                 collection_name   = None, 
+                                 persist_directory = config.PERSIST_DIRECTORY,
+                                 chat_history      = None,
+                                 trace             = None
+                                 ):
+    
+    """
+    Asynchronous variant of generate_rag_response.
+    Returns the answer generated by the model and the documents used as context.
+    """
+
+    token_stream, docs = await astream_rag_response(
+        ollama_host_url=ollama_host_url,
+        local_model=local_model,
+        embedding_model=embedding_model,
+        question=question,
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        chat_history=chat_history,
+        trace=trace
+    )
+    return("".join([token async for token in token_stream]), docs)
+
+
+def stream_rag_response(
+                        ollama_host_url   = config.OLLAMA_HOST_URL, 
+                        local_model       = config.LOCAL_MODEL, 
+                        embedding_model   = config.EMBEDDING_MODEL, 
+                        question          = None,
+                        collection_name   = None, 
+                        persist_directory = config.PERSIST_DIRECTORY,
+                        chat_history      = None,
+                        trace             = None
+                        ):
+    
+    """
+    Streaming variant of the Retrieval-Augmented Generation (RAG) system.
+    Retrieval and re-ranking run eagerly, so the sources are available as soon as this function returns;
+    the answer is then produced lazily, token by token, as the LLM model generates it.
+    Synchronous facade over astream_rag_response, which runs on the shared background event loop.
+    Returns a tuple (token_stream, docs) where token_stream is a generator of answer fragments.
+    """
+
+    token_stream, docs = run_sync(astream_rag_response(
+        ollama_host_url=ollama_host_url,
+        local_model=local_model,
+        embedding_model=embedding_model,
+        question=question,
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        chat_history=chat_history,
+        trace=trace
+    ))
+    return(iterate_sync(token_stream), docs)
+
+
+def generate_rag_response(
+                          ollama_host_url   = config.OLLAMA_HOST_URL, 
+                          local_model       = config.LOCAL_MODEL, 
+                          embedding_model   = config.EMBEDDING_MODEL, 
+                          question          = None,
+                          collection_name   = None, 
+                          persist_directory = config.PERSIST_DIRECTORY,
+                          chat_history      = None,
+                          trace             = None
+                          ):
+    
+    """
+    Function that implements a Retrieval-Augmented Generation (RAG) system.
+    Given a local LLM model and a Chroma vector database, it retrieves the most relevant documents for a question,
+    builds a prompt with their content as context, and sends the prompt to the LLM model to generate an answer.
+    Synchronous facade over agenerate_rag_response, which runs on the shared background event loop.
+    Returns the answer generated by the model.
+    """
+
+    return run_sync(agenerate_rag_response(
+        ollama_host_url=ollama_host_url,
+        local_model=local_model,
+        embedding_model=embedding_model,
+        question=question,
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        chat_history=chat_history,
+        trace=trace
+    ))
 
 
 def highlight_relevant_passages(answer, docs, num_snippets=3):
     """
     Function to highlight relevant passages from the retrieved documents in the generated answer.
-    It searches for sentences in the documents that contain keywords from the answer and highlights them.
+    For each sentence of the answer it finds the most similar sentence of the documents and highlights it.
+    Document sentences and their embeddings come precomputed from the sentence store, so the cost
+    scales with the length of the answer rather than with the size of the context.
     Returns the answer with highlighted passages and their metadata.
     """
 
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    with span("highlight", documents=len(docs)):
+        return _highlight_relevant_passages(answer, docs)
+
 
-    # Split retrieved documents into sentences
-    answer_sentences = re.split(r'(?<=[.!?]) +', answer)
+def _highlight_relevant_passages(answer, docs):
+    answer_sentences = [answer[start:end] for start, end in split_sentence_spans(answer)]
+    sentence_data = get_sentence_store().get_many([doc.page_content for doc in docs])
 
-    # Split the documents into sentences
-    doc_sentences = []
-    for doc in docs:
-        sentences = re.split(r'(?<=[.!?]) +', doc.page_content)
-        doc_sentences.extend(sentences)
+    # Stack the sentence embeddings of all documents into a single matrix
+    locations = [(doc_index, span) for doc_index, (spans, _) in enumerate(sentence_data) for span in spans]
+    selected_spans = [[] for _ in docs]
+    if answer_sentences and locations:
+        doc_embeddings = np.vstack([vectors for _, vectors in sentence_data])
+        answer_embeddings = get_sentence_transformer().encode(answer_sentences, convert_to_numpy=True, normalize_embeddings=True)
 
-    # Compute similarity
-    answer_embeddings = model.encode(answer_sentences, convert_to_tensor=True)
-    doc_embeddings = model.encode(doc_sentences, convert_to_tensor=True)   
-    cosine_scores = util.pytorch_cos_sim(answer_embeddings, doc_embeddings)
+        # One matrix product and argmax give the best document sentence for every answer sentence
+        best_indexes = np.unique((answer_embeddings @ doc_embeddings.T).argmax(axis=1))
+        highlighted_passages = {docs[locations[i][0]].page_content[locations[i][1][0]:locations[i][1][1]] for i in best_indexes}
 
-    # Find top relevant sentences
-    highlighted_passages = set()
-    for i in range(len(answer_sentences)):
-        best_index = cosine_scores[i].argmax().item()
-        highlighted_passages.add(doc_sentences[best_index])
+        # Highlight every occurrence of a selected sentence, including the copies in overlapping chunks
+        for doc_index, (start, end) in locations:
+            if docs[doc_index].page_content[start:end] in highlighted_passages:
+                selected_spans[doc_index].append((int(start), int(end)))
 
     # Highlight the phrases in the context and include metadata
     highlighted_docs = []
-    for doc in docs: 
+    for doc, spans in zip(docs, selected_spans):
         content = doc.page_content
-        for snippet in highlighted_passages:
-            if snippet in content:
-                content = content.replace(snippet, f":orange-background[{snippet}]")
+        parts = []
+        position = 0
+        for start, end in sorted(spans):
+            parts.append(content[position:start])
+            parts.append(f":orange-background[{content[start:end]}]")
+            position = end
+        parts.append(content[position:])
         highlighted_docs.append({
-            "content": content,
+            "content": "".join(parts),
             "metadata": doc.metadata if hasattr(doc, "metadata") else {}
         })
 
     return answer, highlighted_docs
+
+
+async def ahighlight_relevant_passages(answer, docs, num_snippets=3):
+    """Asynchronous variant of highlight_relevant_passages, run in the bounded worker pool."""
+    return await run_stage("highlight", highlight_relevant_passages, answer, docs, num_snippets)
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+import config
+from collections import OrderedDict
+from concurrent.futures import Future
+from core.model_registry import get_cross_encoder
+from utils.file_helper import chunk_fingerprint
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class Reranker:
+    """
+    Shared cross-encoder re-ranking service.
+
+    Scoring requests from concurrent callers (one per Streamlit session) are queued and
+    merged by a background thread into a single `predict` call of up to `max_batch_pairs`
+    pairs, waiting at most `max_wait_ms` for more requests to join a batch. Scores are
+    cached per (query hash, chunk ID), so repeated candidates are not scored again.
+    """
+
+    def __init__(
+                 self,
+                 model_name      = config.CROSS_ENCODER_MODEL,
+                 backend         = config.RERANK_BACKEND,
+                 model_file      = config.RERANK_MODEL_FILE,
+                 max_batch_pairs = config.RERANK_MAX_BATCH_PAIRS,
+                 max_wait_ms     = config.RERANK_MAX_WAIT_MS,
+                 cache_size      = config.RERANK_CACHE_SIZE
+                 ):
+        self.model_name = model_name
+        self.backend = backend
+        self.model_file = model_file
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        self._requests = queue.Queue()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="reranker", daemon=True)
+        self._worker.start()
+
+        self.stats = {"requests": 0, "batches": 0, "pairs_scored": 0, "cache_hits": 0}
+
+    def score(self, query, docs):
+        """Returns the cross-encoder score of each document for the query."""
+        query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        keys = [(query_hash, doc.id or chunk_fingerprint(doc)) for doc in docs]
+
+        scores = [None] * len(docs)
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+            self.stats["cache_hits"] += sum(score is not None for score in scores)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            future = Future()
+            self._requests.put(([[query, docs[i].page_content] for i in missing], future))
+            for i, value in zip(missing, future.result()):
+                scores[i] = float(value)
+
+            with self._cache_lock:
+                for i in missing:
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(
+               self,
+               query,
+               docs,
+               fetch_k         = config.RERANK_FETCH_K,
+               top_n           = config.RERANK_TOP_N,
+               score_threshold = config.RERANK_SCORE_THRESHOLD
+               ):
+        """
+        Returns the `top_n` most relevant documents among the first `fetch_k` candidates.
+
+        With a `score_threshold`, documents scoring below it are dropped, and candidates are
+        scored in slices of `top_n` in retrieval order: scoring stops early once `top_n`
+        documents above the threshold have been found.
+        """
+        candidates = docs[:fetch_k]
+        if score_threshold is None:
+            scored = list(zip(candidates, self.score(query, candidates)))
+        else:
+            scored = []
+            for start in range(0, len(candidates), top_n):
+                batch = candidates[start:start + top_n]
+                scored.extend(pair for pair in zip(batch, self.score(query, batch)) if pair[1] >= score_threshold)
+                if len(scored) >= top_n:
+                    break
+
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return [doc for doc, _ in scored[:top_n]]
+
+    def _run(self):
+        while True:
+            requests = [self._requests.get()]
+            pair_count = len(requests[0][0])
+
+            # Gather more requests until the batch is full or the wait budget is spent
+            deadline = time.perf_counter() + self.max_wait
+            while pair_count < self.max_batch_pairs:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                pair_count += len(request[0])
+
+            pairs = [pair for request_pairs, _ in requests for pair in request_pairs]
+            try:
+                model = get_cross_encoder(self.model_name, self.backend, self.model_file)
+                scores = model.predict(pairs, batch_size=max(len(pairs), 1), show_progress_bar=False)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            self.stats["requests"] += len(requests)
+            self.stats["batches"] += 1
+            self.stats["pairs_scored"] += len(pairs)
+            offset = 0
+            for request_pairs, future in requests:
+                future.set_result(scores[offset:offset + len(request_pairs)])
+                offset += len(request_pairs)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Returns the process-wide Reranker."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
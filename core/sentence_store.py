@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+import config
+from collections import OrderedDict
+from core.model_registry import get_sentence_transformer
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?]) +')
+
+
+def split_sentence_spans(text):
+    """
+    Splits text into sentences the same way as re.split(r'(?<=[.!?]) +', text),
+    returning (start, end) character offsets instead of substrings.
+    """
+    spans = []
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        spans.append((start, boundary.start()))
+        start = boundary.end()
+    spans.append((start, len(text)))
+    return [(start, end) for start, end in spans if end > start]
+
+
+class SentenceStore:
+    """
+    Persistent store of the sentence segmentation and sentence embeddings of chunks.
+
+    Entries are content-addressed by a hash of the sentence model name and the chunk text,
+    so they are computed once at ingestion and found again for any retrieved copy of the chunk.
+    Spans are stored as int32 offset pairs and embeddings as normalized float16 arrays; the
+    most recently used entries are also kept in memory.
+
+    The chunks ingested into each collection are recorded as references to their entry (see
+    for_collection). An entry is deleted with the last chunk referencing it, when chunks are
+    removed from a collection or the collection is deleted.
+    """
+
+    def __init__(
+                 self,
+                 path        = config.SENTENCE_STORE_PATH,
+                 model_name  = config.SENTENCE_TRANSFORMER_MODEL,
+                 memory_size = config.SENTENCE_STORE_MEMORY_ENTRIES
+                 ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sentences ("
+            "key TEXT PRIMARY KEY, spans BLOB NOT NULL, vectors BLOB NOT NULL, dim INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_sentences ("
+            "collection_name TEXT NOT NULL, chunk_id TEXT NOT NULL, key TEXT NOT NULL, "
+            "PRIMARY KEY (collection_name, chunk_id)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_sentences_key ON chunk_sentences(key)")
+        self._conn.commit()
+
+    def make_key(self, text):
+        return hashlib.sha256(f"{self.model_name}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def for_collection(self, collection_name):
+        """Returns the secondary index of a collection, for the embedding writer."""
+        return CollectionSentences(self, collection_name)
+
+    def add_chunks(self, collection_name, chunk_ids, texts, replace=True):
+        """
+        Segments and embeds chunk texts that are not stored yet, and records the chunks of the
+        collection referencing them. With replace=False, chunks already recorded are left as is.
+        """
+        self.get_many(texts)
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO chunk_sentences (collection_name, chunk_id, key) VALUES (?, ?, ?)",
+                [(collection_name, chunk_id, self.make_key(text)) for chunk_id, text in zip(chunk_ids, texts)]
+            )
+            self._conn.commit()
+
+    def delete_chunks(self, collection_name, chunk_ids):
+        """Forgets chunks of a collection, and deletes the entries no other chunk references."""
+        with self._lock:
+            keys = set()
+            for start in range(0, len(chunk_ids), 500):
+                chunk = list(chunk_ids[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                keys.update(key for key, in self._conn.execute(
+                    f"SELECT key FROM chunk_sentences WHERE collection_name = ? AND chunk_id IN ({placeholders})",
+                    (collection_name, *chunk)
+                ))
+                self._conn.execute(
+                    f"DELETE FROM chunk_sentences WHERE collection_name = ? AND chunk_id IN ({placeholders})",
+                    (collection_name, *chunk)
+                )
+            removed = self._delete_unreferenced(keys)
+            self._conn.commit()
+        logging.info("Removed %d chunks of collection '%s' from the sentence store, %d entries deleted.", len(chunk_ids), collection_name, removed)
+
+    def delete_collection(self, collection_name):
+        """Forgets all chunks of a collection, and deletes the entries no other chunk references."""
+        with self._lock:
+            keys = {key for key, in self._conn.execute(
+                "SELECT DISTINCT key FROM chunk_sentences WHERE collection_name = ?", (collection_name,)
+            )}
+            self._conn.execute("DELETE FROM chunk_sentences WHERE collection_name = ?", (collection_name,))
+            removed = self._delete_unreferenced(keys)
+            self._conn.commit()
+        logging.info("Removed collection '%s' from the sentence store, %d entries deleted.", collection_name, removed)
+
+    def _delete_unreferenced(self, keys):
+        # Called with the lock held
+        removed = 0
+        for key in keys:
+            if self._conn.execute("SELECT 1 FROM chunk_sentences WHERE key = ? LIMIT 1", (key,)).fetchone() is None:
+                removed += self._conn.execute("DELETE FROM sentences WHERE key = ?", (key,)).rowcount
+                self._memory.pop(key, None)
+        return removed
+
+    def get_many(self, texts):
+        """
+        Returns a list of (spans, vectors) for each text: spans is an (n, 2) int32 array of
+        sentence offsets and vectors an (n, dim) float32 array of normalized embeddings.
+        Missing entries are computed with a single batched encode call and stored.
+        """
+        keys = [self.make_key(text) for text in texts]
+        results = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[key] = self._memory[key]
+            missing_keys = [key for key in dict.fromkeys(keys) if key not in results]
+            for start in range(0, len(missing_keys), 500):
+                chunk = missing_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, spans, vectors, dim FROM sentences WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, spans, vectors, dim in rows:
+                    results[key] = (
+                        np.frombuffer(spans, dtype=np.int32).reshape(-1, 2),
+                        np.frombuffer(vectors, dtype=np.float16).reshape(-1, dim).astype(np.float32)
+                    )
+
+        to_compute = {key: text for key, text in zip(keys, texts) if key not in results}
+        if to_compute:
+            results.update(self._compute(to_compute))
+
+        with self._lock:
+            for key in keys:
+                self._memory[key] = results[key]
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+        return [results[key] for key in keys]
+
+    def _compute(self, texts_by_key):
+        spans_by_key = {key: split_sentence_spans(text) for key, text in texts_by_key.items()}
+        sentences = [text[start:end] for key, text in texts_by_key.items() for start, end in spans_by_key[key]]
+
+        model = get_sentence_transformer(self.model_name)
+        dim = model.get_sentence_embedding_dimension()
+        if sentences:
+            vectors = model.encode(sentences, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+
+        results = {}
+        rows = []
+        offset = 0
+        for key, spans in spans_by_key.items():
+            span_array = np.asarray(spans, dtype=np.int32).reshape(-1, 2)
+            key_vectors = vectors[offset:offset + len(spans)]
+            offset += len(spans)
+            results[key] = (span_array, key_vectors)
+            rows.append((key, span_array.tobytes(), key_vectors.astype(np.float16).tobytes(), dim))
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO sentences (key, spans, vectors, dim) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+        logging.info("Computed sentence embeddings of %d chunks (%d sentences).", len(texts_by_key), len(sentences))
+        return results
+
+
+class CollectionSentences:
+    """The sentence store seen as a secondary index of one collection (add and delete by chunk ID)."""
+
+    def __init__(self, store, collection_name):
+        self.store = store
+        self.collection_name = collection_name
+
+    def add(self, chunk_ids, texts, replace=True):
+        self.store.add_chunks(self.collection_name, chunk_ids, texts, replace)
+
+    def delete(self, chunk_ids):
+        self.store.delete_chunks(self.collection_name, chunk_ids)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_sentence_store(path=config.SENTENCE_STORE_PATH):
+    """Returns the process-wide SentenceStore stored at `path`."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = SentenceStore(path=path)
+            _stores[path] = store
+        return store
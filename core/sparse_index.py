@@ -0,0 +1,225 @@
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import config
+from collections import Counter
+from utils.file_helper import TOKEN_PATTERN
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+SUBTOKEN_PATTERN = re.compile(r"[^\w]+")
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms for the sparse index. Compound technical tokens
+    are indexed both whole and by their parts, so 'AB-0003' also matches '0003'.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = [part for part in SUBTOKEN_PATTERN.split(token) if part]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class SparseIndex:
+    """
+    Persistent BM25 inverted index of the chunks of one collection.
+
+    Postings are stored in an SQLite file that is memory-mapped for reads, and kept up
+    to date incrementally as chunks are added or deleted, so no index is rebuilt per query.
+    """
+
+    def __init__(self, path, k1=config.BM25_K1, b=config.BM25_B):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={config.SPARSE_INDEX_MMAP_BYTES}")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)"
+            ") WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id);"
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add(self, chunk_ids, texts, replace=True):
+        """
+        Indexes chunks. Chunks already in the index are re-indexed when `replace` is True
+        and left untouched otherwise.
+        """
+        # The last text of a chunk ID given twice wins
+        rows = dict(zip(chunk_ids, texts))
+        term_counts = {chunk_id: Counter(tokenize(text)) for chunk_id, text in rows.items()}
+        with self._lock:
+            # The write lock is taken before reading the existing chunks, so another connection
+            # to the file (another process) cannot add them in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._existing(rows)
+                if replace:
+                    self._delete(existing)
+
+                postings = []
+                df_delta = Counter()
+                for chunk_id, counts in term_counts.items():
+                    if not replace and chunk_id in existing:
+                        continue
+                    # OR IGNORE: a chunk already indexed is never indexed twice
+                    inserted = self._conn.execute(
+                        "INSERT OR IGNORE INTO docs (chunk_id, length) VALUES (?, ?)", (chunk_id, sum(counts.values()))
+                    ).rowcount
+                    if not inserted:
+                        continue
+                    for term, tf in counts.items():
+                        postings.append((term, chunk_id, tf))
+                        df_delta[term] += 1
+
+                self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+                self._conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                    df_delta.items()
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def build_if_empty(self, load):
+        """
+        Indexes the chunks returned by `load()` as (chunk_ids, texts) if the index is empty.
+        Concurrent callers wait for the first build instead of loading the chunks again.
+        """
+        with self._build_lock:
+            if len(self) > 0:
+                return False
+            chunk_ids, texts = load()
+            if not chunk_ids:
+                return False
+            self.add(chunk_ids, texts, replace=False)
+            return True
+
+    def delete(self, chunk_ids):
+        with self._lock:
+            self._delete(self._existing(chunk_ids))
+            self._conn.commit()
+
+    def search(self, query, k=config.SPARSE_TOP_K):
+        """Returns up to `k` (chunk_id, score) pairs ranked by BM25 score."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count, total_length = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if doc_count == 0:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                "SELECT p.chunk_id, p.tf, d.length, t.df FROM postings p "
+                "JOIN docs d ON d.chunk_id = p.chunk_id JOIN terms t ON t.term = p.term "
+                f"WHERE p.term IN ({placeholders})",
+                terms
+            ).fetchall()
+
+        average_length = total_length / doc_count
+        scores = Counter()
+        for chunk_id, tf, length, df in rows:
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+        return scores.most_common(k)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _existing(self, chunk_ids):
+        found = set()
+        chunk_ids = list(chunk_ids)
+        for start in range(0, len(chunk_ids), 500):
+            chunk = chunk_ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT chunk_id FROM docs WHERE chunk_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def _delete(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            terms = self._conn.execute("SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,)).fetchall()
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+            self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM docs WHERE chunk_id = ?", (chunk_id,))
+        if chunk_ids:
+            self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+
+def reciprocal_rank_fusion(rankings, k=config.RRF_K, with_scores=False):
+    """
+    Fuses several rankings of IDs with reciprocal rank fusion.
+    Returns the IDs ordered by their fused score sum(1 / (k + rank)),
+    or (ID, score) pairs when `with_scores` is True.
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] += 1.0 / (k + rank)
+    if with_scores:
+        return scores.most_common()
+    return [item_id for item_id, _ in scores.most_common()]
+
+
+def sparse_index_path(collection_name, persist_directory=config.PERSIST_DIRECTORY):
+    return os.path.join(persist_directory, "sparse", f"{collection_name}.sqlite")
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_sparse_index(collection_name, persist_directory=config.PERSIST_DIRECTORY):
+    """Returns the process-wide SparseIndex of a collection, opening it on first use."""
+    path = sparse_index_path(collection_name, persist_directory)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = SparseIndex(path)
+            _indexes[path] = index
+        return index
+
+
+def delete_sparse_index(collection_name, persist_directory=config.PERSIST_DIRECTORY):
+    """Closes and removes the sparse index files of a collection."""
+    path = sparse_index_path(collection_name, persist_directory)
+    with _indexes_lock:
+        index = _indexes.pop(path, None)
+        if index is not None:
+            index.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,201 @@
+"""
+Bulk ingestion of PDF files into ChromaDB collections from the command line.
+
+Examples:
+    python ingest.py ./manuals                       # one collection per file
+    python ingest.py "./archive/**/*.pdf" --collection archive_collection
+    python ingest.py ./reports --group-by directory --jobs 4
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from core.document_processor import process_pdf_to_chroma_db
+from utils.file_helper import collection_name_for_file
+
+logging.basicConfig(
+    level=config.LOGGING_LEVEL,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def discover_pdfs(patterns, recursive=True):
+    """
+    Expands directories and glob patterns into a sorted list of PDF paths.
+    Directories are searched recursively unless `recursive` is False.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.pdf") if recursive else os.path.join(pattern, "*.pdf")
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and path.lower().endswith(".pdf"):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def _checkpoint_key(path, collection_name):
+    # Size and modification time identify the version of the file without reading it
+    stat = os.stat(path)
+    return f"{collection_name}\x1f{path}\x1f{stat.st_size}\x1f{stat.st_mtime_ns}"
+
+
+def load_checkpoint(checkpoint_path):
+    """Returns the keys of the files completed by previous runs."""
+    completed = set()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    completed.add(json.loads(line)["key"])
+    return completed
+
+
+def bulk_ingest(
+                pdf_paths,
+                collection_name   = None,
+                group_by          = "file",
+                jobs              = config.BULK_INGEST_CONCURRENCY,
+                checkpoint_path   = config.BULK_INGEST_CHECKPOINT_PATH,
+                persist_directory = config.PERSIST_DIRECTORY,
+                model             = config.EMBEDDING_MODEL
+                ):
+    """
+    Ingests PDF files into ChromaDB, `jobs` documents at a time. Each document is extracted
+    by the sharded process pool and embedded by the streaming writer of process_pdf_to_chroma_db.
+
+    Completed files are appended to the checkpoint file, so an interrupted run skips them when
+    started again; a document interrupted half-way resumes from the chunks already stored.
+
+    Args:
+        pdf_paths (list): Paths of the PDF files.
+        collection_name (str): Single target collection. When None, `group_by` decides.
+        group_by (str): "file" for one collection per file, "directory" for one per parent directory.
+        jobs (int): Number of documents ingested concurrently.
+        checkpoint_path (str): JSON Lines file recording the completed files. None disables it.
+
+    Returns:
+        dict: Throughput summary of the run.
+    """
+    if checkpoint_path:
+        directory = os.path.dirname(checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    completed = load_checkpoint(checkpoint_path)
+    checkpoint_lock = threading.Lock()
+
+    # Document IDs are file names, so two files with the same name cannot share a collection
+    tasks = []
+    summary = {"files": len(pdf_paths), "ingested": 0, "skipped": 0, "failed": 0, "pages": 0, "chunks": 0, "embeddings": 0}
+    seen_documents = {}
+    for path in pdf_paths:
+        if collection_name:
+            target = collection_name
+        elif group_by == "directory":
+            target = collection_name_for_file(os.path.basename(os.path.dirname(path)) + ".pdf")
+        else:
+            target = collection_name_for_file(os.path.basename(path))
+        document_key = (target, os.path.basename(path))
+        if document_key in seen_documents:
+            logging.error("Skipping '%s': '%s' is already ingested into '%s' as the same document.", path, seen_documents[document_key], target)
+            summary["failed"] += 1
+            continue
+        seen_documents[document_key] = path
+
+        key = _checkpoint_key(path, target)
+        if key in completed:
+            summary["skipped"] += 1
+            continue
+        tasks.append((path, target, key))
+
+    logging.info("Ingesting %d of %d files (%d already completed).", len(tasks), len(pdf_paths), summary["skipped"])
+
+    def ingest(path, target, key):
+        result = process_pdf_to_chroma_db(
+            pdf_path=path,
+            persist_directory=persist_directory,
+            model=model,
+            collection_name=target,
+            update=True
+        )
+        if checkpoint_path:
+            with checkpoint_lock, open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "path": path, "collection": target, "result": result, "finished_at": time.time()}) + "\n")
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="bulk-ingest") as executor:
+        futures = {executor.submit(ingest, *task): task for task in tasks}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                path, target, _ = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error("Failed to ingest '%s' into '%s': %s", path, target, e)
+                    summary["failed"] += 1
+                    continue
+
+                if result is None:
+                    # Already up to date in the collection
+                    summary["skipped"] += 1
+                else:
+                    summary["ingested"] += 1
+                    summary["pages"] += result["pages"]
+                    summary["chunks"] += result["chunks"]
+                    summary["embeddings"] += result["embedded"]
+                logging.info("[%d/%d] %s -> %s", done, len(tasks), path, target)
+        except KeyboardInterrupt:
+            logging.warning("Interrupted: waiting for the running documents, the rest is left for the next run.")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = round(elapsed, 2)
+    for unit in ("pages", "chunks", "embeddings"):
+        summary[f"{unit}_per_second"] = round(summary[unit] / elapsed, 2) if elapsed > 0 else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest PDF files, directories or glob patterns into ChromaDB collections.")
+    parser.add_argument("paths", nargs="+", help="PDF files, directories or glob patterns (quote patterns such as '**/*.pdf').")
+    parser.add_argument("--collection", help="Ingest every file into this collection.")
+    parser.add_argument("--group-by", choices=("file", "directory"), default="file",
+                        help="Without --collection: one collection per file (default) or per parent directory.")
+    parser.add_argument("--jobs", type=int, default=config.BULK_INGEST_CONCURRENCY, help="Documents ingested concurrently.")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not search directories recursively.")
+    parser.add_argument("--checkpoint", default=config.BULK_INGEST_CHECKPOINT_PATH, help="Checkpoint file of the completed files.")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Ignore and do not write the checkpoint file.")
+    parser.add_argument("--persist-directory", default=config.PERSIST_DIRECTORY, help="ChromaDB directory.")
+    args = parser.parse_args(argv)
+
+    pdf_paths = discover_pdfs(args.paths, recursive=not args.no_recursive)
+    if not pdf_paths:
+        parser.error("No PDF files found.")
+
+    summary = bulk_ingest(
+        pdf_paths,
+        collection_name=args.collection,
+        group_by=args.group_by,
+        jobs=args.jobs,
+        checkpoint_path=None if args.no_checkpoint else args.checkpoint,
+        persist_directory=args.persist_directory
+    )
+    print(
+        f"Ingested {summary['ingested']} files ({summary['skipped']} skipped, {summary['failed']} failed) "
+        f"in {summary['seconds']}s: {summary['pages']} pages ({summary['pages_per_second']} pages/s), "
+        f"{summary['chunks']} chunks ({summary['chunks_per_second']} chunks/s), "
+        f"{summary['embeddings']} embeddings ({summary['embeddings_per_second']} embeddings/s)."
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The application modules are imported from the repository root (config, core, utils)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
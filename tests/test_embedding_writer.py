@@ -0,0 +1,96 @@
+import threading
+import chromadb
+import pytest
+from langchain_core.documents import Document
+from langchain_ollama import OllamaEmbeddings
+from benchmarks.fake_ollama import FakeOllamaServer
+from core.embedding_writer import EmbeddingWriter
+
+
+def make_docs(count):
+    return [Document(page_content=f"chunk number {i} about valve {i % 5}", metadata={"page": i // 4}) for i in range(count)]
+
+
+@pytest.fixture
+def collection(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path / "db"))
+    return client.get_or_create_collection(name="test_collection", embedding_function=None)
+
+
+def write(collection, server, docs, **options):
+    embeddings = OllamaEmbeddings(model="fake", base_url=server.url)
+    options = {"batch_size": 4, "max_in_flight": 2, "retry_backoff": 0.0, **options}
+    with EmbeddingWriter(collection, embeddings, document_id="manual.pdf", **options) as writer:
+        for doc in docs:
+            writer.put(doc)
+    return writer
+
+
+def test_writes_every_chunk(collection):
+    with FakeOllamaServer() as server:
+        writer = write(collection, server, make_docs(10))
+    assert writer.stats["embedded"] == 10
+    assert writer.stats["batches"] == 3
+    assert collection.count() == 10
+    assert set(collection.get(include=[])["ids"]) == writer.chunk_ids
+
+
+def test_retries_failed_embedding_requests(collection):
+    with FakeOllamaServer(failed_embed_requests=2) as server:
+        writer = write(collection, server, make_docs(4), max_in_flight=1, max_retries=3)
+    assert writer.stats["retries"] == 2
+    assert writer.stats["failed_batches"] == 0
+    assert collection.count() == 4
+
+
+def test_raises_after_the_last_retry(collection):
+    with FakeOllamaServer(failed_embed_requests=1000) as server:
+        with pytest.raises(RuntimeError):
+            # More chunks than the queue holds: put() must not block once a batch failed for good
+            write(collection, server, make_docs(50), max_retries=1, queue_size=2)
+    assert collection.count() == 0
+
+
+def test_resume_skips_stored_chunks(collection):
+    docs = make_docs(12)
+    with FakeOllamaServer() as server:
+        write(collection, server, docs[:8])
+        embedded_before = server.stats["embedded_texts"]
+        writer = write(collection, server, docs)
+    assert writer.stats["skipped"] == 8
+    assert writer.stats["embedded"] == 4
+    assert server.stats["embedded_texts"] - embedded_before == 4
+    assert collection.count() == 12
+
+
+def test_write_failure_is_reported(collection):
+    class FailingIndex:
+        def add(self, chunk_ids, texts, replace=True):
+            raise RuntimeError("index unavailable")
+
+    with FakeOllamaServer() as server:
+        with pytest.raises(RuntimeError, match="index unavailable"):
+            write(collection, server, make_docs(10), indexes=[FailingIndex()], queue_size=2)
+
+
+def test_dispatch_failure_does_not_block_producers(collection):
+    class LockedCollection:
+        """A collection whose database is locked: looking up stored chunks fails."""
+
+        def get(self, **kwargs):
+            raise RuntimeError("database is locked")
+
+    errors = []
+
+    def run(server):
+        try:
+            write(LockedCollection(), server, make_docs(50), queue_size=2)
+        except RuntimeError as e:
+            errors.append(e)
+
+    with FakeOllamaServer() as server:
+        producer = threading.Thread(target=run, args=(server,), daemon=True)
+        producer.start()
+        producer.join(10)
+    assert not producer.is_alive(), "put() or close() blocked after the dispatcher failed"
+    assert "database is locked" in str(errors[0])
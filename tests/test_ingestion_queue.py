@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+import pytest
+import core.document_processor as document_processor
+from core.document_processor import IngestionCancelled
+from core.ingestion_queue import IngestionQueue
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    job_queue = IngestionQueue(str(tmp_path / "jobs.sqlite"), str(tmp_path / "uploads"))
+    yield job_queue
+    job_queue.stop_workers()
+
+
+def wait_for_status(job_queue, job_id, statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} is still {job_queue.get(job_id)['status']}.")
+
+
+def blocking_ingestion(started):
+    """An ingestion that runs until cancelled, as a long PDF would."""
+    def process_pdf_to_chroma_db(pdf_path, cancelled, progress, **kwargs):
+        started.set()
+        while not cancelled():
+            time.sleep(0.02)
+        raise IngestionCancelled("cancelled")
+    return process_pdf_to_chroma_db
+
+
+def test_submit_deduplicates_active_jobs(job_queue):
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4 one", "manuals")
+    assert job_queue.submit("manual.pdf", b"%PDF-1.4 one", "manuals")["id"] == job["id"]
+    assert job_queue.submit("manual.pdf", b"%PDF-1.4 one", "other")["id"] != job["id"]
+    assert job["status"] == "queued"
+    assert os.path.exists(job["file_path"])
+
+
+def test_completed_job_removes_upload(job_queue, monkeypatch):
+    def process_pdf_to_chroma_db(pdf_path, progress, **kwargs):
+        progress("write", 1, 1)
+        return {"chunks": 1}
+
+    monkeypatch.setattr(document_processor, "process_pdf_to_chroma_db", process_pdf_to_chroma_db)
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4", "manuals")
+    job_queue.start_workers(1)
+    job = wait_for_status(job_queue, job["id"], {"completed"})
+    assert job["result"] == {"chunks": 1}
+    assert not os.path.exists(job["file_path"])
+
+
+def test_failed_job_records_error(job_queue, monkeypatch):
+    def process_pdf_to_chroma_db(**kwargs):
+        raise ValueError("broken PDF")
+
+    monkeypatch.setattr(document_processor, "process_pdf_to_chroma_db", process_pdf_to_chroma_db)
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4", "manuals")
+    job_queue.start_workers(1)
+    job = wait_for_status(job_queue, job["id"], {"failed"})
+    assert job["error"] == "broken PDF"
+    assert not os.path.exists(job["file_path"])
+
+
+def test_cancel_queued_job(job_queue):
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4", "manuals")
+    job_queue.cancel(job["id"])
+    assert job_queue.get(job["id"])["status"] == "cancelled"
+    assert not os.path.exists(job["file_path"])
+
+
+def test_cancel_running_job(job_queue, monkeypatch):
+    started = threading.Event()
+    monkeypatch.setattr(document_processor, "process_pdf_to_chroma_db", blocking_ingestion(started))
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4", "manuals")
+    job_queue.start_workers(1)
+    assert started.wait(10)
+    job_queue.cancel(job["id"])
+    job = wait_for_status(job_queue, job["id"], {"cancelled"})
+    assert not os.path.exists(job["file_path"])
+
+
+def test_stop_requeues_running_job_and_keeps_upload(job_queue, monkeypatch):
+    started = threading.Event()
+    monkeypatch.setattr(document_processor, "process_pdf_to_chroma_db", blocking_ingestion(started))
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4", "manuals")
+    job_queue.start_workers(1)
+    assert started.wait(10)
+    job_queue.stop_workers()
+
+    job = job_queue.get(job["id"])
+    assert job["status"] == "queued"
+    assert os.path.exists(job["file_path"])
+
+    # The next start resumes it from the kept upload
+    paths = []
+
+    def process_pdf_to_chroma_db(pdf_path, **kwargs):
+        paths.append(pdf_path)
+        return {"chunks": 1}
+
+    monkeypatch.setattr(document_processor, "process_pdf_to_chroma_db", process_pdf_to_chroma_db)
+    job_queue.start_workers(1)
+    wait_for_status(job_queue, job["id"], {"completed"})
+    assert paths == [job["file_path"]]
+
+
+def test_orphaned_running_job_is_requeued(tmp_path):
+    path, uploads = str(tmp_path / "jobs.sqlite"), str(tmp_path / "uploads")
+    job_queue = IngestionQueue(path, uploads)
+    job = job_queue.submit("manual.pdf", b"%PDF-1.4", "manuals")
+    # Claimed by a process that no longer exists
+    assert job_queue._claim(worker_pid=2 ** 22 + 1)["status"] == "running"
+
+    restarted = IngestionQueue(path, uploads)
+    with restarted._lock:
+        restarted._requeue_orphaned_jobs()
+    assert restarted.get(job["id"])["status"] == "queued"
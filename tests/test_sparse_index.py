@@ -0,0 +1,73 @@
+import pytest
+from core.sparse_index import SparseIndex, reciprocal_rank_fusion
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SparseIndex(str(tmp_path / "sparse.sqlite"))
+    yield index
+    index.close()
+
+
+def test_ranks_by_bm25(index):
+    index.add(
+        ["pump", "valve", "valve-manual", "other"],
+        [
+            "replace the pump seal",
+            "the relief valve opens at 3.5 bar",
+            "valve maintenance: check the valve seat and the valve spring every year",
+            "general safety instructions"
+        ]
+    )
+    hits = index.search("valve", k=10)
+    assert [chunk_id for chunk_id, _ in hits] == ["valve-manual", "valve"]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_indexes_technical_tokens_whole_and_by_parts(index):
+    index.add(["a", "b"], ["part ab-0003 is the gasket", "part ab is the housing"])
+    assert [chunk_id for chunk_id, _ in index.search("ab-0003")] == ["a", "b"]
+    assert [chunk_id for chunk_id, _ in index.search("0003")] == ["a"]
+
+
+def test_delete_removes_chunks(index):
+    index.add(["a", "b"], ["pump seal", "pump motor"])
+    index.delete(["a"])
+    assert len(index) == 1
+    assert [chunk_id for chunk_id, _ in index.search("pump seal")] == ["b"]
+
+
+def test_add_without_replace_is_idempotent(index):
+    index.add(["a", "b"], ["pump seal", "valve seat"])
+    scores = index.search("pump")
+    index.add(["a", "b", "b"], ["pump seal", "valve seat", "valve seat"], replace=False)
+    assert len(index) == 2
+    assert index.search("pump") == scores
+
+
+def test_add_with_replace_reindexes(index):
+    index.add(["a"], ["pump seal"])
+    index.add(["a"], ["valve seat"])
+    assert index.search("pump") == []
+    assert [chunk_id for chunk_id, _ in index.search("valve")] == ["a"]
+
+
+def test_build_if_empty_loads_once(index):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return ["a"], ["pump seal"]
+
+    assert index.build_if_empty(load)
+    assert not index.build_if_empty(load)
+    assert len(loads) == 1
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62
+    assert fused == ["a", "c", "b"]
+    scores = dict(reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60, with_scores=True))
+    assert scores["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores["b"] == pytest.approx(1 / 62)
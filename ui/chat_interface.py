@@ -1,15 +1,30 @@
 import streamlit as st
 import logging
 import config
-from core.rag_manager import generate_rag_response, highlight_relevant_passages
+from core.metrics import start_trace
+from core.rag_manager import stream_rag_response, highlight_relevant_passages
 
 logging.basicConfig(
     level=config.LOGGING_LEVEL,
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
-def render_chat_interface(collection_name: str):    
-    st.markdown(f"You are querying the collection: **{collection_name}**")
+def render_timings(timings, total_seconds):
+    """Renders the per-stage timings of an answer as a table."""
+    with st.expander(f"Timings ({total_seconds * 1000:.0f} ms)", expanded=False):
+        rows = ["| Stage | Time (ms) | Calls | Counts |", "| --- | ---: | ---: | --- |"]
+        for stage, entry in timings.items():
+            counts = ", ".join(f"{key}: {value}" for key, value in entry.items() if key not in ("seconds", "calls"))
+            rows.append(f"| {stage} | {entry['seconds'] * 1000:.1f} | {entry['calls']} | {counts} |")
+        st.markdown("\n".join(rows))
+        st.caption("Stages run inside retrieve (plan, rewrite, embed_query, federated_search, mmr_search, sparse_search) are also counted in it.")
+
+def render_chat_interface(collection_name):
+    """Renders the chat over a collection, or over a list of collections (federated search)."""
+    if isinstance(collection_name, list):
+        st.markdown("You are querying the collections: " + ", ".join(f"**{name}**" for name in collection_name))
+    else:
+        st.markdown(f"You are querying the collection: **{collection_name}**")
 
     # Initialize chat history in session state
     if "messages" not in st.session_state:
@@ -37,36 +52,59 @@ def render_chat_interface(collection_name: str):
                                 page = metadata.get("page") or metadata.get("page_number")
                                 keywords = metadata.get("keywords", "")
                                 md = ""
+                                if metadata.get("collection_name"):
+                                    md += f"- **Collection:** {metadata['collection_name']}\n"
                                 if page is not None:
                                     md += f"- **Page:** {page}\n"
                                 if keywords:
                                     md += f"- **Keywords:** {keywords}\n"
                                 if md:
                                     st.markdown(f"<span style='font-size: 0.85em'><b>Other Informations:</b><br>{md}</span>", unsafe_allow_html=True)
+            if message["role"] == "assistant" and "timings" in message:
+                render_timings(message["timings"], message["total_seconds"])
 
 
     # Accept user input
     if question := st.chat_input("Type your question here..."):
         # Add user message to chat history
         st.session_state.messages.append({"role": "user", "content": question})
-        # Generate and add assistant response to chat history
-        with st.spinner("Generating RAG response..."):
+        with st.chat_message("user"):
+            st.markdown(question)
+
+        chat_history = [
+            {"role": msg["role"], "content": msg["content"]} 
+            for msg in st.session_state.messages[: -1]
+        ]
 
-            chat_history = [
-                {"role": msg["role"], "content": msg["content"]} 
-                for msg in st.session_state.messages[: -1]
-            ]
+        # Time the stages of the answer when instrumentation is enabled (a no-op otherwise)
+        trace = start_trace("query", collection=collection_name, model=config.LOCAL_MODEL)
 
-            answer, sources = generate_rag_response(
-                question=question,
-                collection_name=collection_name,
-                embedding_model=config.EMBEDDING_MODEL,
-                chat_history=chat_history
-            )
+        # Generate the assistant response, rendering the answer while it is being produced
+        with st.chat_message("assistant"):
+            with st.spinner("Retrieving relevant documents..."):
+                token_stream, sources = stream_rag_response(
+                    question=question,
+                    collection_name=collection_name,
+                    embedding_model=config.EMBEDDING_MODEL,
+                    chat_history=chat_history,
+                    trace=trace
+                )
+            st.caption(f"Retrieved {len(sources)} sources.")
 
-            answer, highlighted_sources = highlight_relevant_passages(answer, sources)
+            answer = st.write_stream(token_stream)
+
+            # Highlighting needs the complete answer, so it runs once the stream is exhausted
+            with st.spinner("Highlighting relevant passages..."):
+                answer, highlighted_sources = highlight_relevant_passages(answer, sources)
             logging.info("Generated response with highlighted sources.")
-            st.session_state.messages.append({"role": "assistant", "content": answer, "sources": highlighted_sources})
+        trace.finish()
+
+        # Add assistant response to chat history
+        message = {"role": "assistant", "content": answer, "sources": highlighted_sources}
+        if config.METRICS_TIMING_PANEL and trace.enabled:
+            message["timings"] = trace.summary()
+            message["total_seconds"] = trace.seconds
+        st.session_state.messages.append(message)
         
         # Rerun the app to display the new messages from history
-        st.rerun()
\ No newline at end of file
+        st.rerun()
@@ -2,13 +2,18 @@ import streamlit as st
 import logging
 import config
 import json
-import chromadb
 import time
-import os
-from core.document_processor import delete_chroma_collection, process_pdf_to_chroma_db
+from core.collection_catalog import get_collection_catalog
+from core.document_processor import delete_chroma_collection
+from core.ingestion_queue import INGESTION_STAGES, get_ingestion_queue
+from core.rag_engine import get_engine
+from utils.file_helper import collection_name_for_file
 
 
-chromadb_client = chromadb.PersistentClient(path=config.PERSIST_DIRECTORY)
+chromadb_client = get_engine().chroma_client
+# Collections are listed from the catalog kept up to date by ingestion and deletion,
+# not by scanning ChromaDB on every rerun
+collection_catalog = get_collection_catalog()
 
 logging.basicConfig(
     level=config.LOGGING_LEVEL,
@@ -27,32 +32,71 @@ def download_chat():
     chat_json = json.dumps(chat_history, indent=2)
     return chat_json
 
+@st.fragment(run_every=2)
+def render_ingestion_jobs():
+    """Shows the progress of the recent ingestion jobs, refreshing on its own while they run."""
+    job_queue = get_ingestion_queue()
+    jobs = job_queue.list_jobs(limit=5)
+    if not jobs:
+        return
+
+    st.subheader("Ingestion Jobs")
+    for job in jobs:
+        st.write(f"**{job['file_name']}** → {job['collection_name']}: {job['status']}")
+        if job["status"] == "running":
+            # Windows of pages go through every stage in turn, so the stages advance together
+            stages = [(stage, *job["progress"].get(stage, [0, 0])) for stage in INGESTION_STAGES]
+            fraction = sum(done / total for _, done, total in stages if total) / len(INGESTION_STAGES)
+            st.progress(min(fraction, 1.0), text=" · ".join(f"{stage} {done}/{total}" for stage, done, total in stages))
+        if job["status"] in ("queued", "running") and not job["cancel_requested"]:
+            if st.button("Cancel", key=f"cancel_job_{job['id']}", type="secondary", icon=":material/cancel:"):
+                job_queue.cancel(job["id"])
+                st.rerun(scope="fragment")
+        elif job["status"] == "failed":
+            st.error(job["error"])
+
 def render_sidebar():
     with st.sidebar:
         st.header("ChromaDB Collections", divider=True)
 
         st.subheader("Existing Collections")
         
-        list_collections = chromadb_client.list_collections()
+        collection_names = collection_catalog.collection_names()
         selected_collection = None
 
-        if list_collections:
-            collection_names = [collection.name for collection in list_collections]
-            selected_collection = st.selectbox(
-                "Select a collection to query:",
-                options=collection_names,
-            )
+        if collection_names:
+            # Federated search: the question is answered from several collections at once
+            if st.toggle("Query several collections", key="federated_search"):
+                selected_collection = st.multiselect(
+                    "Select the collections to query:",
+                    options=collection_names,
+                    default=collection_names[:1]
+                ) or None
+            else:
+                selected_collection = st.selectbox(
+                    "Select a collection to query:",
+                    options=collection_names,
+                )
         else:
             st.write("No collections found.")
 
-        # Refresh button to reload the collections
+        if isinstance(selected_collection, str):
+            entry = collection_catalog.get(selected_collection)
+            if entry and entry["documents"]:
+                st.caption(
+                    f"{len(entry['documents'])} document(s), {entry['chunks']} chunks"
+                    + (f", embedded with {entry['embedding_model']}" if entry["embedding_model"] else "")
+                    + (f", ingested {entry['ingested_at']}" if entry["ingested_at"] else "")
+                )
+
+        # Refresh button to rebuild the catalog from ChromaDB, e.g. after collections were changed by another tool
         if st.button(label="Refresh Collections", type="secondary", use_container_width=False, icon=":material/refresh:"):
+            collection_catalog.rebuild(chromadb_client)
             st.rerun()
 
         # Remove collection Button
         st.header("Remove Collection", divider="red")
-        if list_collections:
-            collection_names = [collection.name for collection in list_collections]
+        if collection_names:
             collection_to_remove = st.selectbox(
                 "Select a collection to remove:",
                 options=collection_names,
@@ -87,23 +131,17 @@ def render_sidebar():
         uploaded_files = st.file_uploader("Upload File", accept_multiple_files=False, type=["pdf"])
 
         if uploaded_files is not None:
-            with st.spinner(f"Processing {uploaded_files.name}..."):
+            # A rerun keeps the file in the uploader: queue each upload only once
+            submitted_uploads = st.session_state.setdefault("submitted_uploads", set())
+            if uploaded_files.file_id not in submitted_uploads:
                 original_name = uploaded_files.name
                 # Replace spaces with underscores for a valid collection name
-                collection_name = original_name.replace(" ", "_").replace(".pdf", "_collection")
-                temp_file_path = f"./temp/temp_{original_name}"
-                with open(temp_file_path, "wb") as temp_file:
-                    temp_file.write(uploaded_files.getbuffer())
-                
-                process_pdf_to_chroma_db(
-                    pdf_path=temp_file_path,
-                    persist_directory=config.PERSIST_DIRECTORY,
-                    model=config.EMBEDDING_MODEL,
-                    collection_name=collection_name
-                )
-                os.remove(temp_file_path)
-                
-                st.success(f"Processed {original_name} and updated ChromaDB.")
+                collection_name = collection_name_for_file(original_name)
+                get_ingestion_queue().submit(original_name, uploaded_files.getvalue(), collection_name)
+                submitted_uploads.add(uploaded_files.file_id)
+                st.success(f"Queued {original_name} for processing.")
+
+        render_ingestion_jobs()
 
         st.header("Utility Buttons", divider=True)
 
@@ -1,9 +1,14 @@
 import chromadb
+import hashlib
 import logging
+import re
+import threading
+import time
 import camelot
 import fitz
 import config
-from langchain_community.document_loaders import PyMuPDFLoader
+from collections import Counter
+from datetime import datetime
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_ollama import OllamaEmbeddings
@@ -15,68 +20,315 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
+# PyMuPDF does not support concurrent use from several threads, even on different documents.
+# In-process readers (ingestion threads, Streamlit sessions) take turns; worker processes do not contend.
+_pdf_lock = threading.RLock()
+
+# Keeps technical tokens such as part numbers (ab-0003), versions (3.1) and paths whole
+TOKEN_PATTERN = re.compile(r"[\w][\w.\-/#+]*[\w#+]|[\w]")
+
 def normalize_text(text: str) -> str:
     """Cleans the text for embedding."""
     return text.replace("\n", " ").replace("\r", " ").strip().lower()
 
-def extract_images_from_pdf (file_path):
+def chunk_fingerprint(doc, document_id=""):
+    """
+    Returns a stable ID for a chunk, made of its page number and a hash of its content.
+    The same chunk of the same document always gets the same ID across ingestion runs.
+    """
+    page = doc.metadata.get("page", doc.metadata.get("page_number"))
+    content_type = doc.metadata.get("content_type", "text")
+    digest = hashlib.sha256(f"{document_id}\x1f{content_type}\x1f{page}\x1f{doc.page_content}".encode("utf-8")).hexdigest()
+    return f"{page}-{digest[:32]}"
+
+def file_sha256(file_path):
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def collection_name_for_file(file_name):
+    """Returns the default collection name of an uploaded file, e.g. 'My Manual.pdf' -> 'My_Manual_collection'."""
+    return file_name.replace(" ", "_").replace(".pdf", "_collection")
+
+def get_pdf_page_count(file_path):
+    """Returns the number of pages of a PDF file."""
+    with _pdf_lock, fitz.open(file_path) as doc:
+        return doc.page_count
+
+def _page_numbers(doc, page_range):
+    """Returns the zero-based page numbers of `doc` covered by `page_range` (start, stop)."""
+    if page_range is None:
+        return range(doc.page_count)
+    start, stop = page_range
+    return range(max(start, 0), min(stop, doc.page_count))
+
+def get_pdf_metadata(file_path):
+    """
+    Returns the document-level metadata that PyMuPDFLoader attaches to every page
+    (source, file_path, total_pages, title, author...), or None for an empty PDF.
+    """
+    with _pdf_lock, fitz.open(file_path) as doc:
+        return _document_metadata(doc, file_path)
+
+def _document_metadata(doc, file_path):
+    """
+    Builds the document-level metadata of PyMuPDFLoader from an open fitz Document,
+    with the same keys and values: lowercase keys, PDF dates in ISO format, strings stripped.
+    """
+    if doc.page_count == 0:
+        return None
+    fields = {
+        "producer": "PyMuPDF",
+        "creator": "PyMuPDF",
+        "creationdate": "",
+        "source": str(file_path),
+        "file_path": str(file_path),
+        "total_pages": doc.page_count,
+        **{k: v for k, v in doc.metadata.items() if isinstance(v, (str, int))}
+    }
+    metadata = {}
+    for key, value in fields.items():
+        key = key.lstrip("/").lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        elif isinstance(value, str):
+            value = value.strip()
+        metadata[key] = value
+    metadata["source"] = metadata["file_path"]
+    # The loader also keeps the raw PDF dates under their original names
+    for key in ("modDate", "creationDate"):
+        if key in doc.metadata:
+            metadata[key] = doc.metadata[key]
+    return metadata
+
+def _page_text_document(page, doc_metadata):
+    metadata = {**doc_metadata, "page": page.number}
+    return Document(page_content=page.get_text().strip(), metadata=metadata)
+
+def _page_image_documents(page):
+    """Returns the image caption Documents of a page, with the images ordered from top to bottom."""
+    image_docs = []
+    # The bounding box of each image is computed once, for sorting and for the caption search
+    images = [(img, page.get_image_bbox(img)) for img in page.get_images(full=True)]
+    images.sort(key=lambda image: image[1].y1)
+
+    for img_index, (img, img_bbox) in enumerate(images):
+        # Search for text below the image (potential caption)
+        # We define a search area below the image
+        search_area = fitz.Rect(img_bbox.x0, img_bbox.y1, img_bbox.x1, img_bbox.y1 + 50)
+        # A text page made for the whole page keeps every character the clip touches,
+        # so the caption search builds its own, clipped text page
+        text_in_area = page.get_text("text", clip=search_area, sort=True).strip()
+
+        caption = text_in_area if text_in_area else "No caption found"
+
+        # Create a document with the image description
+        content = f"[Image: An image is present on the page. Caption: '{caption}']"
+        normalized_content = normalize_text(content)
+        metadata = {
+            "content_type": "image_caption",
+            "page_number": page.number + 1,
+            "image_index_on_page": img_index,
+            "image_bbox": str([img_bbox.x0, img_bbox.y0, img_bbox.x1, img_bbox.y1])
+        }
+        image_docs.append(Document(page_content=normalized_content, metadata=metadata))
+    return image_docs
+
+def extract_text_from_pdf(file_path, page_range=None, doc_metadata=None):
+    """
+    Extracts the text of each page, producing the same Documents as PyMuPDFLoader.
+
+    Args:
+        file_path (str): Path of the PDF file.
+        page_range (tuple): Optional zero-based (start, stop) range of pages to extract.
+        doc_metadata (dict): Document-level metadata from get_pdf_metadata, if already known.
+    """
+    # The document-level metadata is identical on every page, so it is read once
+    # and reused for the pages of the requested range.
+    with _pdf_lock, fitz.open(file_path) as doc:
+        if doc_metadata is None:
+            doc_metadata = _document_metadata(doc, file_path)
+        if doc_metadata is None:
+            return []
+        return [_page_text_document(doc[page_num], doc_metadata) for page_num in _page_numbers(doc, page_range)]
+
+def extract_images_from_pdf (file_path, page_range=None):
     """Extracts images and tries to associate a nearby text caption."""
-    doc = fitz.open(file_path)
     image_docs = []
-    
-    for page_num, page in enumerate(doc):
-        image_list = page.get_images(full=True)
-        
-        # Sort images by vertical position to process them from top to bottom
-        image_list.sort(key=lambda img: page.get_image_bbox(img).y1)
-
-        for img_index, img in enumerate(image_list):
-            # Get the bounding box of the image
-            img_bbox = page.get_image_bbox(img)
-
-            # Search for text below the image (potential caption)
-            # We define a search area below the image
-            search_area = fitz.Rect(img_bbox.x0, img_bbox.y1, img_bbox.x1, img_bbox.y1 + 50)
-            text_in_area = page.get_text("text", clip=search_area, sort=True).strip()
-
-            caption = text_in_area if text_in_area else "No caption found"
-
-            # Create a document with the image description
-            content = f"[Image: An image is present on the page. Caption: '{caption}']"
-            normalized_content = normalize_text(content)
-            metadata = {
-                "content_type": "image_caption",
-                "page_number": page_num + 1,
-                "image_index_on_page": img_index,
-                "image_bbox": str([img_bbox.x0, img_bbox.y0, img_bbox.x1, img_bbox.y1])
-            }
-            image_docs.append(Document(page_content=normalized_content, metadata=metadata))
+    with _pdf_lock, fitz.open(file_path) as doc:
+        for page_num in _page_numbers(doc, page_range):
+            image_docs.extend(_page_image_documents(doc[page_num]))
 
     logging.info(f"Extracted {len(image_docs)} image captions from {file_path}")
     return image_docs
 
-def extract_tables_from_pdf(file_path):
-    """Extracts tables from a PDF and converts them to Markdown format."""
-    try:
-        tables = camelot.read_pdf(file_path, pages='all', flavor='lattice', suppress_stdout=True)
-        table_docs = []
-        for i, table in enumerate(tables):
-            # Converts the table's DataFrame into a Markdown string
-            markdown_table = tabulate(table.df, headers='keys', tablefmt='pipe')
-            normalized_table = normalize_text(markdown_table)
-            
-            # Create metadata for the table
-            metadata = {
-                "content_type": "table",
-                "page_number": table.page,
-                "table_index_on_page": i
-            }
-            
-            # Create a LangChain Document for each table
-            table_docs.append(Document(page_content=normalized_table, metadata=metadata))
+def _count_ruling_lines(page, tolerance=config.TABLE_LINE_TOLERANCE):
+    """Counts the horizontal and vertical line segments drawn on a page, including rectangle edges."""
+    horizontal = vertical = 0
+    for drawing in page.get_cdrawings():
+        for item in drawing["items"]:
+            if item[0] == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if abs(y1 - y0) <= tolerance and abs(x1 - x0) > tolerance:
+                    horizontal += 1
+                elif abs(x1 - x0) <= tolerance and abs(y1 - y0) > tolerance:
+                    vertical += 1
+            elif item[0] in ("re", "qu"):
+                points = item[1] if item[0] == "re" else [coordinate for point in item[1] for coordinate in point]
+                xs, ys = points[0::2], points[1::2]
+                width, height = max(xs) - min(xs), max(ys) - min(ys)
+                # Thin rectangles are how many generators draw rules; others contribute their edges
+                if height <= tolerance and width > tolerance:
+                    horizontal += 1
+                elif width <= tolerance and height > tolerance:
+                    vertical += 1
+                elif width > tolerance and height > tolerance:
+                    horizontal += 2
+                    vertical += 2
+    return horizontal, vertical
+
+def is_table_candidate_page(page, min_lines=config.TABLE_MIN_RULING_LINES):
+    """
+    Cheap check of whether camelot's lattice parser can find a table on a page.
+    Lattice tables are detected from ruling lines, so a page qualifies when its vector drawings
+    hold at least `min_lines` horizontal and vertical segments. Pages with a large image are
+    kept as well, since ruling lines may be part of a raster image.
+    """
+    horizontal, vertical = _count_ruling_lines(page)
+    if horizontal >= min_lines and vertical >= min_lines:
+        return True
+    page_area = abs(page.rect)
+    return any(abs(fitz.Rect(image["bbox"])) >= config.TABLE_IMAGE_AREA_RATIO * page_area for image in page.get_image_info())
+
+def find_table_candidate_pages(file_path, page_range=None):
+    """
+    Returns the zero-based numbers of the pages that may contain ruled tables and the
+    time in seconds spent checking each page, as a dict {page_number: seconds}.
+    """
+    candidates = []
+    timings = {}
+    with _pdf_lock, fitz.open(file_path) as doc:
+        for page_num in _page_numbers(doc, page_range):
+            start = time.perf_counter()
+            if is_table_candidate_page(doc[page_num]):
+                candidates.append(page_num)
+            timings[page_num] = time.perf_counter() - start
+    return candidates, timings
+
+def _read_tables(file_path, page_range=None, candidates=None, detect_timings=None):
+    """
+    Runs camelot over a page range, or only over the `candidates` pages found by the
+    table pre-detection, logging the tables found on each page.
+    """
+    if candidates is None:
+        pages = 'all'
+        if page_range is not None:
+            start, stop = page_range
+            pages = f"{start + 1}-{stop}" if stop - start > 1 else str(start + 1)
+        return camelot.read_pdf(file_path, pages=pages, flavor='lattice', suppress_stdout=True)
+
+    # One camelot call for all candidate pages: every call opens and parses the whole PDF again
+    tables = []
+    camelot_seconds = 0.0
+    if candidates:
+        start = time.perf_counter()
+        tables = list(camelot.read_pdf(file_path, pages=",".join(str(page_num + 1) for page_num in candidates), flavor='lattice', suppress_stdout=True))
+        camelot_seconds = time.perf_counter() - start
+        # Page order, as when the candidate pages were parsed one by one
+        tables.sort(key=lambda table: int(table.page))
+    tables_per_page = Counter(int(table.page) for table in tables)
+    for page_num in candidates:
+        logging.debug("Page %d: table pre-detection %.1f ms, camelot %d tables.",
+                      page_num + 1, detect_timings[page_num] * 1000, tables_per_page[page_num + 1])
+    for page_num in sorted(set(detect_timings) - set(candidates)):
+        logging.debug("Page %d: table pre-detection %.1f ms, camelot skipped.", page_num + 1, detect_timings[page_num] * 1000)
+    logging.info("Table pre-detection: %d of %d pages parsed by camelot (pre-pass %.2fs, camelot %.2fs).",
+                 len(candidates), len(detect_timings), sum(detect_timings.values()), camelot_seconds)
+    return tables
+
+def _table_documents(tables):
+    table_docs = []
+    for i, table in enumerate(tables):
+        # Converts the table's DataFrame into a Markdown string
+        markdown_table = tabulate(table.df, headers='keys', tablefmt='pipe')
+        normalized_table = normalize_text(markdown_table)
         
+        # Create metadata for the table
+        metadata = {
+            "content_type": "table",
+            "page_number": table.page,
+            "table_index_on_page": i
+        }
+        
+        # Create a LangChain Document for each table
+        table_docs.append(Document(page_content=normalized_table, metadata=metadata))
+    return table_docs
+
+def extract_tables_from_pdf(file_path, page_range=None, candidates=None, detect_timings=None):
+    """
+    Extracts tables from a PDF and converts them to Markdown format.
+    When table pre-detection is enabled, camelot only parses the pages whose vector drawings
+    contain ruling lines; the tables found are the same as when parsing every page.
+    Candidate pages already found by a pass over the document can be passed in `candidates`.
+    """
+    try:
+        if candidates is None and config.TABLE_PREDETECTION_ENABLED:
+            candidates, detect_timings = find_table_candidate_pages(file_path, page_range)
+        table_docs = _table_documents(_read_tables(file_path, page_range, candidates, detect_timings))
         logging.info(f"Extracted {len(table_docs)} tables from {file_path}")
         return table_docs
     except Exception as e:
         logging.error(f"Could not extract tables from {file_path}: {e}")
         return []
+
+def extract_pdf_pages(file_path, page_range=None, doc_metadata=None):
+    """
+    Extracts text pages, image captions and tables from a range of pages in a single walk
+    over the document: the document metadata is read from the same handle, and each page is
+    loaded once and used for the page text and the caption searches. The same walk finds the
+    table candidate pages. camelot has no API taking an open document, so it opens the file
+    itself, once, and only parses those pages.
+
+    Returns:
+        tuple: (text_pages, table_docs, image_docs), the same Documents as the
+        extract_text_from_pdf, extract_tables_from_pdf and extract_images_from_pdf functions.
+    """
+    text_pages, image_docs = [], []
+    candidates, detect_timings = [], {}
+    with _pdf_lock, fitz.open(file_path) as doc:
+        if doc_metadata is None:
+            doc_metadata = _document_metadata(doc, file_path)
+        for page_num in _page_numbers(doc, page_range):
+            page = doc[page_num]
+            if doc_metadata is not None:
+                text_pages.append(_page_text_document(page, doc_metadata))
+            image_docs.extend(_page_image_documents(page))
+
+            if config.TABLE_PREDETECTION_ENABLED:
+                start = time.perf_counter()
+                if is_table_candidate_page(page):
+                    candidates.append(page_num)
+                detect_timings[page_num] = time.perf_counter() - start
+
+    logging.info(f"Extracted {len(image_docs)} image captions from {file_path}")
+    if config.TABLE_PREDETECTION_ENABLED:
+        table_docs = extract_tables_from_pdf(file_path, page_range, candidates, detect_timings)
+    else:
+        table_docs = extract_tables_from_pdf(file_path, page_range)
+    return text_pages, table_docs, image_docs
+
+def extract_pdf_shard(file_path, page_range, doc_metadata=None):
+    """
+    Extracts text pages, tables and image captions from a range of pages of a PDF.
+    Used as the unit of work of the parallel ingestion pipeline.
+
+    Returns:
+        tuple: (text_pages, table_docs, image_docs) for the pages in `page_range`.
+    """
+    return extract_pdf_pages(file_path, page_range, doc_metadata)